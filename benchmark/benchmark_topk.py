@@ -0,0 +1,46 @@
+"""
+NAME
+    benchmark_topk
+DESCRIPTION
+    Latency of selecting the top 10 items of a recommendation with the
+    previous pandas full sort and with ranking.top_k, at 10k, 100k and
+    1M items, with and without an exclusion mask.
+"""
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from yelpify.ranking import top_k
+
+TOPN = 10
+REPEAT = 5
+
+
+def pandas_top(scores, index, topn):
+    """ The selection previously done by the recommend_* functions. """
+    scores = pd.Series(scores)
+    scores.index = index
+    scores = list(pd.Series(scores.sort_values(ascending=False).index))
+    return scores[:topn]
+
+
+def best_ms(statement):
+    return 1000 * min(timeit.repeat(statement, number=1, repeat=REPEAT))
+
+
+if __name__ == '__main__':
+    print('{:>9} {:>12} {:>12} {:>18}'.format(
+        'n_items', 'pandas (ms)', 'top_k (ms)', 'top_k masked (ms)'))
+    for n_items in [10000, 100000, 1000000]:
+        rng = np.random.RandomState(0)
+        scores = rng.randn(n_items).astype(np.float32)
+        index = pd.Index(np.arange(n_items).astype(str))
+        exclude = rng.rand(n_items) < 0.001
+        assert list(index[top_k(scores, TOPN)]) == pandas_top(
+            scores, index, TOPN)
+        print('{:>9} {:>12.2f} {:>12.2f} {:>18.2f}'.format(
+            n_items,
+            best_ms(lambda: pandas_top(scores, index, TOPN)),
+            best_ms(lambda: list(index[top_k(scores, TOPN)])),
+            best_ms(lambda: list(index[top_k(scores, TOPN, exclude)]))))
@@ -0,0 +1,65 @@
+"""
+NAME
+    synthetic
+DESCRIPTION
+    This module provides the synthetic models and interactions shared by
+        the tests.
+FUNCTIONS
+    make_engine(n_users, n_items, dim, n_clusters, seed)
+        Return a ScoringEngine of random representations.
+
+    make_interactions(n_users, n_items, seed, threshold)
+        Return random interactions of users with a low-rank taste.
+"""
+import numpy as np
+
+from yelpify.interactions import build_interactions
+from yelpify.scoring import ScoringEngine
+
+
+def make_engine(n_users=50, n_items=40, dim=4, n_clusters=None, seed=0):
+    """ Draw the representations of a model at random.
+    Args:
+        n_users: number of users.
+        n_items: number of items.
+        dim: number of components.
+        n_clusters: number of clusters the item embeddings are drawn
+            around, with small item biases, as in trained models; None for
+            independent embeddings.
+        seed: seed of the draws.
+    Returns:
+        The ScoringEngine.
+    """
+    rng = np.random.RandomState(seed)
+    user_biases = rng.randn(n_users)
+    user_embeddings = rng.randn(n_users, dim)
+    item_biases = rng.randn(n_items)
+    if n_clusters:
+        centers = rng.randn(n_clusters, dim)
+        item_embeddings = centers[rng.randint(n_clusters, size=n_items)] \
+            + 0.3 * rng.randn(n_items, dim)
+        item_biases *= 0.1
+    else:
+        item_embeddings = rng.randn(n_items, dim)
+    return ScoringEngine(user_biases, user_embeddings, item_biases,
+                         item_embeddings)
+
+
+def make_interactions(n_users=100, n_items=80, seed=0, threshold=1.5):
+    """ Draw interactions from a rank 3 taste of users for items.
+    Args:
+        n_users: number of users.
+        n_items: number of items.
+        seed: seed of the draws.
+        threshold: taste above which users interact with items; below it
+            when negative, for the items users dislike.
+    Returns:
+        interactions, weights as returned by
+        interactions.build_interactions, with ratings from 1 to 5.
+    """
+    rng = np.random.RandomState(seed)
+    taste = rng.randn(n_users, 3) @ rng.randn(3, n_items)
+    users, items = np.nonzero(taste > threshold if threshold > 0
+                              else taste < threshold)
+    return build_interactions(users, items, rng.randint(1, 6, len(users)),
+                              shape=(n_users, n_items))
@@ -0,0 +1,104 @@
+"""
+NAME
+    test_ann
+DESCRIPTION
+    This module test the approximate maximum inner product index.
+FUNCTIONS
+    test_exhaustive(self)
+        make sure probing every list gives the brute force result
+
+    test_recall(self)
+        make sure a few probes keep a high recall
+
+    test_exclude(self)
+        make sure excluded items are never returned
+
+    test_recommend(self)
+        make sure recommend_known_user can search the index
+"""
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from codebase.tests.synthetic import make_engine
+from yelpify.ann import IVFIndex, recall_report
+from yelpify.id_encoding import IdEncoder
+from yelpify.interactions import InteractionStore
+from yelpify.ranking import batch_top_k
+from yelpify.recommend_known import recommend_known_user
+
+
+class TestANN(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = make_engine(200, 2000, 16, n_clusters=20)
+        self.index = IVFIndex(n_lists=40, n_probe=8).fit(
+            *self.engine.get_item_representations())
+
+    def test_exhaustive(self):
+        """
+        Testing that searching every list is exact
+        """
+        engine = self.engine
+        expected, expected_scores = batch_top_k(
+            engine.user_biases, engine.user_embeddings, engine.item_biases,
+            engine.item_embeddings, 10)
+        found, scores = self.index.search_batch(
+            engine.user_biases, engine.user_embeddings, 10, n_probe=40)
+        np.testing.assert_array_equal(found, expected)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+    def test_recall(self):
+        """
+        Testing the recall of the default number of probes
+        """
+        report = recall_report(self.index, self.engine, k=10, n_queries=100,
+                               n_probes=[1, 8])
+        self.assertEqual([r['n_probe'] for r in report], [1, 8])
+        self.assertGreater(report[1]['recall'], 0.8)
+        self.assertGreaterEqual(report[1]['recall'], report[0]['recall'])
+
+    def test_exclude(self):
+        """
+        Testing that exclusion is applied to the candidates
+        """
+        engine = self.engine
+        scores = engine.user_scores(0)
+        exclude = scores > np.sort(scores)[-50]
+        found, _ = self.index.search(engine.user_biases[0],
+                                     engine.user_embeddings[0], 10, exclude)
+        self.assertEqual(len(found), 10)
+        self.assertFalse(exclude[found].any())
+        exclude = np.ones(len(scores), dtype=bool)
+        exclude[[3, 7]] = False
+        found, _ = self.index.search(engine.user_biases[0],
+                                     engine.user_embeddings[0], 10, exclude,
+                                     n_probe=1)
+        self.assertEqual(sorted(found), [3, 7])
+
+    def test_recommend(self):
+        """
+        Testing recommendations through the index
+        """
+        engine = self.engine
+        users = IdEncoder(['u%d' % i for i in range(engine.n_users)])
+        items = IdEncoder(['b%d' % i for i in range(engine.n_items)])
+        weights = sparse.random(engine.n_users, engine.n_items,
+                                density=0.01, random_state=0) * 5
+        store = InteractionStore(weights, users, items)
+        item_dict = dict(zip(items, items))
+        index = IVFIndex(n_lists=40, n_probe=40).fit(
+            *engine.get_item_representations())
+        for user_id in list(users)[:5]:
+            self.assertEqual(
+                recommend_known_user(engine, store, user_id, users,
+                                     item_dict, 10, new_only=True,
+                                     threshold=0, show=False, index=index),
+                recommend_known_user(engine, store, user_id, users,
+                                     item_dict, 10, new_only=True,
+                                     threshold=0, show=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
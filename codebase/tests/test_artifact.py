@@ -0,0 +1,118 @@
+"""
+NAME
+    test_artifact
+DESCRIPTION
+    This module test saving and loading trained models.
+FUNCTIONS
+    test_round_trip(self)
+        make sure a loaded model recommends as the trained one
+
+    test_hybrid(self)
+        make sure the feature store is saved with a hybrid model
+
+    test_versions(self)
+        make sure every save writes a new version
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+import codebase
+from yelpify.artifact import save_artifact, load_artifact, list_versions
+from yelpify.data_preparation import prepare_data, prepare_data_features
+from yelpify import model_cf, model_hybrid
+from yelpify.recommend_known import recommend_known_user
+from yelpify.recommend_hybrid import recommend_hybrid_user
+
+data_path = os.path.join(codebase.__path__[0], 'data')
+
+
+class TestArtifact(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = prepare_data(data_dir=data_path, cache=False)
+        cls.trained = model_cf.train_model(cls.df, evaluate=False)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'model')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        """
+        Testing that the loaded artifact gives the same recommendations
+        """
+        model, interactions, user_dict, item_dict = self.trained
+        save_artifact(self.path, model, interactions, user_dict, item_dict)
+        artifact = load_artifact(self.path)
+        self.assertIsInstance(artifact.arrays['item_embeddings'], np.memmap)
+        self.assertIsNone(artifact.feature_store)
+        self.assertEqual((artifact.interactions.csr
+                          != interactions.csr).nnz, 0)
+        self.assertEqual((artifact.interactions.csc
+                          != interactions.csc).nnz, 0)
+        user_id = self.df['user_id'].iloc[0]
+        self.assertEqual(
+            recommend_known_user(
+                artifact.model, artifact.interactions, user_id,
+                artifact.user_dict, artifact.item_dict, 5, new_only=True,
+                show=False),
+            recommend_known_user(
+                model, interactions, user_id, user_dict, item_dict, 5,
+                new_only=True, show=False))
+        item_id = interactions.columns[0]
+        self.assertEqual(artifact.item_dict[item_id], item_dict[item_id])
+
+    def test_hybrid(self):
+        """
+        Testing that a hybrid model is saved with its features
+        """
+        df, category_matrix, names = prepare_data_features(
+            data_dir=data_path, cache=False, sparse_categories=True)
+        model, interactions, user_dict, item_dict, _, _, store = \
+            model_hybrid.train_model(df, evaluate=False,
+                                     category_matrix=category_matrix,
+                                     category_names=names)
+        save_artifact(self.path, model, interactions, user_dict, item_dict,
+                      store)
+        artifact = load_artifact(self.path, mmap_mode=None)
+        self.assertEqual(artifact.feature_store.item_feature_names,
+                         store.item_feature_names)
+        user_id = df['user_id'].iloc[0]
+        self.assertEqual(
+            recommend_hybrid_user(
+                artifact.feature_store, artifact.model,
+                artifact.interactions, user_id, artifact.user_dict,
+                artifact.item_dict, 5, show=False),
+            recommend_hybrid_user(
+                store, model, interactions, user_id, user_dict, item_dict, 5,
+                show=False))
+
+    def test_versions(self):
+        """
+        Testing that versions are numbered and the latest is loaded
+        """
+        model, interactions, user_dict, item_dict = self.trained
+        first = save_artifact(self.path, model, interactions, user_dict,
+                              item_dict)
+        save_artifact(self.path, model, interactions, user_dict, item_dict)
+        self.assertEqual(list_versions(self.path), ['v1', 'v2'])
+        self.assertEqual(load_artifact(self.path).version, 'v2')
+        self.assertEqual(load_artifact(self.path, 'v1').version, 'v1')
+        self.assertEqual(load_artifact(first).version, 'v1')
+        # the engines and models of versions are told apart by caches
+        self.assertEqual(load_artifact(first).engine.version,
+                         os.path.abspath(first))
+        self.assertNotEqual(load_artifact(self.path).model.version,
+                            load_artifact(first).model.version)
+        with self.assertRaises(FileNotFoundError):
+            load_artifact(self.path, 'v3')
+
+
+if __name__ == "__main__":
+    unittest.main()
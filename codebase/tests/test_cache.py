@@ -0,0 +1,145 @@
+"""
+NAME
+    test_cache
+DESCRIPTION
+    This module test the on-disk dataset cache.
+FUNCTIONS
+    test_warm_start(self)
+        make sure a cached local file is parsed only once
+
+    test_invalidation(self)
+        make sure a modified file is parsed again
+
+    test_offline(self)
+        make sure the latest entry is used without fingerprint
+
+    test_eviction(self)
+        make sure the cache stays under its size bound
+
+    test_fetch_file(self)
+        make sure a written entry is kept and written only once
+
+    test_large_entry(self)
+        make sure an entry over the size bound is kept
+
+    test_concurrent_index(self)
+        make sure concurrent writers keep every index entry
+"""
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from yelpify.cache import DatasetCache
+from yelpify.data_preparation import get_input
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = DatasetCache(os.path.join(self.tmp.name, 'cache'))
+        self.csv = os.path.join(self.tmp.name, 'review.csv')
+        pd.DataFrame({'user_id': ['a', 'b'], 'stars': [1.0, 4.0]}).to_csv(
+            self.csv, index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_warm_start(self):
+        """
+        Testing that a second read is served from the cache
+        """
+        cold = get_input(self.csv, self.cache)
+        calls = []
+        key = self.cache.key(self.csv, self.cache.fingerprint(self.csv))
+        warm = self.cache.fetch(self.csv, lambda: calls.append(1),
+                                self.cache.fingerprint(self.csv))
+        self.assertEqual(calls, [])
+        self.assertTrue(os.path.exists(self.cache.path(key)))
+        pd.testing.assert_frame_equal(cold, warm)
+
+    def test_invalidation(self):
+        """
+        Testing that a modified file changes the cache key
+        """
+        get_input(self.csv, self.cache)
+        before = self.cache.fingerprint(self.csv)
+        pd.DataFrame({'user_id': ['c'], 'stars': [2.0]}).to_csv(
+            self.csv, index=False)
+        os.utime(self.csv, ns=(1, 1))
+        self.assertNotEqual(before, self.cache.fingerprint(self.csv))
+        df = get_input(self.csv, self.cache)
+        self.assertEqual(list(df['user_id']), ['c'])
+
+    def test_offline(self):
+        """
+        Testing that an unknown fingerprint falls back to the latest entry
+        """
+        url = 'https://example.invalid/small_sample.parquet?dl=1'
+        df = pd.DataFrame({'user_id': ['a'], 'stars': [5.0]})
+        self.cache.seed(url, df, fingerprint='etag')
+        self.assertIsNone(self.cache.fingerprint(url, timeout=1))
+        pd.testing.assert_frame_equal(get_input(url, self.cache), df)
+
+    def test_eviction(self):
+        """
+        Testing that the least recently used entries are evicted
+        """
+        df = pd.DataFrame({'x': range(1000)})
+        self.cache.seed('first', df)
+        os.utime(self.cache.path(self.cache.latest('first')), (0, 0))
+        self.cache.max_bytes = self.cache.size() + 1
+        self.cache.seed('second', df)
+        self.assertIsNone(self.cache.latest('first'))
+        self.assertIsNotNone(self.cache.latest('second'))
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes)
+
+    def test_fetch_file(self):
+        """
+        Testing that an entry written in place survives its own eviction
+        """
+        df = pd.DataFrame({'x': range(1000)})
+        calls = []
+
+        def write(path):
+            calls.append(path)
+            df.to_parquet(path)
+
+        self.cache.max_bytes = 1
+        path = self.cache.fetch_file('joined', write, fingerprint='v1')
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.cache.fetch_file('joined', write, 'v1'), path)
+        self.assertEqual(self.cache.fetch_file('joined', write), path)
+        self.assertEqual(len(calls), 1)
+        pd.testing.assert_frame_equal(pd.read_parquet(path), df)
+
+    def test_large_entry(self):
+        """
+        Testing that storing evicts the other entries, not the new one
+        """
+        df = pd.DataFrame({'x': range(1000)})
+        self.cache.seed('old', df)
+        self.cache.max_bytes = 1
+        self.cache.seed('large', df)
+        self.assertIsNone(self.cache.latest('old'))
+        pd.testing.assert_frame_equal(
+            self.cache.load(self.cache.latest('large')), df)
+
+    def test_concurrent_index(self):
+        """
+        Testing that the index keeps the entries of concurrent writers
+        """
+        df = pd.DataFrame({'x': [1]})
+        sources = ['source %d' % i for i in range(32)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda source: self.cache.seed(source, df),
+                          sources))
+        for source in sources:
+            self.assertIsNotNone(self.cache.latest(source))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+NAME
+    test_evaluation
+DESCRIPTION
+    This module test the ranking metrics of trained models.
+FUNCTIONS
+    test_lightfm_metrics(self)
+        make sure the metrics are those of lightfm.evaluation
+
+    test_ranking_metrics(self)
+        check the NDCG, AP and AUC of a known ranking, without the
+        positives of train
+
+    test_user_sample(self)
+        check the uniform and stratified user samples
+
+    test_evaluate(self)
+        check the confidence intervals of the summary
+"""
+import unittest
+
+import numpy as np
+from lightfm import LightFM
+from lightfm.evaluation import auc_score, precision_at_k, recall_at_k
+from scipy import sparse
+
+from codebase.tests.synthetic import make_interactions
+from yelpify.evaluation import METRICS, user_sample, user_metrics, \
+    summarize, evaluate
+from yelpify.scoring import ScoringEngine
+from yelpify.training import split_interactions
+
+
+def make_split(seed=0):
+    interactions, weights = make_interactions(120, 90, seed)
+    return split_interactions(interactions, weights, 0.3, random_state=seed)
+
+
+class TestEvaluation(unittest.TestCase):
+
+    def test_lightfm_metrics(self):
+        """
+        Testing the AUC, precision and recall against lightfm
+        """
+        train, weights, test = make_split()
+        item_features = sparse.hstack(
+            [sparse.identity(90), sparse.random(90, 5, density=0.3,
+                                                random_state=0)]).tocsr()
+        for features in [None, item_features]:
+            model = LightFM(no_components=8, loss='warp', random_state=0)
+            model.fit(train, item_features=features, sample_weight=weights,
+                      epochs=5)
+            metrics = user_metrics(model, test, train, k=5, block_size=17,
+                                   item_features=features, n_jobs=3)
+            kwargs = dict(train_interactions=train, item_features=features)
+            np.testing.assert_allclose(
+                metrics['auc'], auc_score(model, test, **kwargs), atol=1e-5)
+            np.testing.assert_allclose(
+                metrics['precision'],
+                precision_at_k(model, test, k=5, **kwargs), atol=1e-6)
+            np.testing.assert_allclose(
+                metrics['recall'], recall_at_k(model, test, k=5, **kwargs),
+                atol=1e-6)
+        self.assertEqual(list(metrics.columns), list(METRICS))
+        np.testing.assert_array_equal(
+            metrics.index, np.flatnonzero(test.tocsr().getnnz(axis=1)))
+
+    def test_ranking_metrics(self):
+        """
+        Testing the metrics of a user whose ranking is known
+        """
+        # items are ranked 3, 1, 0, 4, 2; item 1 is seen, 0 and 2 relevant
+        engine = ScoringEngine(np.zeros(1), np.ones((1, 1)), np.zeros(5),
+                               [[3.], [4.], [1.], [5.], [2.]])
+        test = sparse.csr_matrix(([1., 1.], ([0, 0], [0, 2])), shape=(1, 5))
+        train = sparse.csr_matrix(([1.], ([0], [1])), shape=(1, 5))
+        metrics = user_metrics(engine, test, train, k=2).iloc[0]
+        # the ranking without the seen item is 3, 0, 4, 2
+        self.assertAlmostEqual(metrics['precision'], 0.5)
+        self.assertAlmostEqual(metrics['recall'], 0.5)
+        self.assertAlmostEqual(metrics['ndcg'],
+                               (1 / np.log2(3)) / (1 + 1 / np.log2(3)))
+        self.assertAlmostEqual(metrics['map'], (1 / 2 + 2 / 4) / 2)
+        self.assertAlmostEqual(metrics['auc'], 0.25)
+        # a positive also in train is dropped, not counted as missed
+        overlapping = test + train
+        np.testing.assert_allclose(
+            user_metrics(engine, overlapping, train, k=2).iloc[0], metrics)
+        self.assertTrue(user_metrics(engine, train, train).empty)
+
+    def test_user_sample(self):
+        """
+        Testing the size and strata of user samples
+        """
+        _, _, test = make_split()
+        users = np.flatnonzero(test.tocsr().getnnz(axis=1))
+        np.testing.assert_array_equal(user_sample(test), users)
+        sample = user_sample(test, 30, random_state=0)
+        self.assertEqual(len(sample), 30)
+        self.assertTrue(np.isin(sample, users).all())
+        strata = np.zeros(test.shape[0], dtype=int)
+        strata[users[:3]] = 1
+        sample = user_sample(test, 30, strata, random_state=0)
+        self.assertTrue(np.isin(users[:3], sample).any())
+        self.assertTrue(np.isin(sample, users).all())
+        self.assertAlmostEqual(len(sample), 30, delta=1)
+
+    def test_evaluate(self):
+        """
+        Testing the summary of every metric
+        """
+        train, weights, test = make_split()
+        model = LightFM(no_components=8, loss='warp', random_state=0)
+        model.fit(train, sample_weight=weights, epochs=5)
+        summary = evaluate(model, test, train, n_users=40, random_state=0)
+        self.assertEqual(list(summary.index), list(METRICS))
+        self.assertTrue((summary['n_users'] == 40).all())
+        self.assertTrue((summary['low'] <= summary['mean']).all())
+        self.assertTrue((summary['mean'] <= summary['high']).all())
+        metrics = user_metrics(model, test, train)
+        wider = summarize(metrics, confidence=0.99)
+        np.testing.assert_allclose(wider['mean'], metrics.mean())
+        self.assertTrue((wider['high'] - wider['low']
+                         > summarize(metrics)['high']
+                         - summarize(metrics)['low']).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
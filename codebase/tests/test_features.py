@@ -0,0 +1,214 @@
+"""
+NAME
+    test_features
+DESCRIPTION
+    This module test the feature store of the hybrid model.
+FUNCTIONS
+    test_train_model(self)
+        make sure the store holds the matrices the model was trained with
+
+    test_new_features(self)
+        make sure new feature values are placed after the identity block
+
+    test_recommend(self)
+        compare recommendations from the store with model predictions
+
+    test_recommend_dataframe(self)
+        make sure a dataframe ranks as its FeatureStore, and is refused by
+        the batch functions
+
+    test_build_features(self)
+        compare the vectorized feature matrices with lightfm Dataset
+
+    test_category_encoder(self)
+        make sure rare categories are dropped or hashed
+
+    test_sparse_categories(self)
+        compare the sparse category matrix with the category columns
+"""
+import os
+import unittest
+
+import numpy as np
+from lightfm.data import Dataset
+
+import codebase
+from yelpify.data_preparation import prepare_data_features
+from yelpify.features import build_user_features, build_item_features, \
+    CategoryEncoder
+from yelpify.id_encoding import IdEncoder
+from yelpify.model_hybrid import train_model
+from yelpify.recommend_hybrid import recommend_hybrid_user, \
+    recommend_hybrid_item, recommend_hybrid_new_user, \
+    recommend_hybrid_users_batch
+
+data_path = os.path.join(codebase.__path__[0], 'data')
+
+
+class TestFeatures(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = prepare_data_features(data_dir=data_path, cache=False)
+        (cls.model, cls.interactions, cls.user_dict, cls.item_dict, _, _,
+         cls.store) = train_model(cls.df, evaluate=False)
+
+    def test_train_model(self):
+        """
+        Testing that rows are the interaction rows and the identity block
+        comes first
+        """
+        n_users, n_items = self.interactions.shape
+        self.assertEqual(self.store.user_features.shape,
+                         (n_users, n_users + 1))
+        self.assertEqual(self.store.item_features.shape[0], n_items)
+        user_id = self.df['user_id'].iloc[0]
+        row = self.store.user_features[self.store.user_row(user_id)]
+        self.assertEqual(row[0, self.interactions.users[user_id]], 1)
+        self.assertAlmostEqual(
+            row[0, n_users], self.df['average_stars'].iloc[0], places=5)
+        self.assertEqual(self.store.item_feature_map[
+            self.store.item_feature_names[0]], n_items)
+
+    def test_new_features(self):
+        """
+        Testing the feature matrices of unknown users and items
+        """
+        n_users = len(self.store.users)
+        features = self.store.new_user_features(np.array([[3.5], [0.0]]))
+        self.assertEqual(features.shape, (2, n_users + 1))
+        self.assertEqual(features[0, n_users], 3.5)
+        self.assertEqual(features.nnz, 1)
+        with self.assertRaises(ValueError):
+            self.store.new_user_features(np.ones((1, 2)))
+
+    def test_recommend(self):
+        """
+        Testing recommendations from the store against predict
+        """
+        _, n_items = self.interactions.shape
+        user_id = self.df['user_id'].iloc[0]
+        scores = self.model.predict(
+            self.interactions.users[user_id], np.arange(n_items),
+            user_features=self.store.user_features,
+            item_features=self.store.item_features)
+        items = recommend_hybrid_user(
+            self.store, self.model, self.interactions, user_id,
+            self.user_dict, self.item_dict, 5, new_only=False, show=False)
+        self.assertEqual(
+            items, list(self.interactions.columns[np.argsort(-scores)[:5]]))
+        item_xs, _ = recommend_hybrid_users_batch(
+            self.store, self.model, self.interactions, [user_id], 5,
+            new_only=False)
+        self.assertEqual(list(self.interactions.columns[item_xs[0]]), items)
+        users = recommend_hybrid_item(
+            self.store, self.model, self.interactions,
+            self.df['business_id'].iloc[0], self.user_dict, self.item_dict,
+            5, show=False)
+        self.assertEqual(len(users), 5)
+        new = recommend_hybrid_new_user(
+            self.store, self.model, self.interactions, np.array([[4.0]]),
+            self.user_dict, self.item_dict, 5, show=False)
+        self.assertEqual(len(new), 5)
+
+    def test_recommend_dataframe(self):
+        """
+        Testing that the review dataframe gives the store recommendations
+        """
+        for user_id in self.df['user_id'].iloc[[0, 50]]:
+            self.assertEqual(
+                recommend_hybrid_user(
+                    self.df, self.model, self.interactions, user_id,
+                    self.user_dict, self.item_dict, 5, show=False),
+                recommend_hybrid_user(
+                    self.store, self.model, self.interactions, user_id,
+                    self.user_dict, self.item_dict, 5, show=False))
+        item_id = self.df['business_id'].iloc[0]
+        self.assertEqual(
+            recommend_hybrid_item(
+                self.df, self.model, self.interactions, item_id,
+                self.user_dict, self.item_dict, 5, show=False),
+            recommend_hybrid_item(
+                self.store, self.model, self.interactions, item_id,
+                self.user_dict, self.item_dict, 5, show=False))
+        # the batch functions only score the features of a store
+        with self.assertRaises(TypeError):
+            recommend_hybrid_users_batch(self.df, self.model,
+                                         self.interactions, [user_id], 5)
+
+    def test_build_features(self):
+        """
+        Testing that the feature matrices match lightfm Dataset
+        """
+        df = self.df
+        categories = list(df.columns[10:])
+        users = IdEncoder.fit(df['user_id'])
+        items = IdEncoder.fit(df['business_id'])
+        ds = Dataset()
+        ds.fit(users.ids, items.ids, user_features=['average_stars'],
+               item_features=categories)
+        first_users = df.drop_duplicates('user_id')
+        expected = ds.build_user_features(
+            zip(first_users['user_id'],
+                [{'average_stars': float(x)}
+                 for x in first_users['average_stars']]),
+            normalize=False)
+        actual = build_user_features(df, users)
+        self.assertEqual((actual != expected).nnz, 0)
+        first_items = df.drop_duplicates('business_id')
+        expected = ds.build_item_features(
+            zip(first_items['business_id'],
+                [dict(zip(categories, map(float, row)))
+                 for row in first_items[categories].values]),
+            normalize=False)
+        actual = build_item_features(df, items, categories)
+        self.assertEqual(actual.shape, expected.shape)
+        self.assertEqual((actual != expected).nnz, 0)
+
+    def test_category_encoder(self):
+        """
+        Testing the frequency cutoff and the hashing of rare categories
+        """
+        categories = ['Bars, Food', 'Food', None, 'Spas, Food, Food']
+        encoder = CategoryEncoder(min_frequency=0.3)
+        matrix = encoder.fit_transform(categories, weights=[1, 1, 1, 1])
+        self.assertEqual(encoder.feature_names, ['Food'])
+        np.testing.assert_array_equal(matrix.toarray().ravel(), [1, 1, 0, 1])
+        encoder = CategoryEncoder(min_frequency=0.3, n_buckets=1)
+        matrix = encoder.fit_transform(categories, weights=[3, 1, 1, 1])
+        self.assertEqual(encoder.feature_names,
+                         ['Bars', 'Food', 'category_hash_0'])
+        np.testing.assert_array_equal(
+            matrix.toarray(), [[1, 1, 0], [0, 1, 0], [0, 0, 0], [0, 1, 1]])
+
+    def test_sparse_categories(self):
+        """
+        Testing that the sparse categories give the same model features
+        """
+        df, category_matrix, names = prepare_data_features(
+            data_dir=data_path, cache=False, sparse_categories=True)
+        self.assertEqual(names, list(self.df.columns[10:]))
+        codes = df['business_id'].cat.codes.values
+        np.testing.assert_array_equal(
+            category_matrix[codes].toarray(), self.df[names].values)
+        store = train_model(df, evaluate=False,
+                            category_matrix=category_matrix,
+                            category_names=names)[6]
+        self.assertEqual(
+            (store.item_features != self.store.item_features).nnz, 0)
+        self.assertEqual(store.item_feature_names,
+                         self.store.item_feature_names)
+        # the rows of a filtered dataframe are those of its businesses
+        kept = (df['stars'] >= 4).values
+        store = train_model(df[kept], evaluate=False,
+                            category_matrix=category_matrix,
+                            category_names=names)[6]
+        expected = train_model(self.df[kept], evaluate=False)[6]
+        self.assertEqual(store.item_features.shape,
+                         expected.item_features.shape)
+        self.assertEqual(
+            (store.item_features != expected.item_features).nnz, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
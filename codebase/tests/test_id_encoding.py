@@ -0,0 +1,108 @@
+"""
+NAME
+    test_id_encoding
+DESCRIPTION
+    This module test the dictionary encoding of ids.
+FUNCTIONS
+    test_encoder(self)
+        encode and decode ids
+
+    test_dataset_order(self)
+        make sure codes match the lightfm interaction indexes
+
+    test_train_model(self)
+        make sure training returns id encoded mappings
+
+    test_filtered(self)
+        make sure a filtered dataframe has no phantom users or items
+"""
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+from lightfm.data import Dataset
+
+import codebase
+from yelpify.data_preparation import prepare_data
+from yelpify.id_encoding import IdEncoder, LabelMap, categorize_ids
+from yelpify.model_cf import train_model
+from yelpify.recommend_known import recommend_known_user
+
+data_path = os.path.join(codebase.__path__[0], 'data')
+
+
+class TestIdEncoding(unittest.TestCase):
+
+    def test_encoder(self):
+        """
+        Testing encoding, decoding and extension of ids
+        """
+        encoder = IdEncoder.fit(['b', 'a', 'b', 'c'])
+        self.assertEqual(list(encoder.ids), ['b', 'a', 'c'])
+        codes = encoder.encode(['c', 'b', 'x'])
+        self.assertEqual(codes.dtype, np.int32)
+        self.assertEqual(list(codes), [2, 0, -1])
+        codes = encoder.encode(['c', 'x', 'y', 'x'], extend=True)
+        self.assertEqual(list(codes), [2, 3, 4, 3])
+        self.assertEqual(list(encoder.decode(codes)), ['c', 'x', 'y', 'x'])
+        self.assertEqual(encoder['y'], 4)
+        self.assertNotIn('z', encoder)
+        names = LabelMap.from_codes(encoder, [0, 1], ['Bee', 'Ant'])
+        self.assertEqual(names['a'], 'Ant')
+
+    def test_dataset_order(self):
+        """
+        Testing that codes are the lightfm interaction indexes
+        """
+        df = categorize_ids(pd.DataFrame({
+            'user_id': ['u2', 'u1', 'u2', 'u3'],
+            'business_id': ['b1', 'b1', 'b2', 'b3']}))
+        encoder, codes = IdEncoder.from_series(df['user_id'])
+        ds = Dataset()
+        ds.fit(df['user_id'].unique(), df['business_id'].unique())
+        user_id_map = ds.mapping()[0]
+        self.assertEqual(dict(encoder), user_id_map)
+        self.assertEqual(
+            list(codes), [user_id_map[u] for u in df['user_id']])
+
+    def test_train_model(self):
+        """
+        Testing that training uses the encoders as mappings
+        """
+        df = prepare_data(data_dir=data_path, cache=False)
+        self.assertEqual(str(df['user_id'].dtype), 'category')
+        _, df_interactions, user_dict, item_dict = train_model(
+            df, evaluate=False)
+        self.assertEqual(list(df_interactions.index), list(user_dict))
+        row = df.iloc[0]
+        self.assertEqual(item_dict[row['business_id']], row['name_business'])
+        self.assertGreater(df_interactions.csr[
+            user_dict[row['user_id']],
+            df_interactions.columns.get_loc(row['business_id'])], 0)
+
+    def test_filtered(self):
+        """
+        Testing that the categories of filtered out rows are dropped
+        """
+        df = categorize_ids(pd.DataFrame({
+            'user_id': ['u1', 'u2', 'u3'], 'business_id': ['b1', 'b2', 'b1']}))
+        encoder, codes = IdEncoder.from_series(df['user_id'].iloc[[2, 0]])
+        self.assertEqual(list(encoder), ['u1', 'u3'])
+        self.assertEqual(list(codes), [1, 0])
+        df = prepare_data(data_dir=data_path, cache=False)
+        df = df[df['stars'] >= 4]
+        model, df_interactions, user_dict, item_dict = train_model(
+            df, evaluate=False)
+        self.assertEqual(df_interactions.shape,
+                         (df['user_id'].nunique(),
+                          df['business_id'].nunique()))
+        self.assertTrue(all(item_dict[i] is not None
+                            for i in df_interactions.columns))
+        self.assertEqual(len(recommend_known_user(
+            model, df_interactions, df['user_id'].iloc[0], user_dict,
+            item_dict, 5, show=True)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+"""
+NAME
+    test_incremental
+DESCRIPTION
+    This module test the incremental updates of trained models.
+FUNCTIONS
+    test_grow_model(self)
+        make sure known parameters are kept when a model grows
+
+    test_update_cf(self)
+        update a collaborative model with new reviews
+
+    test_update_hybrid(self)
+        update a hybrid model with new reviews
+
+    test_aligned_rows(self)
+        check the rows of shared ids and features
+
+    test_warm_start(self)
+        make sure a retraining starts from the previous parameters
+"""
+import os
+import unittest
+
+import numpy as np
+from lightfm import LightFM
+from scipy import sparse
+
+import codebase
+from yelpify import model_cf, model_hybrid
+from yelpify.data_preparation import prepare_data, prepare_data_features
+from yelpify.id_encoding import IdEncoder
+from yelpify.incremental import grow_model, aligned_rows
+from yelpify.recommend_hybrid import recommend_hybrid_user
+from yelpify.recommend_known import recommend_known_user
+
+data_path = os.path.join(codebase.__path__[0], 'data')
+
+
+def split_reviews(df, fraction=0.8):
+    """ Split reviews into the history and the new reviews. """
+    n = int(len(df) * fraction)
+    base, delta = df.iloc[:n].copy(), df.iloc[n:].copy()
+    for col in ['user_id', 'business_id']:
+        base[col] = base[col].cat.remove_unused_categories()
+    return base, delta
+
+
+class TestIncremental(unittest.TestCase):
+
+    def test_grow_model(self):
+        """
+        Testing that new parameters are inserted around the known ones
+        """
+        model = LightFM(no_components=4, learning_schedule='adagrad')
+        model.fit(sparse.random(5, 6, density=0.5, random_state=0).tocoo(),
+                  epochs=1)
+        user_embeddings = model.user_embeddings.copy()
+        item_biases = model.item_biases.copy()
+        grow_model(model, n_new_users=2, n_new_items=3, item_offset=4)
+        self.assertEqual(model.user_embeddings.shape, (7, 4))
+        self.assertEqual(model.item_embedding_momentum.shape, (9, 4))
+        np.testing.assert_array_equal(model.user_embeddings[:5],
+                                      user_embeddings)
+        np.testing.assert_array_equal(model.item_biases[:4], item_biases[:4])
+        np.testing.assert_array_equal(model.item_biases[7:], item_biases[4:])
+        np.testing.assert_array_equal(model.item_biases[4:7], 0)
+        np.testing.assert_array_equal(model.user_bias_gradients[5:], 1)
+
+    def test_update_cf(self):
+        """
+        Testing that new users and items are added and trained on
+        """
+        df = prepare_data(data_dir=data_path, cache=False)
+        base, delta = split_reviews(df)
+        model, interactions, _, item_dict = model_cf.train_model(
+            base, evaluate=False)
+        old_embeddings = model.user_embeddings.copy()
+        model, updated, user_dict, item_dict = model_cf.update_model(
+            model, interactions, item_dict, delta, replay=0)
+        self.assertEqual(updated.shape, (df['user_id'].nunique(),
+                                         df['business_id'].nunique()))
+        self.assertEqual(model.user_embeddings.shape[0], updated.shape[0])
+        self.assertEqual(model.item_embeddings.shape[0], updated.shape[1])
+        expected = df.groupby(['user_id', 'business_id'],
+                              observed=True)['stars'].sum()
+        weights = updated.csr[
+            updated.users.lookup(expected.index.get_level_values(0)),
+            updated.items.lookup(expected.index.get_level_values(1))]
+        np.testing.assert_allclose(np.asarray(weights).ravel(),
+                                   expected.values)
+        # only the users of the new reviews were trained on
+        untouched = ~np.isin(interactions.users.ids,
+                             np.asarray(delta['user_id']))
+        np.testing.assert_array_equal(model.user_embeddings[:len(untouched)][
+            untouched], old_embeddings[untouched])
+        for item_id in delta['business_id'].unique():
+            self.assertEqual(
+                item_dict[item_id],
+                delta.loc[delta['business_id'] == item_id,
+                          'name_business'].iloc[-1])
+        new_user = updated.users.ids[-1]
+        self.assertEqual(len(recommend_known_user(
+            model, updated, new_user, user_dict, item_dict, 5,
+            show=False)), 5)
+        model_cf.update_model(model, updated, item_dict, delta, replay=50,
+                              random_state=0)
+
+    def test_update_hybrid(self):
+        """
+        Testing that features of new users and items are added
+        """
+        df = prepare_data_features(data_dir=data_path, cache=False)
+        base, delta = split_reviews(df)
+        model, interactions, _, item_dict, _, _, store = \
+            model_hybrid.train_model(base, evaluate=False)
+        model, updated, user_dict, item_dict, user_feature_map, _, store = \
+            model_hybrid.update_model(model, interactions, item_dict, store,
+                                      delta, replay=20, random_state=0)
+        n_all_users, n_all_items = updated.shape
+        self.assertEqual(store.user_features.shape,
+                         (n_all_users, n_all_users + 1))
+        self.assertEqual(store.item_features.shape[1],
+                         n_all_items + len(df.columns[10:]))
+        self.assertEqual(len(model.user_embeddings), n_all_users + 1)
+        self.assertEqual(len(model.item_embeddings),
+                         store.item_features.shape[1])
+        self.assertEqual(user_feature_map['average_stars'], n_all_users)
+        new_user = updated.users.ids[-1]
+        first = delta[delta['user_id'] == new_user].iloc[0]
+        self.assertEqual(
+            store.user_features[store.user_row(new_user), n_all_users],
+            np.float32(first['average_stars']))
+        new_item = updated.items.ids[-1]
+        row = store.item_features[store.item_row(new_item)].toarray()[0]
+        first = delta[delta['business_id'] == new_item].iloc[0]
+        np.testing.assert_array_equal(row[n_all_items:],
+                                      first[df.columns[10:]].values)
+        self.assertEqual(len(recommend_hybrid_user(
+            store, model, updated, new_user, user_dict, item_dict, 5,
+            show=False)), 5)
+
+    def test_aligned_rows(self):
+        """
+        Testing the alignment of identity and named features
+        """
+        rows = aligned_rows(IdEncoder(['a', 'b', 'c']), ['x', 'y'],
+                            IdEncoder(['c', 'd', 'a']), ['y', 'z'])
+        np.testing.assert_array_equal(rows, [2, -1, 0, 4, -1])
+        rows = aligned_rows(IdEncoder(['a']), (), IdEncoder(['b', 'a']), ())
+        np.testing.assert_array_equal(rows, [-1, 0])
+
+    def test_warm_start(self):
+        """
+        Testing that shared parameters are copied and new ones are random
+        """
+        df = prepare_data(data_dir=data_path, cache=False)
+        base, _ = split_reviews(df)
+        previous = model_cf.train_model(base, evaluate=False, epochs=2)
+        model, interactions, _, _ = model_cf.train_model(
+            df, evaluate=False, warm_start=previous, epochs=0)
+        rows = interactions.users.encode(previous[1].users.ids)
+        np.testing.assert_array_equal(model.user_embeddings[rows],
+                                      previous[0].user_embeddings)
+        # adagrad accumulators start afresh
+        np.testing.assert_array_equal(model.user_embedding_gradients, 1)
+        new = ~np.isin(interactions.items.ids, previous[1].items.ids)
+        self.assertTrue(new.any())
+        np.testing.assert_array_equal(model.item_biases[new], 0)
+        self.assertLess(np.abs(model.item_embeddings[new]).max(), 0.01)
+        model_cf.train_model(df, evaluate=False, warm_start=previous,
+                             epochs=2)
+
+        df = prepare_data_features(data_dir=data_path, cache=False)
+        base, _ = split_reviews(df)
+        previous = model_hybrid.train_model(base, evaluate=False, epochs=1)
+        model, interactions, _, _, user_feature_map, _, _ = \
+            model_hybrid.train_model(df, evaluate=False,
+                                     warm_start=previous, epochs=0)
+        np.testing.assert_array_equal(
+            model.user_embeddings[user_feature_map['average_stars']],
+            previous[0].user_embeddings[previous[4]['average_stars']])
+        with self.assertRaises(ValueError):
+            model_cf.train_model(df, evaluate=False, epochs=0,
+                                 warm_start=(LightFM(no_components=3).fit(
+                                     previous[1].csr.tocoo()),
+                                     previous[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""
+NAME
+    test_ingest
+DESCRIPTION
+    This module test the streaming ingestion of the raw dumps.
+FUNCTIONS
+    test_stream_raw_join(self)
+        compare the chunked join with an in-memory join
+
+    test_read_projected(self)
+        make sure columns are projected and downcast
+
+    test_byte_ranges(self)
+        make sure ranges cover the file and end on newlines
+
+    test_read_json_parallel(self)
+        compare the parallel reader with pandas and the chunked reader
+
+    test_prepare_raw(self)
+        make sure the cached join is read once and can be read lazily
+"""
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from yelpify.cache import DatasetCache
+from yelpify.data_preparation import prepare_data, REVIEW_URL, USER_URL, \
+    BUSINESS_URL
+from yelpify.ingest import stream_raw_join, read_projected, \
+    read_json_parallel, read_chunks, byte_ranges, read_batches, \
+    JOINED_COLUMNS
+
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.review = pd.DataFrame({
+            'review_id': ['r%d' % i for i in range(7)],
+            'user_id': ['u1', 'u2', 'u1', 'u3', 'u2', 'u4', 'u1'],
+            'business_id': ['b1', 'b1', 'b2', 'b3', 'b2', 'b1', 'b3'],
+            'stars': [5, 3, 4, 1, 2, 5, 4],
+            'useful': range(7),
+            'text': ['text %d' % i for i in range(7)]})
+        self.user = pd.DataFrame({
+            'user_id': ['u1', 'u2', 'u3'],
+            'name': ['Ann', 'Bob', 'Cid'],
+            'review_count': [3, 2, 1],
+            'average_stars': [4.5, 2.5, 1.0]})
+        self.business = pd.DataFrame({
+            'business_id': ['b1', 'b2', 'b3'],
+            'name': ['Cafe', 'Diner', 'Pub'],
+            'stars': [4.0, 3.0, 2.5],
+            'categories': ['Food, Cafes', 'Food', 'Bars, Nightlife'],
+            'state': ['WA', 'WA', 'OR'],
+            'city': ['Seattle', 'Tacoma', 'Portland'],
+            'is_open': [1, 1, 0]})
+        self.paths = [os.path.join(self.tmp.name, name) for name in (
+            'review.csv', 'user.json', 'business.json')]
+        self.review.to_csv(self.paths[0], index=False)
+        self.user.to_json(self.paths[1], orient='records', lines=True)
+        self.business.to_json(self.paths[2], orient='records', lines=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_stream_raw_join(self):
+        """
+        Testing that the chunked join matches the in-memory join
+        """
+        output = os.path.join(self.tmp.name, 'joined.parquet')
+        n_rows, user_encoder, business_encoder = stream_raw_join(
+            *self.paths, output, chunksize=3)
+        self.assertEqual(n_rows, len(self.review))
+        df = pd.read_parquet(output)
+        self.assertEqual(str(df['user_id'].dtype), 'int32')
+        df['user_id'] = user_encoder.decode(df['user_id'])
+        df['business_id'] = business_encoder.decode(df['business_id'])
+        expected = self.review.merge(
+            self.user, on='user_id', how='left').merge(
+            self.business, on='business_id', how='left',
+            suffixes=('', '_business'))[JOINED_COLUMNS]
+        self.assertEqual(list(df.columns), JOINED_COLUMNS)
+        self.assertEqual(str(df['stars'].dtype), 'float32')
+        self.assertEqual(str(df['state'].dtype), 'category')
+        for col in ['user_id', 'business_id', 'name', 'name_business']:
+            self.assertEqual(list(df[col].fillna('')),
+                             list(expected[col].fillna('')))
+        for col in ['stars', 'average_stars', 'stars_business']:
+            pd.testing.assert_series_equal(
+                df[col].astype(float), expected[col].astype(float),
+                check_names=False)
+
+    def test_read_projected(self):
+        """
+        Testing column projection and downcasting
+        """
+        df = read_projected(self.paths[2], ['business_id', 'state'],
+                            {'state': 'category'}, chunksize=2)
+        self.assertEqual(list(df.columns), ['business_id', 'state'])
+        self.assertEqual(list(df['state'].cat.categories), ['OR', 'WA'])
+
+    def test_byte_ranges(self):
+        """
+        Testing that byte ranges are contiguous and aligned to newlines
+        """
+        ranges = byte_ranges(self.paths[1], chunk_bytes=10)
+        with open(self.paths[1], 'rb') as f:
+            data = f.read()
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], len(data))
+        for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]):
+            self.assertEqual(end, start)
+            self.assertEqual(data[end - 1:end], b'\n')
+
+    def test_read_json_parallel(self):
+        """
+        Testing that the parallel reader matches pandas
+        """
+        df = read_json_parallel(
+            self.paths[2], columns=['business_id', 'stars', 'state'],
+            dtypes={'stars': 'float32'}, n_workers=2, chunk_bytes=64)
+        expected = pd.read_json(self.paths[2], lines=True)
+        self.assertEqual(list(df['business_id']),
+                         list(expected['business_id']))
+        self.assertEqual(list(df['state']), list(expected['state']))
+        self.assertEqual(str(df['stars'].dtype), 'float32')
+        stream_raw_join(*self.paths,
+                        os.path.join(self.tmp.name, 'joined.parquet'),
+                        n_workers=2)
+        # chunks of about chunksize lines, and missing columns raise in
+        # both readers
+        chunks = list(read_chunks(self.paths[2], ['business_id'],
+                                  chunksize=1, n_workers=2))
+        self.assertEqual(sum(map(len, chunks)), len(self.business))
+        self.assertGreater(len(chunks), 1)
+        for n_workers in [1, 2]:
+            with self.assertRaises(KeyError):
+                list(read_chunks(self.paths[2], ['business_id', 'missing'],
+                                 chunksize=2, n_workers=n_workers))
+
+    def test_prepare_raw(self):
+        """
+        Testing that the join is the cache entry and is read lazily
+        """
+        for url, path in zip((REVIEW_URL, USER_URL, BUSINESS_URL),
+                             self.paths):
+            os.rename(path, os.path.join(
+                self.tmp.name, os.path.basename(url).split('?')[0]))
+        cache = DatasetCache(os.path.join(self.tmp.name, 'cache'))
+        df = prepare_data(raw=True, data_dir=self.tmp.name, cache=cache,
+                          chunksize=3, n_workers=1)
+        self.assertEqual(list(df['user_id'].astype(str)),
+                         list(self.review['user_id']))
+        self.assertEqual(str(df['business_id'].dtype), 'category')
+        path = prepare_data(raw=True, data_dir=self.tmp.name, cache=cache,
+                            chunksize=3, n_workers=1, lazy=True)
+        # a single entry, written by the join
+        self.assertEqual(os.path.dirname(path), cache.cache_dir)
+        self.assertEqual([name for name in os.listdir(cache.cache_dir)
+                          if name.endswith('.parquet')],
+                         [os.path.basename(path)])
+        batches = list(read_batches(path, batch_size=3))
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+        self.assertEqual(list(pd.concat(batches)['business_id']),
+                         list(self.review['business_id']))
+        with self.assertRaises(ValueError):
+            prepare_data(raw=True, data_dir=self.tmp.name, cache=False,
+                         lazy=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+NAME
+    test_interactions
+DESCRIPTION
+    This module test the construction of interaction matrices.
+FUNCTIONS
+    test_matches_lightfm(self)
+        compare with lightfm.data.Dataset.build_interactions
+
+    test_aggregate(self)
+        make sure repeated pairs are reduced as asked
+
+    test_store(self)
+        compare the sparse store with the dense interaction dataframe
+"""
+import unittest
+
+import numpy as np
+from lightfm.data import Dataset
+
+from yelpify.id_encoding import IdEncoder
+from yelpify.interactions import build_interactions, InteractionStore, \
+    as_interaction_store
+
+USERS = np.array([0, 1, 0, 2, 0])
+ITEMS = np.array([1, 0, 1, 2, 0])
+STARS = np.array([4.0, 5.0, 2.0, 1.0, 3.0])
+
+
+class TestInteractions(unittest.TestCase):
+
+    def test_matches_lightfm(self):
+        """
+        Testing that matrices are the ones lightfm builds
+        """
+        ds = Dataset()
+        ds.fit(range(3), range(3))
+        expected = ds.build_interactions(zip(USERS, ITEMS, STARS))
+        result = build_interactions(USERS, ITEMS, STARS, shape=(3, 3))
+        for e, r in zip(expected, result):
+            self.assertEqual(e.dtype, r.dtype)
+            self.assertEqual(list(e.row), list(r.row))
+            self.assertEqual(list(e.col), list(r.col))
+            self.assertEqual(list(e.data), list(r.data))
+
+    def test_aggregate(self):
+        """
+        Testing the reduction of repeated user-item pairs
+        """
+        expected = {'sum': 6.0, 'mean': 3.0, 'max': 4.0, 'min': 2.0,
+                    'first': 4.0, 'last': 2.0, 'count': 2.0}
+        for aggregate, value in expected.items():
+            interactions, weights = build_interactions(
+                USERS, ITEMS, STARS, aggregate=aggregate)
+            self.assertEqual(weights.nnz, 4)
+            self.assertEqual(interactions.toarray()[0, 1], 1)
+            self.assertEqual(weights.toarray()[0, 1], value)
+            self.assertEqual(weights.toarray()[1, 0],
+                             1.0 if aggregate == 'count' else 5.0)
+        with self.assertRaises(ValueError):
+            build_interactions(USERS, ITEMS, aggregate='median')
+
+    def test_store(self):
+        """
+        Testing that the store answers as the dense dataframe did
+        """
+        _, weights = build_interactions(USERS, ITEMS, STARS, shape=(3, 3))
+        users = IdEncoder(['u0', 'u1', 'u2'])
+        items = IdEncoder(['b0', 'b1', 'b2'])
+        store = InteractionStore(weights, users, items)
+        frame = store.to_frame()
+        np.testing.assert_array_equal(frame.values, weights.toarray())
+        self.assertEqual(store.shape, frame.shape)
+        self.assertEqual(list(store.index), list(frame.index))
+        self.assertEqual(list(store.columns), list(frame.columns))
+        for threshold in [-1, 0, 2.5, 5]:
+            row = frame.loc['u0', :]
+            expected = sorted(row[row > threshold].index, reverse=True)
+            self.assertEqual(store.known_items('u0', threshold), expected)
+        np.testing.assert_array_equal(
+            store.dense_column(1), frame.values[:, 1])
+        np.testing.assert_array_equal(store.dense_row(0), frame.values[0])
+        users_x, values = store.item_column(0)
+        self.assertEqual(dict(zip(users_x, values)), {0: 3.0, 1: 5.0})
+        self.assertEqual(store.row('u0').to_dict(), {'b0': 3.0, 'b1': 6.0})
+        copy = as_interaction_store(frame)
+        self.assertEqual((copy.csr != store.csr).nnz, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,6 +11,12 @@ FUNCTIONS
     test_evaluate_model(self)
         make sure model devaluation has no exceptions
 
+    test_train_model_sparse(self)
+        make sure training on sparse categories has no exceptions
+
+    test_evaluate_model_sparse(self)
+        make sure evaluation on sparse categories has no exceptions
+
 """
 import os
 import unittest
@@ -43,6 +49,28 @@ class test_model(unittest.TestCase):
         evaluate_model(df, user_id_col='user_id',
                        item_id_col='business_id', stratify=None)
 
+    def test_train_model_sparse(self):
+        """
+        Testing process of training model on the sparse category matrix
+        smoke test, make sure no exceptions
+        """
+        df, category_matrix, names = prepare_data_features(
+            raw=False, sparse_categories=True)
+        train_model(df, user_id_col='user_id', item_id_col='business_id',
+                    item_name_col='name_business', evaluate=False,
+                    category_matrix=category_matrix, category_names=names)
+
+    def test_evaluate_model_sparse(self):
+        """
+        Testing process of evaluating model on the sparse category matrix
+        smoke test, make sure no exceptions
+        """
+        df, category_matrix, _ = prepare_data_features(
+            raw=False, sparse_categories=True)
+        evaluate_model(df, user_id_col='user_id',
+                       item_id_col='business_id', stratify=None,
+                       category_matrix=category_matrix)
+
 
 if __name__ == "__main__":
     unittest.main()
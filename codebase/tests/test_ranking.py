@@ -0,0 +1,122 @@
+"""
+NAME
+    test_ranking
+DESCRIPTION
+    This module test the selection of the best scored items.
+FUNCTIONS
+    test_top_k(self)
+        compare with a full sort
+
+    test_ties(self)
+        make sure the lowest indexes are kept among equal scores
+
+    test_exclude(self)
+        make sure excluded indexes are never returned
+
+    test_batch_top_k(self)
+        compare blocked batch scoring with one top_k per query
+
+    test_target_blocks(self)
+        make sure merging blocks of targets gives the same ranking
+"""
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from yelpify.ranking import top_k, rows_top_k, batch_top_k
+
+
+class TestRanking(unittest.TestCase):
+
+    def test_top_k(self):
+        """
+        Testing that partial selection matches a full sort
+        """
+        scores = np.random.RandomState(0).randn(1000)
+        expected = np.argsort(-scores)
+        for k in [0, 1, 10, 999, 1000, 2000]:
+            np.testing.assert_array_equal(top_k(scores, k), expected[:k])
+        self.assertEqual(list(top_k([1.0, 2.0, 2.0, 0.0], 3)), [1, 2, 0])
+
+    def test_ties(self):
+        """
+        Testing equal scores cut by the partial selection
+        """
+        scores = np.repeat([1.0, 2.0, 0.0], [500, 3, 500])[::-1]
+        expected = np.lexsort((np.arange(len(scores)), -scores))
+        for k in [1, 3, 5, 600]:
+            np.testing.assert_array_equal(top_k(scores, k), expected[:k])
+        rng = np.random.RandomState(0)
+        matrix = rng.randint(0, 3, size=(50, 40)).astype(np.float32)
+        matrix[0] = -np.inf
+        matrix[1, 5:] = -np.inf
+        for k in [1, 7, 40]:
+            indexes, values = rows_top_k(matrix, k)
+            for row in range(2, 50):
+                expected = top_k(matrix[row], k)
+                np.testing.assert_array_equal(indexes[row], expected)
+                np.testing.assert_array_equal(values[row],
+                                              matrix[row, expected])
+            self.assertTrue((indexes[0] == -1).all())
+            self.assertEqual(list(indexes[1, :min(k, 5)]),
+                             list(top_k(matrix[1, :5], k)))
+
+    def test_exclude(self):
+        """
+        Testing that the mask is applied before selection
+        """
+        scores = np.array([5.0, 4.0, 3.0, 2.0, 1.0])
+        exclude = np.array([True, False, True, False, False])
+        self.assertEqual(list(top_k(scores, 2, exclude)), [1, 3])
+        self.assertEqual(list(top_k(scores, 10, exclude)), [1, 3, 4])
+
+    def test_batch_top_k(self):
+        """
+        Testing that every block gives the rows of single queries
+        """
+        rng = np.random.RandomState(0)
+        queries = rng.randn(10, 4).astype(np.float32)
+        targets = rng.randn(30, 4).astype(np.float32)
+        query_biases = rng.randn(10).astype(np.float32)
+        target_biases = rng.randn(30).astype(np.float32)
+        exclude = sparse.random(10, 30, density=0.3, random_state=0,
+                                format='lil')
+        exclude[9] = 1
+        exclude = exclude.tocsr()
+        for block_size in [1, 3, 10, 64]:
+            indexes, scores = batch_top_k(
+                query_biases, queries, target_biases, targets, 5,
+                exclude, block_size)
+            self.assertEqual(indexes.shape, (10, 5))
+            for i in range(9):
+                row = queries[i] @ targets.T + query_biases[i] + target_biases
+                expected = top_k(row, 5, exclude[i].toarray().ravel() != 0)
+                np.testing.assert_array_equal(indexes[i], expected)
+                np.testing.assert_allclose(scores[i], row[expected],
+                                           rtol=1e-5)
+            self.assertTrue((indexes[9] == -1).all())
+
+    def test_target_blocks(self):
+        """
+        Testing that rankings merged over target blocks, ties included,
+        are the rankings of all targets
+        """
+        rng = np.random.RandomState(0)
+        queries = rng.randint(-2, 3, size=(10, 3)).astype(np.float32)
+        targets = rng.randint(-2, 3, size=(30, 3)).astype(np.float32)
+        query_biases = np.zeros(10, dtype=np.float32)
+        target_biases = rng.randint(-1, 2, size=30).astype(np.float32)
+        exclude = sparse.random(10, 30, density=0.3, random_state=0)
+        expected = batch_top_k(query_biases, queries, target_biases, targets,
+                               8, exclude)
+        for target_block_size in [1, 4, 7, 30]:
+            indexes, scores = batch_top_k(
+                query_biases, queries, target_biases, targets, 8, exclude,
+                block_size=3, target_block_size=target_block_size)
+            np.testing.assert_array_equal(indexes, expected[0])
+            np.testing.assert_array_equal(scores, expected[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
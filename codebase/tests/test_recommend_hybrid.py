@@ -27,7 +27,7 @@ data_path = os.path.join(codebase.__path__[0], 'data')
 df = prepare_data_features(raw=False)
 
 model_full, df_interactions, user_dict, item_dict, \
-    user_feature_map, business_feature_map = train_model(
+    user_feature_map, business_feature_map, feature_store = train_model(
         df=df,
         user_id_col='user_id',
         item_id_col='business_id',
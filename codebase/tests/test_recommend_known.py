@@ -11,21 +11,43 @@ FUNCTIONS
     test_recommend_known_item(self)
         test known item for recommendation system
         make sure no exceptions
+
+    test_new_only(self)
+        compare the exclusion of known items with a list scan
+
+    test_batch(self)
+        compare batch recommendations with one call per user or item
 """
 import os
 import unittest
 
+import numpy as np
+from lightfm import LightFM
 
 import codebase
 from yelpify.data_preparation import prepare_data
 from yelpify.model_cf import train_model
 from yelpify.recommend_known import recommend_known_user, recommend_known_item
+from yelpify.recommend_known import (recommend_known_users_batch,
+                                     recommend_known_items_batch)
+from yelpify.id_encoding import IdEncoder
+from yelpify.interactions import build_interactions, InteractionStore
 
 data_path = os.path.join(codebase.__path__[0], 'data')
 USER_ID = "avXKk5RYsDWeRgkHv1wfGQ"
 ITEM_ID = "VMPSdoBgJuyS9t_x_caTig"
 
 
+class FixedModel:
+    """ Model whose scores are fixed in a users x items array. """
+
+    def __init__(self, scores):
+        self.scores = scores
+
+    def predict(self, user_ids, item_ids):
+        return self.scores[user_ids, item_ids]
+
+
 class TestModel(unittest.TestCase):
 
     def test_recommend_known_user(self):
@@ -72,6 +94,67 @@ class TestModel(unittest.TestCase):
             show=True)
         self.assertEqual(len(rec_list_item), 10)
 
+    def test_new_only(self):
+        """
+        Testing that masks exclude the same items as the list scan
+        """
+        rng = np.random.RandomState(0)
+        n_users, n_items = 5, 50
+        _, weights = build_interactions(
+            rng.randint(n_users, size=100), rng.randint(n_items, size=100),
+            rng.randint(1, 6, size=100), shape=(n_users, n_items))
+        users = IdEncoder(['u%d' % i for i in range(n_users)])
+        items = IdEncoder(['b%d' % i for i in range(n_items)])
+        store = InteractionStore(weights, users, items)
+        model = FixedModel(rng.randn(n_users, n_items))
+        item_dict = dict(zip(items, items))
+        for user_id in users:
+            scores = model.scores[users[user_id]]
+            ranked = [items.ids[i] for i in np.argsort(-scores)]
+            for threshold in [0, 3]:
+                known = store.known_items(user_id, threshold)
+                expected = [x for x in ranked if x not in known][:10]
+                self.assertEqual(recommend_known_user(
+                    model, store, user_id, users, item_dict, 10,
+                    new_only=True, threshold=threshold, show=False),
+                    expected)
+            self.assertEqual(recommend_known_user(
+                model, store, user_id, users, item_dict, 10,
+                new_only=True, threshold=3, show=False, exclude_seen=True),
+                [x for x in ranked
+                 if x not in store.known_items(user_id, 0)][:10])
+
+    def test_batch(self):
+        """
+        Testing that batch calls return the rankings of single calls
+        """
+        rng = np.random.RandomState(0)
+        n_users, n_items = 20, 40
+        interactions, weights = build_interactions(
+            rng.randint(n_users, size=300), rng.randint(n_items, size=300),
+            rng.randint(1, 6, size=300), shape=(n_users, n_items))
+        users = IdEncoder(['u%d' % i for i in range(n_users)])
+        items = IdEncoder(['b%d' % i for i in range(n_items)])
+        store = InteractionStore(weights, users, items)
+        model = LightFM(no_components=8, random_state=0)
+        model.fit(interactions, epochs=5)
+        item_dict = dict(zip(items, items))
+        user_ids = list(users)[::-1]
+        item_xs, scores = recommend_known_users_batch(
+            model, store, user_ids, 5, new_only=True, block_size=7)
+        self.assertEqual(item_xs.shape, (n_users, 5))
+        for user_id, row in zip(user_ids, item_xs):
+            self.assertEqual(list(items.decode(row)), recommend_known_user(
+                model, store, user_id, users, item_dict, 5, new_only=True,
+                show=False))
+        user_xs, _ = recommend_known_items_batch(
+            model, store, ['b3', 'b0'], 5)
+        for item_id, row in zip(['b3', 'b0'], user_xs):
+            self.assertEqual(list(users.decode(row)), recommend_known_item(
+                model, store, item_id, users, item_dict, 5, show=False))
+        with self.assertRaises(KeyError):
+            recommend_known_users_batch(model, store, ['unknown'], 5)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,136 @@
+"""
+NAME
+    test_recommendation_table
+DESCRIPTION
+    This module test the precomputed recommendation tables.
+FUNCTIONS
+    test_build(self)
+        compare a table with the batch recommendations
+
+    test_recommend(self)
+        make sure a lookup matches recommend_known_user
+
+    test_item_table(self)
+        compare the top users of items with live scoring
+
+    test_wrong_rows(self)
+        make sure a table of the other row kind is refused
+"""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from scipy import sparse
+
+from codebase.tests.synthetic import make_engine
+from yelpify.id_encoding import IdEncoder
+from yelpify.interactions import InteractionStore
+from yelpify.recommend_known import recommend_known_user, \
+    recommend_known_users_batch, recommend_known_item
+from yelpify.recommendation_table import build_recommendation_table, \
+    RecommendationTable, recommend_precomputed_user, \
+    build_item_user_table, recommend_precomputed_item
+
+
+class TestRecommendationTable(unittest.TestCase):
+
+    def setUp(self):
+        n_users, n_items = 300, 120
+        self.engine = make_engine(n_users, n_items, dim=8)
+        self.users = IdEncoder(['u%d' % i for i in range(n_users)])
+        self.items = IdEncoder(['b%d' % i for i in range(n_items)])
+        weights = sparse.random(n_users, n_items, density=0.1,
+                                random_state=0) * 5
+        self.store = InteractionStore(weights, self.users, self.items)
+        self.item_dict = dict(zip(self.items, self.items))
+
+    def test_build(self):
+        """
+        Testing that blocks written by threads match the batch function
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            table = build_recommendation_table(
+                self.engine, self.store, tmp, 10, new_only=True,
+                block_size=32, n_jobs=3)
+            expected, scores = recommend_known_users_batch(
+                self.engine, self.store, list(self.users), 10,
+                new_only=True)
+            np.testing.assert_array_equal(table.indexes, expected)
+            np.testing.assert_allclose(table.scores, scores, rtol=1e-6)
+            loaded = RecommendationTable(tmp)
+            self.assertEqual(loaded.manifest['threshold'], 3)
+            self.assertEqual(loaded.indexes.shape, (300, 10))
+            with self.assertRaises(KeyError):
+                loaded.lookup('unknown')
+            del table, loaded
+
+    def test_recommend(self):
+        """
+        Testing lookups against recommend_known_user
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            table = build_recommendation_table(self.engine, self.store, tmp,
+                                               10, exclude_seen=True)
+            for user_id in ['u0', 'u7', 'u299']:
+                self.assertEqual(
+                    recommend_precomputed_user(table, user_id,
+                                               self.item_dict, 5),
+                    recommend_known_user(self.engine, self.store, user_id,
+                                         self.users, self.item_dict, 5,
+                                         exclude_seen=True, show=False))
+            del table
+
+    def test_item_table(self):
+        """
+        Testing the top users of items, and the fallback to live scoring
+        """
+        user_dict = dict(zip(self.users, self.users))
+        with tempfile.TemporaryDirectory() as tmp:
+            table = build_item_user_table(self.engine, self.store, tmp, 10,
+                                          block_size=16, user_block_size=64)
+            self.assertEqual(table.manifest['rows'], 'items')
+            for item_id in ['b0', 'b50', 'b119']:
+                expected = recommend_known_item(
+                    self.engine, self.store, item_id, user_dict,
+                    self.item_dict, 5, show=False)
+                self.assertEqual(recommend_precomputed_item(
+                    table, self.engine, self.store, item_id, user_dict,
+                    self.item_dict, 5), expected)
+            # more users than the table has, then an item added after it
+            self.assertEqual(len(recommend_precomputed_item(
+                table, self.engine, self.store, 'b0', user_dict,
+                self.item_dict, 20, show=False)), 20)
+            table.row_dict = IdEncoder(['b%d' % i for i in range(100)])
+            self.assertNotIn('b110', table)
+            self.assertEqual(
+                recommend_precomputed_item(table, self.engine, self.store,
+                                           'b110', user_dict,
+                                           self.item_dict, 5, show=False),
+                recommend_known_item(self.engine, self.store, 'b110',
+                                     user_dict, self.item_dict, 5,
+                                     show=False))
+            del table
+
+    def test_wrong_rows(self):
+        """
+        Testing that a table of the other row kind is refused
+        """
+        user_dict = dict(zip(self.users, self.users))
+        with tempfile.TemporaryDirectory() as tmp:
+            users = build_recommendation_table(
+                self.engine, self.store, os.path.join(tmp, 'users'), 10)
+            items = build_item_user_table(
+                self.engine, self.store, os.path.join(tmp, 'items'), 10)
+            with self.assertRaises(ValueError):
+                recommend_precomputed_item(users, self.engine, self.store,
+                                           'u0', user_dict, self.item_dict,
+                                           5, show=False)
+            with self.assertRaises(ValueError):
+                recommend_precomputed_user(items, 'b0', self.item_dict, 5,
+                                           show=False)
+            del users, items
+
+
+if __name__ == "__main__":
+    unittest.main()
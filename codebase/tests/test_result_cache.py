@@ -0,0 +1,168 @@
+"""
+NAME
+    test_result_cache
+DESCRIPTION
+    This module test the cache of recommendation results.
+FUNCTIONS
+    test_wrap(self)
+        make sure cached functions return the uncached results
+
+    test_eviction(self)
+        check the LRU, memory and TTL evictions
+
+    test_invalidation(self)
+        make sure a new model version drops the cache
+
+    test_updates(self)
+        make sure an updated model, or an index, is not served stale
+"""
+import unittest
+
+from lightfm import LightFM
+from scipy import sparse
+
+from codebase.tests.synthetic import make_engine
+from yelpify.ann import IVFIndex
+from yelpify.id_encoding import IdEncoder
+from yelpify.incremental import grow_model
+from yelpify.interactions import InteractionStore
+from yelpify.recommend_known import recommend_known_user, \
+    recommend_known_item
+from yelpify.result_cache import RecommendationCache, model_version
+from yelpify.training import fit_model
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = make_engine()
+        self.users = IdEncoder(['u%d' % i for i in range(50)])
+        self.items = IdEncoder(['b%d' % i for i in range(40)])
+        weights = sparse.random(50, 40, density=0.2, random_state=0) * 5
+        self.store = InteractionStore(weights, self.users, self.items)
+        self.user_dict = dict(zip(self.users, self.users))
+        self.item_dict = dict(zip(self.items, self.items))
+
+    def test_wrap(self):
+        """
+        Testing that cached results are the results of the function
+        """
+        cache = RecommendationCache()
+        cached_user = cache.wrap(recommend_known_user)
+        cached_item = cache.wrap(recommend_known_item)
+        for new_only in [False, True, False, True]:
+            self.assertEqual(
+                cached_user(self.engine, self.store, 'u1', self.users,
+                            self.item_dict, 5, new_only=new_only),
+                recommend_known_user(self.engine, self.store, 'u1',
+                                     self.users, self.item_dict, 5,
+                                     new_only=new_only, show=False))
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 2)
+        result = cached_item(self.engine, self.store, 'b3', self.user_dict,
+                             self.item_dict, 5)
+        result.append('changed')
+        self.assertEqual(
+            cached_item(self.engine, self.store, 'b3', self.user_dict,
+                        self.item_dict, topn=5, show=True),
+            recommend_known_item(self.engine, self.store, 'b3',
+                                 self.user_dict, self.item_dict, 5,
+                                 show=False))
+        self.assertEqual(cache.stats()['hits'], 3)
+        self.assertEqual(len(cache), 3)
+
+    def test_eviction(self):
+        """
+        Testing least recently used, memory bound and TTL eviction
+        """
+        clock = FakeClock()
+        cache = RecommendationCache(max_entries=2, ttl=10, clock=clock)
+        cache.put(self.engine, ('a',), ['x'])
+        cache.put(self.engine, ('b',), ['y'])
+        self.assertEqual(cache.get(self.engine, ('a',)), ['x'])
+        cache.put(self.engine, ('c',), ['z'])
+        self.assertIsNone(cache.get(self.engine, ('b',)))
+        self.assertEqual(cache.get(self.engine, ('a',)), ['x'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        clock.now = 11
+        self.assertIsNone(cache.get(self.engine, ('a',)))
+        self.assertEqual(len(cache), 1)
+        cache = RecommendationCache(max_bytes=2000)
+        for i in range(100):
+            cache.put(self.engine, ('user', i), ['item%d' % j
+                                                 for j in range(5)])
+        self.assertLessEqual(cache.n_bytes, 2000)
+        self.assertGreater(len(cache), 0)
+        self.assertIsNotNone(cache.get(self.engine, ('user', 99)))
+        self.assertIsNone(cache.get(self.engine, ('user', 0)))
+
+    def test_invalidation(self):
+        """
+        Testing that results of another model version are not served
+        """
+        cache = RecommendationCache()
+        cached_user = cache.wrap(recommend_known_user)
+        old = cached_user(self.engine, self.store, 'u1', self.users,
+                          self.item_dict, 5)
+        other = make_engine(seed=1)
+        new = cached_user(other, self.store, 'u1', self.users,
+                          self.item_dict, 5)
+        self.assertEqual(new, recommend_known_user(
+            other, self.store, 'u1', self.users, self.item_dict, 5,
+            show=False))
+        self.assertNotEqual(old, new)
+        self.assertEqual(cache.stats()['invalidations'], 1)
+        self.assertEqual(cache.stats()['hits'], 0)
+        other.version = '/artifacts/v2'
+        self.assertEqual(model_version(other), ('/artifacts/v2', 0))
+        cached_user(other, self.store, 'u1', self.users, self.item_dict, 5)
+        self.assertEqual(cache.stats()['invalidations'], 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_updates(self):
+        """
+        Testing that in-place updates and indexes change the cached results
+        """
+        cache = RecommendationCache()
+        cached_user = cache.wrap(recommend_known_user)
+        weights = self.store.csr.tocoo()
+        model = LightFM(no_components=4, random_state=0)
+        # an artifact model keeps its version through updates
+        model.version = '/artifacts/v1'
+        fit_model(model, weights, weights, epochs=1)
+        cached_user(model, self.store, 'u1', self.users, self.item_dict, 5)
+        fit_model(model, weights, weights, epochs=5)
+        self.assertEqual(
+            cached_user(model, self.store, 'u1', self.users,
+                        self.item_dict, 5),
+            recommend_known_user(model, self.store, 'u1', self.users,
+                                 self.item_dict, 5, show=False))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+        grow_model(model, n_new_items=1)
+        self.assertEqual(model_version(model), ('/artifacts/v1', 3))
+        index = IVFIndex(n_lists=4, n_probe=1).fit(
+            *self.engine.get_item_representations())
+        exact = cached_user(self.engine, self.store, 'u1', self.users,
+                            self.item_dict, 5)
+        approximate = cached_user(self.engine, self.store, 'u1', self.users,
+                                  self.item_dict, 5, index=index)
+        self.assertEqual(cache.stats()['hits'], 0)
+        self.assertEqual(approximate, recommend_known_user(
+            self.engine, self.store, 'u1', self.users, self.item_dict, 5,
+            show=False, index=index))
+        self.assertEqual(exact, cached_user(
+            self.engine, self.store, 'u1', self.users, self.item_dict, 5))
+        self.assertEqual(cache.stats()['hits'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,204 @@
+"""
+NAME
+    test_scoring
+DESCRIPTION
+    This module test scoring from precomputed representations.
+FUNCTIONS
+    test_collaborative(self)
+        compare the engine of a collaborative model with predict
+
+    test_hybrid(self)
+        compare the engine of a hybrid model with predict
+
+    test_serving(self)
+        make sure an artifact can be served without lightfm
+
+    test_cold_start(self)
+        compare the scores of new users and items with predict
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+import codebase
+from yelpify.artifact import save_artifact
+from yelpify.data_preparation import prepare_data, prepare_data_features
+from yelpify import model_cf, model_hybrid
+from yelpify.recommend_known import recommend_known_user, \
+    recommend_known_item, recommend_known_users_batch
+from yelpify.recommend_hybrid import recommend_hybrid_user, \
+    recommend_hybrid_new_item, recommend_hybrid_new_user, \
+    recommend_hybrid_new_items_batch, recommend_hybrid_new_users_batch
+from yelpify.scoring import ScoringEngine
+
+data_path = os.path.join(codebase.__path__[0], 'data')
+
+SERVE = '''
+import sys
+from yelpify.artifact import load_artifact
+from yelpify.recommend_known import recommend_known_user
+artifact = load_artifact(sys.argv[1])
+print(recommend_known_user(
+    artifact.engine, artifact.interactions, sys.argv[2], artifact.user_dict,
+    artifact.item_dict, 5, show=False))
+assert 'lightfm' not in sys.modules
+'''
+
+
+class TestScoring(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = prepare_data(data_dir=data_path, cache=False)
+        cls.trained = model_cf.train_model(cls.df, evaluate=False)
+
+    def test_collaborative(self):
+        """
+        Testing that engine scores and rankings match predict
+        """
+        model, interactions, user_dict, item_dict = self.trained
+        engine = ScoringEngine.from_model(model)
+        n_users, n_items = interactions.shape
+        for user_x in range(0, n_users, 10):
+            expected = model.predict(user_x, np.arange(n_items))
+            np.testing.assert_allclose(engine.user_scores(user_x), expected,
+                                       rtol=1e-5, atol=1e-5)
+            np.testing.assert_allclose(
+                engine.predict(user_x, np.arange(n_items)), expected,
+                rtol=1e-5, atol=1e-5)
+        for user_id in interactions.index[:10]:
+            self.assertEqual(
+                recommend_known_user(engine, interactions, user_id,
+                                     user_dict, item_dict, 5, show=False),
+                recommend_known_user(model, interactions, user_id,
+                                     user_dict, item_dict, 5, show=False))
+        item_id = interactions.columns[0]
+        self.assertEqual(
+            recommend_known_item(engine, interactions, item_id, user_dict,
+                                 item_dict, 5, show=False),
+            recommend_known_item(model, interactions, item_id, user_dict,
+                                 item_dict, 5, show=False))
+        item_xs, _ = recommend_known_users_batch(
+            engine, interactions, interactions.index[:10], 5)
+        self.assertEqual(item_xs.shape, (10, 5))
+
+    def test_hybrid(self):
+        """
+        Testing that a hybrid engine matches predict with features
+        """
+        df, category_matrix, names = prepare_data_features(
+            data_dir=data_path, cache=False, sparse_categories=True)
+        model, interactions, user_dict, item_dict, _, _, store = \
+            model_hybrid.train_model(df, evaluate=False,
+                                     category_matrix=category_matrix,
+                                     category_names=names)
+        engine = ScoringEngine.from_model(model, store)
+        _, n_items = interactions.shape
+        expected = model.predict(
+            3, np.arange(n_items), user_features=store.user_features,
+            item_features=store.item_features)
+        np.testing.assert_allclose(engine.user_scores(3), expected,
+                                   rtol=1e-5, atol=1e-5)
+        user_id = interactions.index[3]
+        self.assertEqual(
+            recommend_hybrid_user(df, engine, interactions, user_id,
+                                  user_dict, item_dict, 5, show=False),
+            recommend_hybrid_user(store, model, interactions, user_id,
+                                  user_dict, item_dict, 5, show=False))
+
+    def test_serving(self):
+        """
+        Testing recommendations from an artifact without lightfm
+        """
+        model, interactions, user_dict, item_dict = self.trained
+        user_id = interactions.index[0]
+        with tempfile.TemporaryDirectory() as tmp:
+            save_artifact(tmp, model, interactions, user_dict, item_dict)
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+            output = subprocess.run(
+                [sys.executable, '-c', SERVE, tmp, user_id], env=env,
+                check=True, stdout=subprocess.PIPE).stdout.decode()
+        self.assertIn(str(recommend_known_user(
+            model, interactions, user_id, user_dict, item_dict, 5,
+            show=False)), output)
+
+    def test_cold_start(self):
+        """
+        Testing new users and items scored from their features
+        """
+        df = prepare_data_features(data_dir=data_path, cache=False)
+        model, interactions, user_dict, item_dict, _, _, store = \
+            model_hybrid.train_model(df, evaluate=False)
+        engine = ScoringEngine.from_model(model, store)
+        n_users, n_items = interactions.shape
+        n_item_features = store.item_features.shape[1] - n_items
+        rng = np.random.RandomState(0)
+        new_items = rng.binomial(1, 0.1, size=(20, n_item_features))
+        new_users = np.array([[1.0], [3.5], [5.0]])
+        biases, embeddings = engine.new_item_representations(
+            store.new_item_features(new_items))
+        expected_biases, expected_embeddings = \
+            model.get_item_representations(store.new_item_features(new_items))
+        np.testing.assert_allclose(biases, expected_biases, rtol=1e-5,
+                                   atol=1e-6)
+        np.testing.assert_allclose(embeddings, expected_embeddings,
+                                   rtol=1e-5, atol=1e-6)
+        expected = model.predict(
+            np.arange(n_users), np.zeros(n_users, dtype=np.int32),
+            user_features=store.user_features,
+            item_features=store.new_item_features(new_items[:1]))
+        user_xs, scores = recommend_hybrid_new_items_batch(
+            store, engine, interactions, new_items, 5)
+        self.assertEqual(user_xs.shape, (20, 5))
+        np.testing.assert_allclose(scores[0], expected[user_xs[0]],
+                                   rtol=1e-4, atol=1e-4)
+        for i in [0, 7]:
+            self.assertEqual(
+                recommend_hybrid_new_item(
+                    store, engine, interactions, new_items[i:i + 1],
+                    user_dict, item_dict, 5, show=False),
+                list(interactions.index[user_xs[i]]))
+        item_xs, _ = recommend_hybrid_new_users_batch(
+            store, model, interactions, new_users, 5)
+        for i in range(3):
+            self.assertEqual(
+                recommend_hybrid_new_user(
+                    store, engine, interactions, new_users[i:i + 1],
+                    user_dict, item_dict, 5, show=False),
+                list(interactions.columns[item_xs[i]]))
+            # the dataframe places the features as the store does
+            self.assertEqual(
+                recommend_hybrid_new_user(
+                    df, engine, interactions, new_users[i:i + 1],
+                    user_dict, item_dict, 5, show=False),
+                list(interactions.columns[item_xs[i]]))
+        self.assertEqual(
+            recommend_hybrid_new_item(
+                df, model, interactions, new_items[:1], user_dict,
+                item_dict, 5, show=False),
+            list(interactions.index[user_xs[0]]))
+        with self.assertRaises(TypeError):
+            recommend_hybrid_new_users_batch(df, engine, interactions,
+                                             new_users, 5)
+        # new features are placed by a store, which None does not give
+        for scorer in [engine, model]:
+            with self.assertRaises(TypeError):
+                recommend_hybrid_new_user(None, scorer, interactions,
+                                          new_users[:1], user_dict,
+                                          item_dict, 5, show=False)
+            with self.assertRaises(TypeError):
+                recommend_hybrid_new_item(None, scorer, interactions,
+                                          new_items[:1], user_dict,
+                                          item_dict, 5, show=False)
+        with self.assertRaises(ValueError):
+            ScoringEngine(*engine.get_user_representations(),
+                          *engine.get_item_representations()
+                          ).new_user_representations(new_users)
+
+
+if __name__ == "__main__":
+    unittest.main()
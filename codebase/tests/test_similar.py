@@ -0,0 +1,89 @@
+"""
+NAME
+    test_similar
+DESCRIPTION
+    This module test the similar items recommendations.
+FUNCTIONS
+    test_neighbour_table(self)
+        compare the precomputed table with a brute force ranking
+
+    test_recommend_similar_items(self)
+        make sure the table and the direct search agree
+
+    test_save_load(self)
+        make sure a saved table is loaded back
+"""
+import tempfile
+import unittest
+
+import numpy as np
+
+from codebase.tests.synthetic import make_engine
+from yelpify.id_encoding import IdEncoder
+from yelpify.interactions import InteractionStore
+from yelpify.similar import build_neighbour_table, NeighbourTable, \
+    recommend_similar_items, item_vectors
+
+
+class TestSimilar(unittest.TestCase):
+
+    def setUp(self):
+        n_users, n_items = 10, 300
+        self.engine = make_engine(n_users, n_items, dim=8)
+        self.items = IdEncoder(['b%d' % i for i in range(n_items)])
+        self.store = InteractionStore(
+            np.zeros((n_users, n_items)),
+            IdEncoder(['u%d' % i for i in range(n_users)]), self.items)
+        self.item_dict = dict(zip(self.items, self.items))
+
+    def test_neighbour_table(self):
+        """
+        Testing that every row is the brute force ranking of an item
+        """
+        for metric in ['cosine', 'dot']:
+            table = build_neighbour_table(self.engine, 10, metric,
+                                          block_size=64, n_jobs=2)
+            self.assertEqual(table.items.dtype, np.int32)
+            self.assertEqual(table.scores.dtype, np.float16)
+            vectors = item_vectors(self.engine, metric)
+            for item_x in range(0, 300, 37):
+                scores = vectors @ vectors[item_x]
+                scores[item_x] = -np.inf
+                expected = np.argsort(-scores)[:10]
+                items, values = table.lookup(item_x)
+                np.testing.assert_array_equal(items, expected)
+                np.testing.assert_allclose(values, scores[expected],
+                                           rtol=1e-2, atol=1e-2)
+        with self.assertRaises(ValueError):
+            item_vectors(self.engine, 'euclidean')
+
+    def test_recommend_similar_items(self):
+        """
+        Testing that lookups and direct comparisons agree
+        """
+        table = build_neighbour_table(self.engine, 10)
+        for item_id in ['b0', 'b42']:
+            direct = recommend_similar_items(
+                self.engine, self.store, item_id, self.item_dict, 5,
+                show=False)
+            self.assertNotIn(item_id, direct)
+            self.assertEqual(direct, recommend_similar_items(
+                self.engine, self.store, item_id, self.item_dict, 5,
+                table=table, show=True))
+
+    def test_save_load(self):
+        """
+        Testing the round trip of a table
+        """
+        table = build_neighbour_table(self.engine, 5, 'dot')
+        with tempfile.TemporaryDirectory() as tmp:
+            table.save(tmp)
+            loaded = NeighbourTable.load(tmp)
+            self.assertEqual(loaded.metric, 'dot')
+            np.testing.assert_array_equal(loaded.items, table.items)
+            np.testing.assert_array_equal(loaded.scores, table.scores)
+            del loaded
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+"""
+NAME
+    test_training
+DESCRIPTION
+    This module test the training epochs of models.
+FUNCTIONS
+    test_split(self)
+        make sure the validation split partitions the interactions
+
+    test_early_stopping(self)
+        make sure training stops once the validation AUC stalls
+
+    test_best_epoch(self)
+        make sure the parameters of the best epoch are kept
+
+    test_sample_users(self)
+        check the interactions of sampled validation users
+
+    test_split_reviews(self)
+        make sure repeated reviews of a pair are in the same set
+
+    test_evaluate_and_fit(self)
+        make sure early stopping is decided without the testing set
+"""
+import unittest
+from unittest import mock
+
+import numpy as np
+from lightfm import LightFM
+from lightfm.evaluation import auc_score
+from scipy import sparse
+
+from codebase.tests.synthetic import make_interactions
+from yelpify.evaluation import user_metrics
+from yelpify.interactions import build_interactions
+from yelpify.training import split_interactions, sample_users, \
+    fit_model, split_reviews, evaluate_and_fit
+
+
+class TestTraining(unittest.TestCase):
+
+    def test_split(self):
+        """
+        Testing that every interaction is in exactly one part
+        """
+        interactions, weights = make_interactions()
+        train, train_weights, validation = split_interactions(
+            interactions, weights, 0.2, random_state=0)
+        self.assertEqual(train.nnz + validation.nnz, interactions.nnz)
+        self.assertEqual((train.tocsr().multiply(validation.tocsr())).nnz, 0)
+        np.testing.assert_array_equal(train.row, train_weights.row)
+        np.testing.assert_array_equal(train.col, train_weights.col)
+        self.assertAlmostEqual(validation.nnz / interactions.nnz, 0.2,
+                               delta=0.05)
+
+    def test_early_stopping(self):
+        """
+        Testing the validation AUC of every epoch and early stopping
+        """
+        interactions, weights = make_interactions()
+        model = LightFM(no_components=8, loss='warp', random_state=0)
+        history = fit_model(model, interactions, weights, epochs=30,
+                            patience=1, random_state=0)
+        self.assertLess(len(history), 30)
+        self.assertGreater(max(history), 0.5)
+        # the last epoch did not improve on the best one
+        self.assertLessEqual(history[-1], max(history[:-1]))
+        # the held-out interactions are trained on once stopped
+        fitted = []
+        model = LightFM(no_components=8, loss='warp', random_state=0)
+        fit_partial = model.fit_partial
+        model.fit_partial = lambda matrix, **kwargs: (
+            fitted.append((matrix.nnz, kwargs['epochs'])),
+            fit_partial(matrix, **kwargs))[1]
+        fit_model(model, interactions, weights, epochs=3, patience=1,
+                  random_state=0, refit_epochs=2)
+        self.assertLess(fitted[0][0], interactions.nnz)
+        self.assertEqual(fitted[-1], (interactions.nnz, 2))
+        model = LightFM(no_components=8, random_state=0)
+        self.assertEqual(fit_model(model, sparse.coo_matrix(interactions),
+                                   weights, epochs=2), [])
+        self.assertEqual(model.item_embeddings.shape, (80, 8))
+
+    def test_best_epoch(self):
+        """
+        Testing that the best epoch is restored and the other metric
+        """
+        interactions, weights = make_interactions()
+        train, train_weights, validation = split_interactions(
+            interactions, weights, 0.2, random_state=0)
+        # the items users dislike, ranked lower as the model learns
+        disliked, _ = make_interactions(threshold=-1.5)
+        model = LightFM(no_components=8, loss='warp', random_state=0)
+        history = fit_model(model, train, train_weights, epochs=5,
+                            validation=disliked, validation_users=None)
+        self.assertEqual(len(history), 5)
+        self.assertLess(history[-1], max(history))
+        self.assertAlmostEqual(
+            auc_score(model, disliked,
+                      train_interactions=train.tocsr()).mean(),
+            max(history), places=5)
+        model = LightFM(no_components=8, random_state=0)
+        history = fit_model(model, train, train_weights, epochs=2,
+                            validation=validation, metric='precision', k=5)
+        self.assertTrue(all(0 <= p <= 1 for p in history))
+        with self.assertRaises(ValueError):
+            fit_model(model, train, train_weights, validation=validation,
+                      metric='mrr')
+
+    def test_sample_users(self):
+        """
+        Testing that every interaction of the sampled users is kept
+        """
+        interactions, _ = make_interactions()
+        sample = sample_users(interactions, 10, random_state=0)
+        self.assertEqual(sample.shape, interactions.shape)
+        users = np.unique(sample.row)
+        self.assertEqual(len(users), 10)
+        self.assertEqual(sample.nnz, np.isin(interactions.row, users).sum())
+        self.assertEqual(sample_users(interactions, None).nnz,
+                         interactions.nnz)
+
+    def test_split_reviews(self):
+        """
+        Testing that no pair is both trained on and tested
+        """
+        interactions, weights = make_interactions()
+        # every pair reviewed once, 50 of them a second time
+        user_codes = np.r_[interactions.row, interactions.row[:50]]
+        item_codes = np.r_[interactions.col, interactions.col[:50]]
+        ratings = np.r_[weights.data, weights.data[:50]]
+        train_x, test_x = split_reviews(user_codes, item_codes,
+                                        interactions.shape, random_state=0)
+        self.assertEqual(len(train_x) + len(test_x), len(ratings))
+        train, train_weights = build_interactions(
+            user_codes[train_x], item_codes[train_x], ratings[train_x],
+            interactions.shape)
+        test, _ = build_interactions(
+            user_codes[test_x], item_codes[test_x], ratings[test_x],
+            interactions.shape)
+        self.assertEqual(train.tocsr().multiply(test.tocsr()).nnz, 0)
+        self.assertEqual(train.tocsr().nnz + test.tocsr().nnz,
+                         interactions.nnz)
+        model = LightFM(no_components=8, random_state=0)
+        model.fit(train, sample_weight=train_weights, epochs=1)
+        auc_score(model, test, train_interactions=train)
+        model = LightFM(no_components=8, loss='warp', random_state=0)
+        _, test_metrics, _ = evaluate_and_fit(
+            model, user_codes, item_codes, ratings, interactions.shape,
+            epochs=2, refit_epochs=1, random_state=0)
+        self.assertTrue(np.isfinite(test_metrics['mean']).all())
+
+    def test_evaluate_and_fit(self):
+        """
+        Testing that early stopping never sees the testing set, and the
+        refit
+        """
+        interactions, weights = make_interactions()
+        ratings = weights.data
+        _, test_x = split_reviews(interactions.row, interactions.col,
+                                  interactions.shape, random_state=0)
+        tested = sparse.csr_matrix(
+            (np.ones(len(test_x)),
+             (interactions.row[test_x], interactions.col[test_x])),
+            shape=interactions.shape)
+        validations = []
+
+        def spy(model, test, *args, **kwargs):
+            validations.append(sparse.csr_matrix(test))
+            return user_metrics(model, test, *args, **kwargs)
+
+        model = LightFM(no_components=8, loss='warp', random_state=0)
+        with mock.patch('yelpify.training.user_metrics', spy):
+            train_auc, test_metrics, history = evaluate_and_fit(
+                model, interactions.row, interactions.col, ratings,
+                interactions.shape, epochs=3, patience=5, refit_epochs=0,
+                random_state=0)
+        self.assertEqual(len(history), 3)
+        self.assertEqual(len(validations), 3)
+        for validation in validations:
+            self.assertGreater(validation.nnz, 0)
+            self.assertEqual(validation.multiply(tested).nnz, 0)
+        self.assertGreater(train_auc, test_metrics.loc['auc', 'mean'])
+        model = LightFM(no_components=8, loss='warp', random_state=0)
+        self.assertEqual(evaluate_and_fit(
+            model, interactions.row, interactions.col, ratings,
+            interactions.shape, epochs=3, refit_epochs=0,
+            random_state=0)[2], [])
+        evaluated = model.item_embeddings.copy()
+        # a second evaluation with the same split, then a refit
+        model = LightFM(no_components=8, loss='warp', random_state=0)
+        evaluate_and_fit(model, interactions.row, interactions.col, ratings,
+                         interactions.shape, epochs=3, refit_epochs=1,
+                         random_state=0)
+        self.assertFalse(np.array_equal(model.item_embeddings, evaluated))
+        self.assertEqual(model.item_embeddings.shape, (80, 8))
+        # the matrices of every review are reused for the refit
+        model = LightFM(no_components=8, loss='warp', random_state=0)
+        with mock.patch('yelpify.training.build_interactions',
+                        side_effect=build_interactions) as built:
+            evaluate_and_fit(model, interactions.row, interactions.col,
+                             ratings, interactions.shape, epochs=1,
+                             refit_epochs=1, random_state=0,
+                             interactions=interactions, weights=weights)
+        self.assertEqual(built.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
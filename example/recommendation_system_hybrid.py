@@ -18,19 +18,22 @@ sys.path.append('./')
 USER_ID = "avXKk5RYsDWeRgkHv1wfGQ"
 ITEM_ID = "VMPSdoBgJuyS9t_x_caTig"
 
-df = prepare_data_features(raw=False)
+df, category_matrix, category_names = prepare_data_features(
+    raw=False, sparse_categories=True)
 
 model_full, df_interactions, user_dict, item_dict, \
-    user_feature_map, business_feature_map = train_model(
+    user_feature_map, business_feature_map, feature_store = train_model(
         df=df,
         user_id_col='user_id',
         item_id_col='business_id',
         item_name_col='name_business',
-        evaluate=True)
+        evaluate=True,
+        category_matrix=category_matrix,
+        category_names=category_names)
 
 # make prediction for known users
 rec_list_user = recommend_hybrid_user(
-    df=df,
+    df=feature_store,
     model=model_full,
     interactions=df_interactions,
     user_id=USER_ID,
@@ -41,7 +44,7 @@ rec_list_user = recommend_hybrid_user(
 
 # make recommendation for known businesses
 rec_list_item = recommend_hybrid_item(
-    df=df,
+    df=feature_store,
     model=model_full,
     interactions=df_interactions,
     item_id=ITEM_ID,
@@ -52,7 +55,7 @@ rec_list_item = recommend_hybrid_item(
 
 # make recommendation for new users
 rec_list_new_user = recommend_hybrid_new_user(
-    df=df,
+    df=feature_store,
     model=model_full,
     interactions=df_interactions,
     new_user_features=5*np.random.rand(1, 1),
@@ -63,10 +66,11 @@ rec_list_new_user = recommend_hybrid_new_user(
 
 # make recommendation for new businesses
 rec_list_new_item = recommend_hybrid_new_item(
-    df=df,
+    df=feature_store,
     model=model_full,
     interactions=df_interactions,
-    new_item_features=np.random.binomial(1, 0.05, size=(1, 89)),
+    new_item_features=np.random.binomial(
+        1, 0.05, size=(1, len(category_names))),
     user_dict=user_dict,
     item_dict=item_dict,
     topn=10,
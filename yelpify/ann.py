@@ -0,0 +1,247 @@
+"""
+NAME
+    ann
+DESCRIPTION
+    This module provides an approximate maximum inner product index over
+        the item representations of a trained model, to retrieve the best
+        items of a user without scoring the whole catalog.
+CLASSES
+    IVFIndex(n_lists, n_probe, n_iter, random_state)
+        Inverted file index with a k-means coarse quantizer.
+FUNCTIONS
+    recall_report(index, engine, k, n_queries, random_state)
+        Return the recall@k and latency of an index against brute force.
+"""
+
+import time
+
+import numpy as np
+
+from yelpify.ranking import top_k, batch_top_k
+
+DEFAULT_N_PROBE = 8
+DEFAULT_N_ITER = 10
+_BLOCK_SIZE = 4096
+
+
+def _augment(embeddings, biases):
+    """ Map item vectors to a space where the largest inner product with a
+    query [q, 1, 0] is the smallest euclidean distance: the bias is folded
+    into the vector and a last component equalizes the norms.
+    """
+    vectors = np.hstack([embeddings, biases[:, np.newaxis]]).astype(
+        np.float32)
+    norms = np.einsum('ij,ij->i', vectors, vectors)
+    extra = np.sqrt(np.maximum(norms.max() - norms, 0))
+    return np.hstack([vectors, extra[:, np.newaxis]]).astype(np.float32)
+
+
+def _assign(vectors, centroids):
+    """ Return the closest centroid of every vector, block by block. """
+    half_norms = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _BLOCK_SIZE):
+        block = vectors[start:start + _BLOCK_SIZE] @ centroids.T
+        labels[start:start + _BLOCK_SIZE] = np.argmax(
+            block - half_norms, axis=1)
+    return labels
+
+
+def _kmeans(vectors, n_clusters, n_iter, rng):
+    """ Lloyd's k-means; empty clusters are reseeded with random vectors.
+    Returns:
+        The centroids and the label of every vector.
+    """
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)]
+    for _ in range(n_iter):
+        labels = _assign(vectors, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = counts == 0
+        centroids = sums / np.maximum(counts, 1)[:, np.newaxis]
+        centroids[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+    return centroids.astype(np.float32), _assign(vectors, centroids)
+
+
+class IVFIndex:
+    """ Inverted file index for maximum inner product search.
+
+    Items are clustered with k-means once their representations are made
+    comparable by euclidean distance. A query only scores the items of the
+    n_probe lists whose centroids are closest, then ranks them exactly, so
+    the cost grows with n_probe * n_items / n_lists instead of n_items.
+    More probes give a better recall for a higher latency; recall_report
+    measures both.
+
+    Args:
+        n_lists: number of clusters, sqrt(n_items) when None.
+        n_probe: default number of clusters searched by a query.
+        n_iter: number of k-means iterations.
+        random_state: seed of the k-means initialization.
+    """
+
+    def __init__(self, n_lists=None, n_probe=DEFAULT_N_PROBE,
+                 n_iter=DEFAULT_N_ITER, random_state=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.random_state = random_state
+
+    def fit(self, item_biases, item_embeddings):
+        """ Build the index of item representations.
+        Args:
+            item_biases: (n_items,) item biases.
+            item_embeddings: (n_items, no_components) item embeddings.
+        Returns:
+            The IVFIndex.
+        """
+        self.item_biases = np.ascontiguousarray(item_biases,
+                                                dtype=np.float32)
+        self.item_embeddings = np.ascontiguousarray(item_embeddings,
+                                                    dtype=np.float32)
+        n_items = len(self.item_biases)
+        n_lists = self.n_lists or max(int(np.sqrt(n_items)), 1)
+        n_lists = min(n_lists, n_items)
+        vectors = _augment(self.item_embeddings, self.item_biases)
+        rng = np.random.RandomState(self.random_state)
+        centroids, labels = _kmeans(vectors, n_lists, self.n_iter, rng)
+        # items sorted by list, and by index within a list, with their
+        # representations stored in the same order so that a list is read
+        # as one contiguous block
+        self.order = np.argsort(labels, kind='stable').astype(np.int32)
+        self.offsets = np.r_[0, np.cumsum(
+            np.bincount(labels, minlength=n_lists))]
+        self.list_embeddings = self.item_embeddings[self.order]
+        self.list_biases = self.item_biases[self.order]
+        # probing ranks centroids by distance to the augmented query
+        self.centroids = centroids[:, :-1]
+        self.centroid_half_norms = 0.5 * np.einsum(
+            'ij,ij->i', centroids, centroids)
+        return self
+
+    @classmethod
+    def from_engine(cls, engine, **kwargs):
+        """ Build the index of the items of a ScoringEngine or of a LightFM
+        model without item features.
+        """
+        return cls(**kwargs).fit(*engine.get_item_representations())
+
+    def _score_lists(self, lists, query):
+        """ Return the items of some lists and their scores without the
+        user bias.
+        """
+        slices = [slice(self.offsets[x], self.offsets[x + 1])
+                  for x in lists]
+        items = np.concatenate([self.order[s] for s in slices])
+        scores = np.concatenate([
+            self.list_embeddings[s] @ query + self.list_biases[s]
+            for s in slices])
+        return items, scores
+
+    def search(self, user_bias, user_embedding, k, exclude=None,
+               n_probe=None):
+        """ Return the approximately best k items of a query.
+
+        Candidates are scored exactly; more lists are probed while fewer
+        than k candidates are left after exclusion.
+
+        Args:
+            user_bias: bias of the user.
+            user_embedding: (no_components,) embedding of the user.
+            k: number of items to return.
+            exclude: boolean mask of the items that must not be returned.
+            n_probe: number of lists to search, self.n_probe when None.
+        Returns:
+            items: the item indexes, by descending score.
+            scores: their scores.
+        """
+        n_lists = len(self.offsets) - 1
+        n_probe = min(n_probe or self.n_probe, n_lists)
+        query = np.asarray(user_embedding, dtype=np.float32)
+        closeness = (self.centroids[:, :-1] @ query + self.centroids[:, -1]
+                     - self.centroid_half_norms)
+        lists = top_k(closeness, n_lists)
+        while True:
+            candidates, scores = self._score_lists(lists[:n_probe], query)
+            if exclude is not None:
+                kept = ~exclude[candidates]
+                candidates, scores = candidates[kept], scores[kept]
+            if len(candidates) >= k or n_probe >= n_lists:
+                break
+            n_probe = min(2 * n_probe, n_lists)
+        scores += user_bias
+        best = top_k(scores, k)
+        # equal scores are ranked by item index, as top_k does
+        best = best[np.lexsort((candidates[best], -scores[best]))]
+        return candidates[best], scores[best]
+
+    def search_batch(self, user_biases, user_embeddings, k, exclude=None,
+                     n_probe=None):
+        """ Search several queries.
+        Args:
+            user_biases: (n_queries,) biases of the users.
+            user_embeddings: (n_queries, no_components) embeddings.
+            k: number of items to return per query.
+            exclude: sparse (n_queries, n_items) matrix of the items that
+                must not be returned.
+            n_probe: number of lists to search.
+        Returns:
+            items: (n_queries, k) int32 item indexes, -1 when there are
+                fewer.
+            scores: (n_queries, k) float32 scores.
+        """
+        n_queries = len(user_biases)
+        items = np.full((n_queries, k), -1, dtype=np.int32)
+        scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        for i in range(n_queries):
+            mask = None
+            if exclude is not None:
+                mask = exclude[i].toarray().ravel() != 0
+            found, values = self.search(user_biases[i], user_embeddings[i],
+                                        k, mask, n_probe)
+            items[i, :len(found)] = found
+            scores[i, :len(found)] = values
+        return items, scores
+
+
+def recall_report(index, engine, k=10, n_queries=1000, n_probes=None,
+                  random_state=0):
+    """ Measure the recall@k and latency of an index against brute force.
+    Args:
+        index: the fitted IVFIndex.
+        engine: ScoringEngine, or LightFM model without features, whose
+            users are the queries.
+        k: number of items retrieved per query.
+        n_queries: number of users sampled as queries.
+        n_probes: list of n_probe values to report, the index default
+            when None.
+        random_state: seed of the user sample.
+    Returns:
+        List of dictionaries of n_probe, recall and the mean milliseconds
+        per query of the index and of brute force.
+    """
+    user_biases, user_embeddings = engine.get_user_representations()
+    rng = np.random.RandomState(random_state)
+    users = rng.choice(len(user_biases), min(n_queries, len(user_biases)),
+                       replace=False)
+    start = time.perf_counter()
+    exact, _ = batch_top_k(user_biases[users], user_embeddings[users],
+                           index.item_biases, index.item_embeddings, k)
+    exact_ms = 1000 * (time.perf_counter() - start) / len(users)
+    report = []
+    for n_probe in n_probes or [index.n_probe]:
+        start = time.perf_counter()
+        found, _ = index.search_batch(user_biases[users],
+                                      user_embeddings[users], k,
+                                      n_probe=n_probe)
+        ann_ms = 1000 * (time.perf_counter() - start) / len(users)
+        hits = sum(len(np.intersect1d(a[a >= 0], b[b >= 0]))
+                   for a, b in zip(found, exact))
+        recall = hits / max(int((exact >= 0).sum()), 1)
+        print('n_probe {}: recall@{} {:.3f}, {:.3f} ms per query '
+              '(brute force {:.3f} ms)'.format(n_probe, k, recall, ann_ms,
+                                               exact_ms))
+        report.append({'n_probe': n_probe, 'recall': recall,
+                       'ann_ms': ann_ms, 'exact_ms': exact_ms})
+    return report
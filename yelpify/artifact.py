@@ -0,0 +1,273 @@
+"""
+NAME
+    artifact
+DESCRIPTION
+    This module provides access to functions that save a trained model
+        with its lookup tables and load it back for serving.
+CLASSES
+    Artifact(path, manifest, mmap_mode)
+        Trained model and lookup tables read from an artifact directory.
+FUNCTIONS
+    save_artifact(path, model, interactions, user_dict, item_dict,
+        feature_store)
+        Write a new version of an artifact and return its directory.
+
+    load_artifact(path, version, mmap_mode)
+        Return the Artifact of a version, the latest by default.
+
+    list_versions(path)
+        Return the versions of an artifact, oldest first.
+"""
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from yelpify.features import FeatureStore
+from yelpify.id_encoding import IdEncoder, LabelMap
+from yelpify.interactions import InteractionStore
+from yelpify.scoring import ScoringEngine
+
+ARTIFACT_FORMAT = 1
+MODEL_ARRAYS = (
+    'user_embeddings', 'user_embedding_gradients', 'user_embedding_momentum',
+    'user_biases', 'user_bias_gradients', 'user_bias_momentum',
+    'item_embeddings', 'item_embedding_gradients', 'item_embedding_momentum',
+    'item_biases', 'item_bias_gradients', 'item_bias_momentum')
+
+_LATEST_FILE = 'LATEST'
+_MANIFEST_FILE = 'manifest.json'
+_VERSION_PREFIX = 'v'
+
+
+def _save_csr(directory, name, matrix):
+    """ Write the arrays of a sparse matrix and return its shape. """
+    matrix = sparse.csr_matrix(matrix)
+    np.save(os.path.join(directory, name + '_data.npy'), matrix.data)
+    np.save(os.path.join(directory, name + '_indices.npy'), matrix.indices)
+    np.save(os.path.join(directory, name + '_indptr.npy'), matrix.indptr)
+    return list(matrix.shape)
+
+
+def _load_arrays(directory, name, mmap_mode):
+    return tuple(np.load(os.path.join(directory, name + suffix),
+                         mmap_mode=mmap_mode)
+                 for suffix in ('_data.npy', '_indices.npy', '_indptr.npy'))
+
+
+def _load_csr(directory, name, shape, mmap_mode):
+    return sparse.csr_matrix(_load_arrays(directory, name, mmap_mode),
+                             shape=tuple(shape), copy=False)
+
+
+def _load_csc(directory, name, shape, mmap_mode):
+    return sparse.csc_matrix(_load_arrays(directory, name, mmap_mode),
+                             shape=tuple(shape), copy=False)
+
+
+def _model_params(model):
+    """ Return the constructor arguments of a model that json can write;
+    the random state is not kept.
+    """
+    return {key: value for key, value in model.get_params().items()
+            if value is None or isinstance(value, (bool, int, float, str))}
+
+
+def list_versions(path):
+    """ Return the versions written in an artifact directory.
+    Args:
+        path: the artifact directory.
+    Returns:
+        The list of version names, oldest first.
+    """
+    if not os.path.isdir(path):
+        return []
+    versions = [name for name in os.listdir(path)
+                if name.startswith(_VERSION_PREFIX)
+                and name[len(_VERSION_PREFIX):].isdigit()
+                and os.path.exists(os.path.join(path, name, _MANIFEST_FILE))]
+    return sorted(versions, key=lambda name: int(name[len(_VERSION_PREFIX):]))
+
+
+def save_artifact(path, model, interactions, user_dict, item_dict,
+                  feature_store=None):
+    """ Save what train_model returns as a new version of an artifact.
+
+    Each version is a directory of .npy and parquet files, written under
+    a temporary name and renamed once complete, so that readers never see
+    a partial version. The LATEST file then points to it.
+
+    Args:
+        path: the artifact directory.
+        model: the trained LightFM model.
+        interactions: InteractionStore of the model.
+        user_dict: IdEncoder of the users.
+        item_dict: LabelMap of the item names.
+        feature_store: FeatureStore of a hybrid model.
+    Returns:
+        The directory of the new version.
+    """
+    os.makedirs(path, exist_ok=True)
+    versions = list_versions(path)
+    number = int(versions[-1][len(_VERSION_PREFIX):]) + 1 if versions else 1
+    version = '%s%d' % (_VERSION_PREFIX, number)
+    tmp_dir = os.path.join(path, '.%s.%d.tmp' % (version, os.getpid()))
+    os.makedirs(os.path.join(tmp_dir, 'model'))
+    try:
+        for name in MODEL_ARRAYS:
+            np.save(os.path.join(tmp_dir, 'model', name + '.npy'),
+                    np.ascontiguousarray(getattr(model, name)))
+        pd.DataFrame({'id': interactions.users.ids}).to_parquet(
+            os.path.join(tmp_dir, 'users.parquet'), index=False)
+        if isinstance(item_dict, LabelMap):
+            labels = item_dict.labels[
+                item_dict.encoder.lookup(interactions.items.ids)]
+        else:
+            labels = [item_dict.get(item_id)
+                      for item_id in interactions.items]
+        pd.DataFrame({'id': interactions.items.ids,
+                      'label': labels}).to_parquet(
+            os.path.join(tmp_dir, 'items.parquet'), index=False)
+        manifest = {
+            'format': ARTIFACT_FORMAT,
+            'version': version,
+            'created': time.time(),
+            'params': _model_params(model),
+            'interactions': _save_csr(tmp_dir, 'interactions_csr',
+                                      interactions.csr),
+        }
+        _save_csr(tmp_dir, 'interactions_csc', interactions.csc.T)
+        if feature_store is not None:
+            manifest['user_features'] = _save_csr(
+                tmp_dir, 'user_features', feature_store.user_features)
+            manifest['item_features'] = _save_csr(
+                tmp_dir, 'item_features', feature_store.item_features)
+            manifest['user_feature_names'] = [
+                str(name) for name in feature_store.user_feature_names]
+            manifest['item_feature_names'] = [
+                str(name) for name in feature_store.item_feature_names]
+        with open(os.path.join(tmp_dir, _MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+        version_dir = os.path.join(path, version)
+        os.rename(tmp_dir, version_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    latest = os.path.join(path, _LATEST_FILE)
+    with open(latest + '.tmp', 'w') as f:
+        f.write(version)
+    os.replace(latest + '.tmp', latest)
+    print('Saved artifact {}'.format(version_dir))
+    return version_dir
+
+
+class Artifact:
+    """ Trained model and lookup tables of an artifact version.
+
+    Arrays are memory-mapped: loading reads the small id and name tables
+    only, pages of the embeddings are read on first use, and processes
+    loading the same version share one physical copy of them. The default
+    copy-on-write mode keeps the arrays writable, as lightfm requires, and
+    never modifies the files.
+
+    Args:
+        path: the directory of the version.
+        manifest: the content of its manifest.
+        mmap_mode: mode of numpy.load for the arrays.
+    """
+
+    def __init__(self, path, manifest, mmap_mode='c'):
+        self.path = path
+        self.manifest = manifest
+        self.version = manifest['version']
+        self.mmap_mode = mmap_mode
+        self.arrays = {
+            name: np.load(os.path.join(path, 'model', name + '.npy'),
+                          mmap_mode=mmap_mode)
+            for name in MODEL_ARRAYS}
+        users = IdEncoder(pd.read_parquet(
+            os.path.join(path, 'users.parquet'))['id'])
+        items_table = pd.read_parquet(os.path.join(path, 'items.parquet'))
+        items = IdEncoder(items_table['id'])
+        shape = manifest['interactions']
+        self.interactions = InteractionStore.from_matrices(
+            _load_csr(path, 'interactions_csr', shape, mmap_mode),
+            _load_csc(path, 'interactions_csc', shape, mmap_mode),
+            users, items)
+        self.user_dict = users
+        self.item_dict = LabelMap(items, items_table['label'].values)
+        self.feature_store = None
+        if 'user_features' in manifest:
+            self.feature_store = FeatureStore(
+                _load_csr(path, 'user_features', manifest['user_features'],
+                          mmap_mode),
+                _load_csr(path, 'item_features', manifest['item_features'],
+                          mmap_mode),
+                users, items, manifest['user_feature_names'],
+                manifest['item_feature_names'])
+        self._model = None
+        self._engine = None
+
+    @property
+    def engine(self):
+        """ The ScoringEngine of the model, computed from the arrays on
+        first use without importing lightfm; the representations of a
+        model without features are the memory-mapped arrays themselves.
+        """
+        if self._engine is None:
+            user_features = item_features = None
+            if self.feature_store is not None:
+                user_features = self.feature_store.user_features
+                item_features = self.feature_store.item_features
+            self._engine = ScoringEngine.from_arrays(
+                self.arrays['user_biases'], self.arrays['user_embeddings'],
+                self.arrays['item_biases'], self.arrays['item_embeddings'],
+                user_features, item_features)
+            self._engine.version = os.path.abspath(self.path)
+        return self._engine
+
+    @property
+    def model(self):
+        """ The LightFM model, built on first use on top of the
+        memory-mapped arrays.
+        """
+        if self._model is None:
+            from lightfm import LightFM
+            model = LightFM(**self.manifest['params'])
+            for name, array in self.arrays.items():
+                setattr(model, name, array)
+            model.version = os.path.abspath(self.path)
+            self._model = model
+        return self._model
+
+
+def load_artifact(path, version=None, mmap_mode='c'):
+    """ Load a version of an artifact.
+    Args:
+        path: the artifact directory, or the directory of a version.
+        version: the version name, the latest when None.
+        mmap_mode: mode of numpy.load for the arrays, None to read them
+            into memory.
+    Returns:
+        The Artifact.
+    Raises:
+        FileNotFoundError: if there is no such version.
+        ValueError: if the artifact format is not supported.
+    """
+    if version is None and not os.path.exists(
+            os.path.join(path, _MANIFEST_FILE)):
+        with open(os.path.join(path, _LATEST_FILE)) as f:
+            version = f.read().strip()
+    version_dir = path if version is None else os.path.join(path, version)
+    with open(os.path.join(version_dir, _MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        raise ValueError('Unsupported artifact format {}'.format(
+            manifest.get('format')))
+    print('Loading artifact {}'.format(version_dir))
+    return Artifact(version_dir, manifest, mmap_mode)
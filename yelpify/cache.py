@@ -0,0 +1,332 @@
+"""
+NAME
+    cache
+DESCRIPTION
+    This module provides a persistent, content-addressed on-disk cache
+        for the datasets read by data_preparation.
+CLASSES
+    DatasetCache(cache_dir, max_bytes)
+        Parquet cache keyed by source and content fingerprint.
+FUNCTIONS
+    default_cache()
+        Return the cache shared by the whole process.
+    set_default_cache(cache_dir, max_bytes)
+        Replace the cache shared by the whole process.
+    is_remote(source)
+        Return whether the source is an url rather than a local path.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import urllib.request
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: the index is only replaced atomically
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'YELPIFY_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'yelpify'))
+DEFAULT_MAX_BYTES = int(os.environ.get(
+    'YELPIFY_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+
+_INDEX_FILE = 'index.json'
+_LOCK_FILE = 'index.lock'
+_ENTRY_SUFFIX = '.parquet'
+
+
+def is_remote(source):
+    """ Return whether the source is an url rather than a local path.
+    Args:
+        source: url or path of a file.
+    Returns:
+        True if the source has to be downloaded.
+    """
+    return source.startswith(('http://', 'https://', 'ftp://'))
+
+
+class DatasetCache:
+    """ On-disk cache of parsed dataframes.
+
+    Entries are stored as parquet files named after a key derived from the
+    source (url, path or any other identity string) and a fingerprint of its
+    content: the ETag or Last-Modified header for urls, the size and
+    modification time for local files. A small index remembers the latest
+    entry of every source so that the cache can still be used when the
+    fingerprint cannot be computed, e.g. when working offline. The least
+    recently used entries are evicted once the cache grows over max_bytes.
+
+    Args:
+        cache_dir: directory holding the cache entries.
+        max_bytes: maximal total size of the cache entries.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def fingerprint(self, source, timeout=10):
+        """ Compute the content fingerprint of a source.
+        Args:
+            source: url or path of a file.
+            timeout: seconds to wait for the server of a remote source.
+        Returns:
+            The fingerprint string, or None if it cannot be computed.
+        """
+        if not is_remote(source):
+            try:
+                stat = os.stat(source)
+            except OSError:
+                return None
+            return '%d-%d' % (stat.st_size, stat.st_mtime_ns)
+        request = urllib.request.Request(source, method='HEAD')
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                headers = response.headers
+        except (OSError, ValueError):
+            return None
+        validators = [headers.get(name) for name in
+                      ('ETag', 'Last-Modified', 'Content-Length')]
+        validators = [v for v in validators if v]
+        if not validators:
+            return None
+        return '|'.join(validators)
+
+    def key(self, source, fingerprint):
+        """ Derive the cache key of a source.
+        Args:
+            source: url, path or identity string of the entry.
+            fingerprint: content fingerprint of the entry.
+        Returns:
+            The hexadecimal key string.
+        """
+        digest = hashlib.sha256()
+        digest.update(source.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update((fingerprint or '').encode('utf-8'))
+        return digest.hexdigest()[:32]
+
+    def path(self, key):
+        """ Return the file path of the entry with the given key. """
+        return os.path.join(self.cache_dir, key + _ENTRY_SUFFIX)
+
+    def load(self, key):
+        """ Read an entry from the cache.
+        Args:
+            key: the cache key.
+        Returns:
+            The cached dataframe, or None on a cache miss.
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except (ImportError, OSError, ValueError):
+            return None
+        # record the access for least recently used eviction
+        os.utime(path)
+        return df
+
+    def store(self, key, df, source=None):
+        """ Write an entry into the cache and evict old entries if needed.
+        Args:
+            key: the cache key.
+            df: the dataframe to be stored.
+            source: the source of the entry, recorded in the index.
+        Returns:
+            Whether the dataframe could be stored.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            df.to_parquet(tmp_path, index=False)
+        except (ImportError, TypeError, ValueError) as err:
+            print('Not caching {}: {}'.format(source or key, err))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, path)
+        if source is not None:
+            self._update_index(lambda index: index.update({source: key}))
+        self.evict(keep=key)
+        return True
+
+    def latest(self, source):
+        """ Return the key of the latest entry stored for a source. """
+        return self._read_index().get(source)
+
+    def fetch(self, source, read, fingerprint=None):
+        """ Return the dataframe of a source, reading it only on a miss.
+        Args:
+            source: url, path or identity string of the entry.
+            read: function without arguments returning the dataframe.
+            fingerprint: content fingerprint of the source; None when it is
+                unknown, in which case the latest entry of the source is used.
+        Returns:
+            The dataframe.
+        """
+        if fingerprint is None:
+            key = self.latest(source)
+        else:
+            key = self.key(source, fingerprint)
+        if key is not None:
+            df = self.load(key)
+            if df is not None:
+                return df
+        df = read()
+        self.store(self.key(source, fingerprint), df, source=source)
+        return df
+
+    def fetch_file(self, source, write, fingerprint=None):
+        """ Return the path of the parquet entry of a source, writing it
+        only on a miss. Unlike fetch, the entry is written by write itself,
+        such as chunk by chunk, and never read into memory.
+        Args:
+            source: url, path or identity string of the entry.
+            write: function writing the parquet file at the path it is
+                given.
+            fingerprint: content fingerprint of the source; None when it is
+                unknown, in which case the latest entry of the source is used.
+        Returns:
+            The path of the entry.
+        """
+        key = self.latest(source) if fingerprint is None else \
+            self.key(source, fingerprint)
+        if key is not None and os.path.exists(self.path(key)):
+            # record the access for least recently used eviction
+            os.utime(self.path(key))
+            return self.path(key)
+        key = self.key(source, fingerprint)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            write(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        self._update_index(lambda index: index.update({source: key}))
+        self.evict(keep=key)
+        return path
+
+    def seed(self, source, df, fingerprint=None):
+        """ Pre-seed the cache with an already parsed dataframe.
+        Args:
+            source: url, path or identity string of the entry.
+            df: the dataframe of the source.
+            fingerprint: content fingerprint of the source, if known.
+        """
+        self.store(self.key(source, fingerprint), df, source=source)
+
+    def size(self):
+        """ Return the total size in bytes of the cache entries. """
+        return sum(os.path.getsize(path) for path in self._entries())
+
+    def evict(self, keep=None):
+        """ Delete the least recently used entries until the cache fits
+        in max_bytes.
+        Args:
+            keep: key of an entry never deleted, such as the one just
+                written.
+        """
+        total = self.size()
+        entries = sorted(
+            (path for path in self._entries()
+             if keep is None or path != self.path(keep)),
+            key=os.path.getmtime)
+        evicted = set()
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+            evicted.add(os.path.basename(path)[:-len(_ENTRY_SUFFIX)])
+        if evicted:
+            def forget(index):
+                for source, key in list(index.items()):
+                    if key in evicted:
+                        del index[source]
+
+            self._update_index(forget)
+
+    def clear(self):
+        """ Delete every entry of the cache. """
+        for path in self._entries():
+            os.remove(path)
+        self._update_index(dict.clear)
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, name)
+                for name in os.listdir(self.cache_dir)
+                if name.endswith(_ENTRY_SUFFIX)]
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, _INDEX_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        path = os.path.join(self.cache_dir, _INDEX_FILE)
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+
+    def _update_index(self, update):
+        """ Modify the index in place with update, under an exclusive
+        lock of the cache directory, so that the processes sharing it do
+        not lose each other's entries. """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, _LOCK_FILE), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index = self._read_index()
+                update(index)
+                self._write_index(index)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """ Return the cache shared by the whole process.
+    Returns:
+        The DatasetCache configured by YELPIFY_CACHE_DIR and
+        YELPIFY_CACHE_MAX_BYTES.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = DatasetCache()
+    return _default_cache
+
+
+def set_default_cache(cache_dir=DEFAULT_CACHE_DIR,
+                      max_bytes=DEFAULT_MAX_BYTES):
+    """ Replace the cache shared by the whole process.
+    Args:
+        cache_dir: directory holding the cache entries.
+        max_bytes: maximal total size of the cache entries.
+    Returns:
+        The new default DatasetCache.
+    """
+    global _default_cache
+    _default_cache = DatasetCache(cache_dir, max_bytes)
+    return _default_cache
@@ -5,82 +5,160 @@ DESCRIPTION
     This module provides access to functions that prepare data
         and generate features as needed.
 FUNCTIONS
-    get_input(url)
+    get_input(url, cache, n_workers)
         Return the dataframe as downloaded from the url.
 
-    prepare_data(raw, round_ratings)
+    prepare_data(raw, round_ratings, data_dir, cache, chunksize, n_workers,
+        lazy)
         Return the joined and cleaned dataset.
 
     round_of_rating(number)
         Return the number as rounded to the closest half integer
 
-    prepare_data_features(raw, round_ratings)
+    prepare_data_features(raw, round_ratings, data_dir, cache,
+        sparse_categories, n_buckets)
         Prepare data features
 
     feature_matrix(df, user_id, item_id)
         Generate feature matrix
 """
 
+import os
+import shutil
+import tempfile
+import urllib.request
+
 import pandas as pd
 import numpy as np
 from scipy import sparse
 
+from yelpify.cache import default_cache, is_remote
+from yelpify.features import encode_categories, MIN_CATEGORY_FREQUENCY
+from yelpify.id_encoding import categorize_ids
+from yelpify.ingest import stream_raw_join, read_json_parallel, \
+    DEFAULT_CHUNKSIZE
 
-def get_input(url):
-    """ Utility function to get file from url and read into a dataframe.
-    Args:
-        url: the dropbox link from which to download the raw or cleaned data.
-    Returns:
-        The dataframe.
-    """
+REVIEW_URL = ('https://www.dropbox.com/s/mtln9b6udoydn2h/'
+              'yelp_academic_dataset_review_sample.csv?dl=1')
+USER_URL = ('https://www.dropbox.com/s/pngrptljotqm4ds/'
+            'yelp_academic_dataset_user.json?dl=1')
+BUSINESS_URL = ('https://www.dropbox.com/s/w0wy854u5swrhmc/'
+                'yelp_academic_dataset_business.json?dl=1')
+SAMPLE_URL = ('https://www.dropbox.com/s/sj445d95lljuc4p/'
+              'small_sample.parquet?dl=1')
+
+
+def _read_input(url, n_workers=None):
     if '.csv' in url:
         return pd.read_csv(url)
     elif '.json' in url:
-        return pd.read_json(url, lines=True)
+        if n_workers == 1:
+            return pd.read_json(url, lines=True)
+        if not is_remote(url):
+            return read_json_parallel(url, n_workers=n_workers)
+        # byte ranges can only be parsed in parallel from a local copy
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'input.json')
+            with urllib.request.urlopen(url) as response, \
+                    open(path, 'wb') as f:
+                shutil.copyfileobj(response, f)
+            return read_json_parallel(path, n_workers=n_workers)
     elif '.parquet' in url:
         return pd.read_parquet(url)
     else:
         raise NotImplementedError("File type not supported")
 
 
-def prepare_data(raw=False, round_ratings=False):
+def _source(url, data_dir):
+    """ Return the local copy of url in data_dir if asked for one. """
+    if data_dir is None:
+        return url
+    return os.path.join(data_dir, os.path.basename(url).split('?')[0])
+
+
+def get_input(url, cache=None, n_workers=None):
+    """ Utility function to get file from url and read into a dataframe.
+    Args:
+        url: the dropbox link or the local path from which to read
+            the raw or cleaned data.
+        cache: the DatasetCache to read from and write to, None to use
+            the default cache and False to always download and parse.
+        n_workers: number of processes parsing a json file, None for
+            one per cpu.
+    Returns:
+        The dataframe.
+    """
+    if cache is False:
+        return _read_input(url, n_workers)
+    if cache is None:
+        cache = default_cache()
+    return cache.fetch(url, lambda: _read_input(url, n_workers),
+                       cache.fingerprint(url))
+
+
+def prepare_data(raw=False, round_ratings=False, data_dir=None, cache=None,
+                 chunksize=DEFAULT_CHUNKSIZE, n_workers=None, lazy=False):
     """ Download and read the dataset.
     Args:
         raw: whether to download raw data or to download cleaned data.
         round_ratings: whether to perform round of ratings.
+        data_dir: directory holding local copies of the input files,
+            read instead of downloading them.
+        cache: the DatasetCache to use, None for the default cache and
+            False to disable caching.
+        chunksize: number of raw reviews joined at a time; json dumps
+            parsed by several processes are split into byte ranges of
+            about chunksize lines, see ingest.read_chunks.
+        n_workers: number of processes parsing local json dumps, None
+            for one per cpu.
+        lazy: with raw, whether to return the path of the joined parquet
+            file in the cache instead of reading it, to be iterated by
+            ingest.read_batches in bounded memory; its ids are not
+            categorical and its ratings not rounded.
     Returns:
-        the cleaned dataframe.
+        the cleaned dataframe, or the path of its parquet file if lazy.
     """
     print('Downloading input data...')
+    if cache is None:
+        cache = default_cache()
     if raw:
-        # read data
-        review = get_input(
-            'https://www.dropbox.com/s/mtln9b6udoydn2h/yelp_academic \
-            _dataset_review_sample.csv?dl=1')
-        user = get_input(
-            'https://www.dropbox.com/s/pngrptljotqm4ds/yelp_academic \
-            _dataset_user.json?dl=1')
-        business = get_input(
-            'https://www.dropbox.com/s/w0wy854u5swrhmc/yelp_academic \
-            _dataset_business.json?dl=1')
-
-        # join datasets
-        review_user = pd.merge(
-            review, user, on="user_id",
-            how="left", suffixes=("", "_user"))
-        review_user_business = pd.merge(
-            review_user, business, on="business_id",
-            how="left", suffixes=("", "_business"))
-        review_user_business = review_user_business[[
-            'user_id', 'business_id',
-            'stars', 'text',
-            'name', 'average_stars',
-            'name_business', 'stars_business',
-            'categories', 'state', 'city']]
+        sources = [_source(url, data_dir)
+                   for url in (REVIEW_URL, USER_URL, BUSINESS_URL)]
+
+        def write_raw(path):
+            # join the dumps chunk by chunk, straight into the parquet
+            # file, to bound memory usage
+            stream_raw_join(*sources, path, chunksize=chunksize,
+                            n_workers=n_workers, decode_ids=True)
+
+        if cache is False:
+            if lazy:
+                raise ValueError('A lazy read needs a cache to hold the '
+                                 'joined file')
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'review_user_business.parquet')
+                write_raw(path)
+                review_user_business = pd.read_parquet(path)
+        else:
+            # the join itself is the cache entry, so that a warm start
+            # skips the merges and the joined dataframe is never cached
+            # again from memory
+            fingerprints = [cache.fingerprint(s) for s in sources]
+            fingerprint = None
+            if None not in fingerprints:
+                fingerprint = '|'.join(fingerprints)
+            path = cache.fetch_file('prepare_data:' + '|'.join(sources),
+                                    write_raw, fingerprint)
+            if lazy:
+                return path
+            review_user_business = pd.read_parquet(path)
+    elif lazy:
+        raise ValueError('Only the raw dumps can be read lazily')
     else:
         review_user_business = get_input(
-            'https://www.dropbox.com/s/sj445d95lljuc4p/small_sample.parquet?dl=1'
-            )
+            _source(SAMPLE_URL, data_dir), cache)
+    # ids are dictionary encoded once, here, for the whole pipeline
+    review_user_business = categorize_ids(review_user_business)
     if round_ratings:
         # bucketize numeric features to reduce dimensions
         review_user_business['average_stars'] = review_user_business[
@@ -109,20 +187,45 @@ def round_of_rating(number):
     return round(number * 2) / 2
 
 
-def prepare_data_features(raw=False, round_ratings=False):
+def prepare_data_features(raw=False, round_ratings=False, data_dir=None,
+                          cache=None, sparse_categories=False, n_buckets=0):
     """ Download, read and modify the dataset.
+
+    Categories are tokenized once per business; those of more than 1% of
+    the reviews are kept, and the rarer ones are hashed into n_buckets
+    columns or dropped.
+
     Args:
         raw: whether to download raw data or to download cleaned data.
         round_ratings: whether to perform round of ratings.
+        data_dir: directory holding local copies of the input files.
+        cache: the DatasetCache to use, None for the default cache and
+            False to disable caching.
+        sparse_categories: whether to return the categories as a sparse
+            matrix by business code instead of one column per category;
+            the columns hold a dense row for every review and are kept
+            for the dataframe recommenders, the sparse matrix is the one
+            to train on large datasets, see model_hybrid.train_model.
+        n_buckets: number of columns the rarer categories are hashed into.
     Returns:
-        the modified dataframe.
+        the modified dataframe, and if sparse_categories the CSR category
+        matrix by business code and the names of its columns.
     """
-    df = prepare_data(raw=False)
+    df = prepare_data(raw=False, data_dir=data_dir, cache=cache)
     print("prepare features")
-    df_categories = df['categories'].str.get_dummies(sep=", ")
-    df_categories = df_categories[df_categories.columns[
-        df_categories.sum() > len(df)*0.01]]
-    df = pd.concat([df.drop('categories', 1), df_categories], axis=1)
+    # business codes are the rows of the category matrix
+    df['business_id'] = df['business_id'].cat.remove_unused_categories()
+    category_matrix, encoder = encode_categories(
+        df, MIN_CATEGORY_FREQUENCY, n_buckets)
+    df = df.drop(columns='categories')
+    if sparse_categories:
+        print("end prepare features")
+        return df, category_matrix, encoder.feature_names
+    codes = df['business_id'].cat.codes.values
+    df_categories = pd.DataFrame(
+        category_matrix[codes].toarray().astype(np.int64),
+        columns=encoder.feature_names, index=df.index)
+    df = pd.concat([df, df_categories], axis=1)
     print("end prepare features")
     return df
 
@@ -141,7 +244,7 @@ def feature_matrix(df, user_id=None, item_id=None):
     df1 = df.drop_duplicates(subset=['user_id'], keep='first', inplace=False)
     user_x = None
     if user_id is not None:
-        user_x = int(np.argwhere(df1['user_id'].values == user_id))
+        user_x = int(np.argwhere(df1['user_id'].values == user_id)[0, 0])
     user_features = df1[['average_stars']].values
     csr_user_features = sparse.csr_matrix(user_features)
 
@@ -151,7 +254,7 @@ def feature_matrix(df, user_id=None, item_id=None):
         inplace=False)
     item_x = None
     if item_id is not None:
-        item_x = int(np.argwhere(df2['business_id'].values == item_id))
+        item_x = int(np.argwhere(df2['business_id'].values == item_id)[0, 0])
     item_features = df2.iloc[:, 10:].values
 
     csr_item_features = sparse.csr_matrix(item_features)
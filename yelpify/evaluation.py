@@ -0,0 +1,245 @@
+"""
+NAME
+    evaluation
+DESCRIPTION
+    This module provides access to functions that measure the ranking
+        quality of a trained model on held-out interactions, from its
+        user and item representations.
+FUNCTIONS
+    user_sample(test, n_users, strata, random_state)
+        Return a uniform or stratified sample of the users of a test set.
+
+    user_metrics(model, test, train, k, users, user_features,
+        item_features, block_size, n_jobs)
+        Return the precision@k, recall@k, NDCG@k, AP and AUC of every user.
+
+    summarize(metrics, confidence)
+        Return the mean of every metric with its confidence interval.
+
+    evaluate(model, test, train, k, n_users, strata, confidence,
+        random_state, user_features, item_features, block_size, n_jobs)
+        Return the summary of the metrics of a sample of users.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse, stats
+
+from yelpify.scoring import ScoringEngine
+
+METRICS = ('precision', 'recall', 'ndcg', 'map', 'auc')
+DEFAULT_K = 10
+DEFAULT_BLOCK_BYTES = 32 * 2 ** 20
+DEFAULT_N_JOBS = 2
+DEFAULT_CONFIDENCE = 0.95
+
+
+def _engine(model, user_features=None, item_features=None):
+    """ Return the ScoringEngine of a LightFM model or engine. """
+    if isinstance(model, ScoringEngine):
+        return model
+    return ScoringEngine.from_arrays(
+        model.user_biases, model.user_embeddings, model.item_biases,
+        model.item_embeddings, user_features, item_features)
+
+
+def _ranking_metrics(ranks, rows, counts, n_candidates, k):
+    """ Return the metrics of users from the ranks of their positives.
+    Args:
+        ranks: number of candidate items scored above every positive.
+        rows: user row of every positive, in increasing order.
+        counts: number of positives of every user.
+        n_candidates: number of items ranked for every user.
+        k: cutoff of the precision, recall and NDCG.
+    Returns:
+        The (n_users, len(METRICS)) array of the metrics.
+    """
+    n_rows = len(counts)
+    ranks = ranks[np.lexsort((ranks, rows))]
+    # position of every positive among the positives of its user; tied
+    # positives are ranked after each other
+    position = np.arange(len(ranks)) - np.repeat(np.cumsum(counts) - counts,
+                                                 counts)
+    ranks = np.maximum(ranks, position)
+    hits = ranks < k
+    n_hits = np.bincount(rows, weights=hits, minlength=n_rows)
+    dcg = np.bincount(rows, weights=hits / np.log2(ranks + 2),
+                      minlength=n_rows)
+    ideal = np.cumsum(1 / np.log2(np.arange(k) + 2))
+    average_precision = np.bincount(
+        rows, weights=(position + 1) / (ranks + 1), minlength=n_rows)
+    negatives_above = np.bincount(rows, weights=ranks - position,
+                                  minlength=n_rows)
+    n_negatives = n_candidates - counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        auc = np.where(n_negatives > 0,
+                       1 - negatives_above / (counts * n_negatives), np.nan)
+    return np.column_stack([n_hits / k, n_hits / counts,
+                            dcg / ideal[np.minimum(counts, k) - 1],
+                            average_precision / counts, auc])
+
+
+def user_sample(test, n_users=None, strata=None, random_state=None):
+    """ Sample the users of a test set.
+
+    With strata, every stratum of users, such as a range of activity, is
+    sampled in proportion to its size, with at least one user, so that
+    small strata are represented.
+
+    Args:
+        test: interaction matrix of the test set.
+        n_users: number of users sampled, every user with test
+            interactions when None.
+        strata: array of the stratum of every user, by user code.
+        random_state: seed of the sample.
+    Returns:
+        The sorted codes of the sampled users.
+    """
+    candidates = np.flatnonzero(sparse.csr_matrix(test).getnnz(axis=1))
+    if n_users is None or n_users >= len(candidates):
+        return candidates
+    rng = np.random.RandomState(random_state)
+    if strata is None:
+        return np.sort(rng.choice(candidates, n_users, replace=False))
+    _, groups, sizes = np.unique(np.asarray(strata)[candidates],
+                                 return_inverse=True, return_counts=True)
+    quotas = np.minimum(np.maximum(np.round(
+        n_users * sizes / len(candidates)).astype(int), 1), sizes)
+    return np.sort(np.concatenate([
+        rng.choice(candidates[groups == group], quota, replace=False)
+        for group, quota in enumerate(quotas)]))
+
+
+def user_metrics(model, test, train=None, k=DEFAULT_K, users=None,
+                 user_features=None, item_features=None, block_size=None,
+                 n_jobs=DEFAULT_N_JOBS):
+    """ Compute the ranking metrics of every user of a test set.
+
+    Every item is scored for a block of users with one matrix product, the
+    items of train are excluded, and the rank of every test interaction
+    among the remaining items gives all the metrics at once: precision@k,
+    recall@k, NDCG@k, average precision (whose mean is the MAP) and AUC,
+    as lightfm.evaluation computes the AUC with train_interactions; test
+    interactions also in train are dropped first. Blocks are processed by
+    n_jobs threads, as NumPy releases the GIL while multiplying and
+    comparing, and every thread holds a block of scores of every item, so
+    the default block size keeps that block within DEFAULT_BLOCK_BYTES.
+
+    Args:
+        model: ScoringEngine, or LightFM model.
+        test: interaction matrix of the test set.
+        train: interaction matrix of the items not to be ranked, such as
+            the training set.
+        k: cutoff of the precision, recall and NDCG.
+        users: codes of the users evaluated, every user with test
+            interactions when None; users without any are skipped.
+        user_features: user feature matrix of a hybrid LightFM model.
+        item_features: item feature matrix of a hybrid LightFM model.
+        block_size: number of users scored at once, sized from the number
+            of items when None.
+        n_jobs: number of threads, DEFAULT_N_JOBS when None.
+    Returns:
+        DataFrame of the METRICS columns, indexed by user code.
+    """
+    engine = _engine(model, user_features, item_features)
+    test = sparse.csr_matrix(test, copy=True)
+    test.eliminate_zeros()
+    if train is not None:
+        train = sparse.csr_matrix(train, copy=True)
+        train.eliminate_zeros()
+        # a positive also in train is excluded from the ranking, it must not
+        # be counted as missed
+        test = test - test.multiply(train.astype(bool))
+        test.eliminate_zeros()
+    n_positives = test.getnnz(axis=1)
+    if users is None:
+        users = np.flatnonzero(n_positives)
+    else:
+        users = np.asarray(users)
+        users = users[n_positives[users] > 0]
+    item_embeddings_t = np.ascontiguousarray(engine.item_embeddings.T)
+    if block_size is None:
+        block_size = max(1, DEFAULT_BLOCK_BYTES // (
+            item_embeddings_t.itemsize * max(engine.n_items, 1)))
+    metrics = np.empty((len(users), len(METRICS)))
+
+    def run(start):
+        rows = users[start:start + block_size]
+        n_rows = len(rows)
+        # the user bias does not change the order of the items of a user
+        scores = engine.user_embeddings[rows] @ item_embeddings_t
+        scores += engine.item_biases
+        n_candidates = np.full(n_rows, engine.n_items)
+        if train is not None:
+            seen = train[rows]
+            n_seen = np.diff(seen.indptr)
+            scores[np.repeat(np.arange(n_rows), n_seen), seen.indices] = \
+                -np.inf
+            n_candidates -= n_seen
+        positives = test[rows]
+        counts = np.diff(positives.indptr)
+        positive_rows = np.repeat(np.arange(n_rows), counts)
+        positive_scores = scores[positive_rows, positives.indices]
+        ranks = np.empty(len(positive_rows), dtype=np.int64)
+        for chunk in range(0, len(ranks), block_size):
+            part = slice(chunk, chunk + block_size)
+            ranks[part] = np.count_nonzero(
+                scores[positive_rows[part]] > positive_scores[part, None],
+                axis=1)
+        metrics[start:start + n_rows] = _ranking_metrics(
+            ranks, positive_rows, counts, n_candidates, k)
+
+    with ThreadPoolExecutor(max_workers=n_jobs or DEFAULT_N_JOBS) as pool:
+        list(pool.map(run, range(0, len(users), block_size)))
+    return pd.DataFrame(metrics, index=pd.Index(users, name='user'),
+                        columns=list(METRICS))
+
+
+def summarize(metrics, confidence=DEFAULT_CONFIDENCE):
+    """ Average the metrics of users.
+    Args:
+        metrics: DataFrame of the metrics of every user, see user_metrics.
+        confidence: level of the confidence intervals, from the normal
+            approximation of the mean.
+    Returns:
+        DataFrame indexed by metric, of the mean, low and high bounds of
+        the confidence interval, and number of users.
+    """
+    mean = metrics.mean()
+    n_users = metrics.count()
+    margin = (stats.norm.ppf(0.5 + confidence / 2) * metrics.std()
+              / np.sqrt(n_users))
+    return pd.DataFrame({'mean': mean, 'low': mean - margin,
+                         'high': mean + margin, 'n_users': n_users})
+
+
+def evaluate(model, test, train=None, k=DEFAULT_K, n_users=None,
+             strata=None, confidence=DEFAULT_CONFIDENCE, random_state=None,
+             user_features=None, item_features=None, block_size=None,
+             n_jobs=DEFAULT_N_JOBS):
+    """ Evaluate a model on a sample of the users of a test set.
+    Args:
+        model: ScoringEngine, or LightFM model.
+        test: interaction matrix of the test set.
+        train: interaction matrix of the items not to be ranked.
+        k: cutoff of the precision, recall and NDCG.
+        n_users: number of users sampled, every user when None.
+        strata: array of the stratum of every user, by user code, for a
+            stratified sample.
+        confidence: level of the confidence intervals.
+        random_state: seed of the sample.
+        user_features: user feature matrix of a hybrid LightFM model.
+        item_features: item feature matrix of a hybrid LightFM model.
+        block_size: number of users scored at once, sized from the number
+            of items when None.
+        n_jobs: number of threads, DEFAULT_N_JOBS when None.
+    Returns:
+        The summary DataFrame of the metrics, see summarize.
+    """
+    users = user_sample(test, n_users, strata, random_state)
+    print('Evaluating {} users...'.format(len(users)))
+    metrics = user_metrics(model, test, train, k, users, user_features,
+                           item_features, block_size, n_jobs)
+    return summarize(metrics, confidence)
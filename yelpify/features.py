@@ -0,0 +1,367 @@
+"""
+NAME
+    features
+DESCRIPTION
+    This module provides the user and item feature matrices of the hybrid
+        model, built once at training time and shared by the recommenders.
+CLASSES
+    FeatureStore(user_features, item_features, users, items,
+        user_feature_names, item_feature_names)
+        Sparse user and item feature matrices labelled by id.
+    CategoryEncoder(min_frequency, n_buckets, sep)
+        Sparse encoder of the comma separated business categories.
+FUNCTIONS
+    build_features(encoder, ids, values)
+        Return the identity and feature block matrix of users or items.
+
+    build_user_features(df, encoder, columns, user_id_col)
+        Return the user feature matrix of a review dataframe.
+
+    build_item_features(df, encoder, columns, item_id_col)
+        Return the item feature matrix of a review dataframe.
+
+    build_category_features(encoder, category_matrix, item_codes)
+        Return the item feature matrix of a category matrix by code.
+
+    encode_categories(df, min_frequency, n_buckets, item_id_col)
+        Return the category matrix of the businesses, by business code.
+"""
+
+import zlib
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from yelpify.id_encoding import IdEncoder
+
+MIN_CATEGORY_FREQUENCY = 0.01
+
+
+def _feature_rows(values, n_ids, n_columns):
+    """ Place feature values after the identity block of a feature matrix.
+    Args:
+        values: (n, n_features) array or sparse matrix of feature values.
+        n_ids: width of the identity block.
+        n_columns: width of the feature matrix.
+    Returns:
+        The (n, n_columns) CSR matrix, with no identity feature set.
+    """
+    values = sparse.csr_matrix(values, dtype=np.float32)
+    if values.shape[1] > n_columns - n_ids:
+        raise ValueError("Expected at most {} features, got {}".format(
+            n_columns - n_ids, values.shape[1]))
+    return sparse.csr_matrix(
+        (values.data, values.indices + n_ids, values.indptr),
+        shape=(values.shape[0], n_columns))
+
+
+def build_features(encoder, ids, values):
+    """ Build a feature matrix as lightfm.data.Dataset.build_user_features
+    and build_item_features do, with matrix operations instead of one
+    dictionary of features per row.
+    Args:
+        encoder: IdEncoder of the users or items, by row.
+        ids: array of the ids whose features are given.
+        values: (len(ids), n_features) array or sparse matrix of feature
+            values; the values of repeated ids are summed.
+    Returns:
+        The float32 CSR (len(encoder), len(encoder) + n_features) matrix
+        of the identity block followed by the features.
+    """
+    n_ids = len(encoder)
+    rows = encoder.lookup(ids)
+    values = sparse.coo_matrix(values, dtype=np.float32)
+    feature_block = sparse.csr_matrix(
+        (values.data, (rows[values.row], values.col)),
+        shape=(n_ids, values.shape[1]))
+    return sparse.hstack(
+        [sparse.identity(n_ids, dtype=np.float32, format='csr'),
+         feature_block], format='csr')
+
+
+def build_user_features(df, encoder, columns=('average_stars',),
+                        user_id_col='user_id'):
+    """ Build the user feature matrix from the first review of each user.
+    Args:
+        df: the review dataframe.
+        encoder: IdEncoder of the users.
+        columns: the user feature columns.
+        user_id_col: user id column.
+    Returns:
+        The CSR user feature matrix, see build_features.
+    """
+    users = df.drop_duplicates(user_id_col)
+    return build_features(encoder, users[user_id_col].values,
+                          users[list(columns)].values.astype(np.float32))
+
+
+def build_item_features(df, encoder, columns, item_id_col='business_id'):
+    """ Build the item feature matrix from the first review of each item.
+    Args:
+        df: the review dataframe.
+        encoder: IdEncoder of the items.
+        columns: the item feature columns, such as category indicators.
+        item_id_col: item id column.
+    Returns:
+        The CSR item feature matrix, see build_features.
+    """
+    items = df.drop_duplicates(item_id_col)
+    return build_features(encoder, items[item_id_col].values,
+                          items[list(columns)].values.astype(np.float32))
+
+
+def build_category_features(encoder, category_matrix, item_codes=None):
+    """ Build the item feature matrix from a category matrix by item code,
+    such as the one of encode_categories.
+    Args:
+        encoder: IdEncoder of the items.
+        category_matrix: sparse (len(encoder), n_features) matrix.
+        item_codes: codes of the items whose features are given, every
+            item when None.
+    Returns:
+        The CSR item feature matrix, see build_features.
+    """
+    category_matrix = sparse.csr_matrix(category_matrix, dtype=np.float32)
+    if item_codes is not None:
+        present = np.zeros(len(encoder), dtype=np.float32)
+        present[item_codes] = 1
+        category_matrix = sparse.diags(present) @ category_matrix
+    return sparse.hstack(
+        [sparse.identity(len(encoder), dtype=np.float32, format='csr'),
+         category_matrix], format='csr')
+
+
+def _extend_features(features, n_ids, encoder, ids, values):
+    """ Return a feature matrix with rows and identity columns for the ids
+    of encoder past the first n_ids, keeping the features of the others.
+    Args:
+        features: the (n_ids, n_ids + n_features) feature matrix.
+        n_ids: the number of ids of features.
+        encoder: IdEncoder of the known and new ids.
+        ids: array of new ids whose features are given.
+        values: (len(ids), n_features) array or sparse matrix of their
+            feature values.
+    Returns:
+        The CSR (len(encoder), len(encoder) + n_features) matrix.
+    """
+    feature_block = sparse.csr_matrix(features, dtype=np.float32)[:, n_ids:]
+    feature_block.resize(len(encoder), feature_block.shape[1])
+    if values is not None and len(ids):
+        if values.shape[1] != feature_block.shape[1]:
+            raise ValueError("Expected {} features, got {}".format(
+                feature_block.shape[1], values.shape[1]))
+        feature_block = feature_block + build_features(
+            encoder, ids, values)[:, len(encoder):]
+    return sparse.hstack(
+        [sparse.identity(len(encoder), dtype=np.float32, format='csr'),
+         feature_block], format='csr')
+
+
+class FeatureStore:
+    """ User and item feature matrices of a hybrid model.
+
+    Rows are the codes of the users and items, as in the InteractionStore
+    of the model, and columns are the identity block followed by the named
+    features, as lightfm.data.Dataset builds them. The recommenders read
+    rows by id in O(1) instead of rebuilding the matrices from the review
+    dataframe at every call.
+
+    Args:
+        user_features: sparse (n_users, n_users + n_features) matrix.
+        item_features: sparse (n_items, n_items + n_features) matrix.
+        users: IdEncoder of the user ids, by row.
+        items: IdEncoder of the item ids, by row.
+        user_feature_names: names of the user features, by column after
+            the identity block.
+        item_feature_names: names of the item features, by column after
+            the identity block.
+    """
+
+    def __init__(self, user_features, item_features, users, items,
+                 user_feature_names=(), item_feature_names=()):
+        self.user_features = sparse.csr_matrix(
+            user_features, dtype=np.float32)
+        self.item_features = sparse.csr_matrix(
+            item_features, dtype=np.float32)
+        self.users = users
+        self.items = items
+        self.user_feature_names = list(user_feature_names)
+        self.item_feature_names = list(item_feature_names)
+
+    @property
+    def user_feature_map(self):
+        """ Dictionary of user id or feature name to column. """
+        names = list(self.users) + self.user_feature_names
+        return dict(zip(names, range(len(names))))
+
+    @property
+    def item_feature_map(self):
+        """ Dictionary of item id or feature name to column. """
+        names = list(self.items) + self.item_feature_names
+        return dict(zip(names, range(len(names))))
+
+    def extend(self, users, items, user_ids=(), user_values=None,
+               item_ids=(), item_values=None):
+        """ Return the store of more users and items, such as those of new
+        reviews, keeping the features of the known ones.
+        Args:
+            users: IdEncoder of the users, starting with the known ones.
+            items: IdEncoder of the items, starting with the known ones.
+            user_ids: array of new users whose features are given.
+            user_values: (len(user_ids), n_user_features) feature values.
+            item_ids: array of new items whose features are given.
+            item_values: (len(item_ids), n_item_features) feature values.
+        Returns:
+            The FeatureStore.
+        """
+        return FeatureStore(
+            _extend_features(self.user_features, len(self.users), users,
+                             user_ids, user_values),
+            _extend_features(self.item_features, len(self.items), items,
+                             item_ids, item_values),
+            users, items, self.user_feature_names, self.item_feature_names)
+
+    def user_row(self, user_id):
+        """ Return the row of a user. """
+        return self.users[user_id]
+
+    def item_row(self, item_id):
+        """ Return the row of an item. """
+        return self.items[item_id]
+
+    def new_user_features(self, values):
+        """ Return the feature matrix of users unknown to the model.
+        Args:
+            values: (n, n_user_features) array of feature values.
+        Returns:
+            CSR matrix to be passed to the model as user_features.
+        """
+        return _feature_rows(values, len(self.users),
+                             self.user_features.shape[1])
+
+    def new_item_features(self, values):
+        """ Return the feature matrix of items unknown to the model.
+        Args:
+            values: (n, n_item_features) array of feature values.
+        Returns:
+            CSR matrix to be passed to the model as item_features.
+        """
+        return _feature_rows(values, len(self.items),
+                             self.item_features.shape[1])
+
+
+class CategoryEncoder:
+    """ Sparse encoder of comma separated category lists.
+
+    Categories found in more than min_frequency of the weighted rows get a
+    column each, in alphabetical order as str.get_dummies gives them. The
+    rarer categories are hashed into n_buckets shared columns, or dropped
+    when n_buckets is 0.
+
+    Args:
+        min_frequency: fraction of the total weight a category must exceed
+            to get its own column.
+        n_buckets: number of columns the rarer categories are hashed into.
+        sep: separator of the categories.
+    """
+
+    def __init__(self, min_frequency=MIN_CATEGORY_FREQUENCY, n_buckets=0,
+                 sep=', '):
+        self.min_frequency = min_frequency
+        self.n_buckets = n_buckets
+        self.sep = sep
+        self.vocabulary = pd.Index([])
+
+    def _tokens(self, categories):
+        """ Return the row and the token of every distinct category of
+        every row.
+        """
+        tokens = pd.Series(np.asarray(categories, dtype=object)).str.split(
+            self.sep).explode().dropna()
+        pairs = pd.DataFrame({'row': tokens.index.values,
+                              'token': tokens.values}).drop_duplicates()
+        return pairs['row'].values, pairs['token'].values.astype(object)
+
+    @property
+    def feature_names(self):
+        """ Names of the columns of the encoded matrices. """
+        return list(self.vocabulary) + [
+            'category_hash_{}'.format(i) for i in range(self.n_buckets)]
+
+    def fit(self, categories, weights=None):
+        """ Learn the vocabulary of the frequent categories.
+        Args:
+            categories: array of category lists, one per row.
+            weights: weight of every row, such as its number of reviews,
+                1 by default.
+        Returns:
+            The CategoryEncoder.
+        """
+        if weights is None:
+            weights = np.ones(len(categories))
+        weights = np.asarray(weights)
+        rows, tokens = self._tokens(categories)
+        counts = pd.Series(weights[rows]).groupby(tokens).sum()
+        self.vocabulary = pd.Index(sorted(
+            counts.index[counts > weights.sum() * self.min_frequency]))
+        return self
+
+    def transform(self, categories):
+        """ Encode category lists.
+        Args:
+            categories: array of category lists, one per row.
+        Returns:
+            The float32 CSR (len(categories), len(feature_names)) matrix, 1
+            for the frequent categories of a row and the number of its
+            rarer categories in their hash bucket.
+        """
+        rows, tokens = self._tokens(categories)
+        cols = self.vocabulary.get_indexer(tokens)
+        rare = cols < 0
+        if self.n_buckets:
+            uniques, inverse = np.unique(tokens[rare].astype(str),
+                                         return_inverse=True)
+            buckets = np.array([zlib.crc32(token.encode('utf-8'))
+                                for token in uniques], dtype=np.int64)
+            cols[rare] = len(self.vocabulary) + (
+                buckets % self.n_buckets)[inverse]
+        else:
+            rows, cols = rows[~rare], cols[~rare]
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(categories), len(self.feature_names)))
+        matrix.sum_duplicates()
+        return matrix
+
+    def fit_transform(self, categories, weights=None):
+        return self.fit(categories, weights).transform(categories)
+
+
+def encode_categories(df, min_frequency=MIN_CATEGORY_FREQUENCY, n_buckets=0,
+                      item_id_col='business_id'):
+    """ Encode the categories of every business once.
+
+    The categories of a business are read from its first review and the
+    frequency cutoff counts each business once per review, so the kept
+    categories are those of str.get_dummies over the reviews.
+
+    Args:
+        df: the review dataframe, with a categories column.
+        min_frequency: fraction of the reviews a category must exceed to
+            get its own column.
+        n_buckets: number of columns the rarer categories are hashed into,
+            0 to drop them.
+        item_id_col: item id column.
+    Returns:
+        matrix: the CSR category matrix, by business code.
+        encoder: the fitted CategoryEncoder, whose feature_names name the
+            columns.
+    """
+    items, codes = IdEncoder.from_series(df[item_id_col])
+    categories = np.full(len(items), None, dtype=object)
+    _, first = np.unique(codes, return_index=True)
+    categories[codes[first]] = df['categories'].values[first]
+    n_reviews = np.bincount(codes, minlength=len(items))
+    encoder = CategoryEncoder(min_frequency, n_buckets)
+    return encoder.fit_transform(categories, n_reviews), encoder
@@ -0,0 +1,162 @@
+"""
+NAME
+    id_encoding
+DESCRIPTION
+    This module provides the dictionary encoding of user and business ids
+        into contiguous integer codes shared by the whole pipeline.
+CLASSES
+    IdEncoder(ids)
+        Mapping from id strings to int32 codes.
+    LabelMap(encoder, labels)
+        Mapping from id strings to labels stored by code.
+FUNCTIONS
+    categorize_ids(df, columns)
+        Return the dataframe with id columns dictionary encoded.
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+
+class IdEncoder(Mapping):
+    """ Bidirectional mapping between ids and contiguous int32 codes.
+
+    The code of an id is its position in the ids index, so encoding is a
+    hash lookup and decoding an array take. As a Mapping from id to code it
+    can be used wherever the id to interaction index dictionaries of lightfm
+    were used.
+
+    Args:
+        ids: the unique ids, in the order of their codes.
+    """
+
+    def __init__(self, ids=()):
+        self.ids = pd.Index(ids)
+
+    @classmethod
+    def fit(cls, ids):
+        """ Encode ids in their order of first appearance, as
+        lightfm.data.Dataset.fit does.
+        Args:
+            ids: array of possibly repeated ids.
+        Returns:
+            The IdEncoder.
+        """
+        return cls(pd.unique(np.asarray(ids)))
+
+    @classmethod
+    def from_series(cls, series):
+        """ Encode a column, reusing its categories if it is categorical;
+        the categories without any row, such as those of the rows filtered
+        out of a dataframe, are dropped.
+        Args:
+            series: the id column.
+        Returns:
+            encoder: the IdEncoder.
+            codes: the int32 codes of the column.
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            series = series.cat.remove_unused_categories()
+            return (cls(series.cat.categories),
+                    series.cat.codes.values.astype(np.int32))
+        codes, uniques = pd.factorize(series)
+        return cls(uniques), codes.astype(np.int32)
+
+    def encode(self, ids, extend=False):
+        """ Return the codes of an array of ids.
+        Args:
+            ids: array of ids.
+            extend: whether to give new codes to unknown ids, otherwise
+                they are encoded as -1.
+        Returns:
+            The int32 codes.
+        """
+        ids = np.asarray(ids)
+        codes = self.ids.get_indexer(ids)
+        if extend and (codes < 0).any():
+            self.ids = self.ids.append(pd.Index(pd.unique(ids[codes < 0])))
+            codes = self.ids.get_indexer(ids)
+        return codes.astype(np.int32)
+
+    def lookup(self, ids):
+        """ Return the codes of an array of ids that must all be known.
+        Raises:
+            KeyError: if some ids are unknown.
+        """
+        codes = self.encode(ids)
+        if (codes < 0).any():
+            raise KeyError(list(np.asarray(ids)[codes < 0][:10]))
+        return codes
+
+    def decode(self, codes):
+        """ Return the ids of an array of codes. """
+        return self.ids.values[np.asarray(codes)]
+
+    def categorical(self, codes):
+        """ Return a categorical of the ids of an array of codes, keeping
+        only the ids that appear.
+        """
+        return pd.Categorical.from_codes(
+            codes, self.ids).remove_unused_categories()
+
+    def __getitem__(self, id_):
+        return self.ids.get_loc(id_)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id_):
+        return id_ in self.ids
+
+
+class LabelMap(Mapping):
+    """ Mapping from ids to labels, such as business names, stored in an
+    array indexed by code.
+
+    Args:
+        encoder: the IdEncoder of the ids.
+        labels: array of the labels by code.
+    """
+
+    def __init__(self, encoder, labels):
+        self.encoder = encoder
+        self.labels = np.asarray(labels)
+
+    @classmethod
+    def from_codes(cls, encoder, codes, labels):
+        """ Build the mapping from a column of codes and a column of labels;
+        the last label of a repeated code is kept.
+        """
+        array = np.empty(len(encoder), dtype=object)
+        array[codes] = np.asarray(labels)
+        return cls(encoder, array)
+
+    def __getitem__(self, id_):
+        return self.labels[self.encoder[id_]]
+
+    def __iter__(self):
+        return iter(self.encoder)
+
+    def __len__(self):
+        return len(self.encoder)
+
+
+def categorize_ids(df, columns=('user_id', 'business_id')):
+    """ Dictionary encode id columns as categoricals, whose codes are
+    int32 codes of an IdEncoder.
+    Args:
+        df: the dataframe.
+        columns: the id columns.
+    Returns:
+        The dataframe with categorical id columns.
+    """
+    for col in columns:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            encoder, codes = IdEncoder.from_series(df[col])
+            df[col] = pd.Categorical.from_codes(codes, encoder.ids)
+    return df
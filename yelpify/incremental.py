@@ -0,0 +1,268 @@
+"""
+NAME
+    incremental
+DESCRIPTION
+    This module provides access to functions that update a trained model
+        with new reviews, instead of training it again on the whole
+        history.
+FUNCTIONS
+    grow_model(model, n_new_users, n_new_items, user_offset, item_offset)
+        Add initialized parameters for new users and items to a model.
+
+    extend_interactions(interactions, user_ids, item_ids, ratings)
+        Return the InteractionStore with new interactions added.
+
+    extend_labels(item_dict, items, item_codes, names)
+        Return the LabelMap of the items with the names of new items.
+
+    fit_delta(model, interactions, user_codes, item_codes, ratings,
+        replay_from, replay, epochs, num_threads, aggregate, random_state,
+        user_features, item_features)
+        Train a model on new interactions and a replay sample of old ones.
+
+    previous_training(previous)
+        Return the model and stores of an Artifact or train_model result.
+
+    aligned_rows(previous_ids, previous_names, ids, names)
+        Return the row in a previous model of every feature of a model.
+
+    warm_start_model(model, previous, user_rows, item_rows)
+        Initialize a model from the parameters of a previous one.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from yelpify.id_encoding import IdEncoder, LabelMap
+from yelpify.interactions import build_interactions, InteractionStore
+from yelpify.result_cache import mark_updated
+
+
+def _new_parameters(model, n_new):
+    """ Return the parameters of n_new features, initialized as
+    LightFM._initialize does.
+    """
+    dim = model.no_components
+    embeddings = ((model.random_state.rand(n_new, dim) - 0.5)
+                  / dim).astype(np.float32)
+    gradients = np.zeros((n_new, dim), dtype=np.float32)
+    bias_gradients = np.zeros(n_new, dtype=np.float32)
+    if model.learning_schedule == 'adagrad':
+        gradients += 1
+        bias_gradients += 1
+    return {'embeddings': embeddings,
+            'embedding_gradients': gradients,
+            'embedding_momentum': np.zeros((n_new, dim), dtype=np.float32),
+            'biases': np.zeros(n_new, dtype=np.float32),
+            'bias_gradients': bias_gradients,
+            'bias_momentum': np.zeros(n_new, dtype=np.float32)}
+
+
+def grow_model(model, n_new_users=0, n_new_items=0, user_offset=None,
+               item_offset=None):
+    """ Add the parameters of new users and items to a trained model, in
+    place, keeping the parameters of the known ones.
+
+    The parameters of a model are indexed by feature: without features the
+    new users and items are appended, while a hybrid model has identity
+    features followed by named features, so that the new identity features
+    are inserted at the end of the identity block.
+
+    Args:
+        model: the trained LightFM model.
+        n_new_users: number of new users.
+        n_new_items: number of new items.
+        user_offset: row the new user parameters are inserted at, the end
+            when None.
+        item_offset: row the new item parameters are inserted at, the end
+            when None.
+    Returns:
+        The model.
+    """
+    for side, n_new, offset in (('user', n_new_users, user_offset),
+                                ('item', n_new_items, item_offset)):
+        if n_new == 0:
+            continue
+        if offset is None:
+            offset = len(getattr(model, side + '_biases'))
+        for name, values in _new_parameters(model, n_new).items():
+            attribute = '%s_%s' % (side, name)
+            current = getattr(model, attribute)
+            setattr(model, attribute, np.concatenate(
+                [current[:offset], values, current[offset:]]))
+    mark_updated(model)
+    return model
+
+
+def extend_interactions(interactions, user_ids, item_ids, ratings):
+    """ Add new interactions to an InteractionStore.
+    Args:
+        interactions: the InteractionStore of the model.
+        user_ids: array of the user id of every new interaction.
+        item_ids: array of the item id of every new interaction.
+        ratings: array of the weight of every new interaction.
+    Returns:
+        store: a new InteractionStore, whose encoders are those of
+            interactions with the unseen ids appended; the weights of
+            repeated pairs are summed.
+        user_codes: the user code of every new interaction.
+        item_codes: the item code of every new interaction.
+    """
+    users = IdEncoder(interactions.users.ids)
+    items = IdEncoder(interactions.items.ids)
+    user_codes = users.encode(user_ids, extend=True)
+    item_codes = items.encode(item_ids, extend=True)
+    shape = (len(users), len(items))
+    weights = sparse.csr_matrix(interactions.csr, dtype=np.float32,
+                                copy=True)
+    weights.resize(shape)
+    delta = sparse.csr_matrix(
+        (np.asarray(ratings, dtype=np.float32), (user_codes, item_codes)),
+        shape=shape)
+    return InteractionStore(weights + delta, users, items), user_codes, \
+        item_codes
+
+
+def extend_labels(item_dict, items, item_codes, names):
+    """ Add the names of new items to the names of the known ones.
+    Args:
+        item_dict: LabelMap, or dictionary, of the known item names.
+        items: IdEncoder of the known and new items.
+        item_codes: codes of the items of new interactions.
+        names: name of the item of every new interaction; the last name of
+            an item is kept.
+    Returns:
+        The LabelMap of every item.
+    """
+    labels = np.empty(len(items), dtype=object)
+    if isinstance(item_dict, LabelMap):
+        codes = item_dict.encoder.encode(items.ids)
+        labels[codes >= 0] = item_dict.labels[codes[codes >= 0]]
+    else:
+        for x, item_id in enumerate(items.ids):
+            labels[x] = item_dict.get(item_id)
+    labels[item_codes] = np.asarray(names)
+    return LabelMap(items, labels)
+
+
+def fit_delta(model, interactions, user_codes, item_codes, ratings,
+              replay_from=None, replay=0, epochs=1, num_threads=1,
+              aggregate=None, random_state=None, user_features=None,
+              item_features=None):
+    """ Train a model on new interactions only, with fit_partial.
+
+    A sample of the older interactions can be replayed with the new ones,
+    so that the model does not drift towards the users and items of the
+    last reviews only.
+
+    Args:
+        model: the LightFM model, grown to the shape of interactions.
+        interactions: the InteractionStore including the new interactions.
+        user_codes: the user code of every new interaction.
+        item_codes: the item code of every new interaction.
+        ratings: the weight of every new interaction.
+        replay_from: the InteractionStore the replayed interactions are
+            sampled from, typically the one before the update.
+        replay: number of older interactions replayed.
+        epochs: number of passes over the new interactions.
+        num_threads: number of lightfm threads.
+        aggregate: how to reduce repeated user-item ratings, see
+            interactions.build_interactions.
+        random_state: seed of the replay sample.
+        user_features: user feature matrix of a hybrid model.
+        item_features: item feature matrix of a hybrid model.
+    Returns:
+        The model.
+    """
+    user_codes = np.asarray(user_codes, dtype=np.int32)
+    item_codes = np.asarray(item_codes, dtype=np.int32)
+    ratings = np.asarray(ratings, dtype=np.float32)
+    if replay and replay_from is not None and replay_from.nnz:
+        old = replay_from.csr.tocoo()
+        rng = np.random.RandomState(random_state)
+        sample = rng.choice(old.nnz, min(replay, old.nnz), replace=False)
+        print('Replaying {} interactions...'.format(len(sample)))
+        user_codes = np.r_[user_codes, old.row[sample]]
+        item_codes = np.r_[item_codes, old.col[sample]]
+        ratings = np.r_[ratings, old.data[sample]]
+    delta, weights = build_interactions(user_codes, item_codes, ratings,
+                                        interactions.shape, aggregate)
+    print('Updating model with {} interactions...'.format(delta.nnz))
+    model.fit_partial(delta, user_features=user_features,
+                      item_features=item_features, sample_weight=weights,
+                      epochs=epochs, num_threads=num_threads)
+    mark_updated(model)
+    return model
+
+
+def previous_training(previous):
+    """ Return the parts of a previous training a model can start from.
+    Args:
+        previous: an artifact.Artifact, or the tuple returned by the
+            train_model functions.
+    Returns:
+        model: the previous LightFM model.
+        interactions: its InteractionStore.
+        feature_store: its FeatureStore, None without features.
+    """
+    if isinstance(previous, tuple):
+        feature_store = previous[6] if len(previous) > 6 else None
+        return previous[0], previous[1], feature_store
+    return previous.model, previous.interactions, previous.feature_store
+
+
+def aligned_rows(previous_ids, previous_names, ids, names):
+    """ Return the row of every feature of a model in a previous model.
+
+    Features are the identity features of the ids followed by the named
+    features, as in the FeatureStore; a model without features has the
+    identity features only.
+
+    Args:
+        previous_ids: IdEncoder of the ids of the previous model.
+        previous_names: names of its named features.
+        ids: IdEncoder of the ids of the model.
+        names: names of its named features.
+    Returns:
+        The int64 rows, -1 for features the previous model does not have.
+    """
+    rows = previous_ids.encode(ids.ids).astype(np.int64)
+    name_rows = pd.Index(list(previous_names)).get_indexer(list(names))
+    name_rows = np.where(name_rows >= 0, name_rows + len(previous_ids), -1)
+    return np.r_[rows, name_rows].astype(np.int64)
+
+
+def warm_start_model(model, previous, user_rows, item_rows):
+    """ Initialize a model from a previous model, in place.
+
+    The embeddings and biases of the features still present are copied
+    from the previous model, those of new features are initialized as
+    lightfm initializes them, and the learning rate accumulators start
+    afresh so that every feature keeps adapting.
+
+    Args:
+        model: the new, untrained, LightFM model.
+        previous: the previous LightFM model.
+        user_rows: row in previous of every user feature of model, -1 for
+            new ones, see aligned_rows.
+        item_rows: row in previous of every item feature of model.
+    Returns:
+        The model.
+    Raises:
+        ValueError: if the models do not have the same no_components.
+    """
+    if previous.user_embeddings.shape[1] != model.no_components:
+        raise ValueError('Cannot start a model of {} components from one of '
+                         '{}'.format(model.no_components,
+                                     previous.user_embeddings.shape[1]))
+    for side, rows in (('user', user_rows), ('item', item_rows)):
+        known = rows >= 0
+        print('Starting {} of {} {} features from the previous model'.format(
+            int(known.sum()), len(rows), side))
+        for name, values in _new_parameters(model, len(rows)).items():
+            if name in ('embeddings', 'biases'):
+                values[known] = getattr(
+                    previous, '%s_%s' % (side, name))[rows[known]]
+            setattr(model, '%s_%s' % (side, name), values)
+    return model
@@ -0,0 +1,324 @@
+"""
+NAME
+    ingest
+DESCRIPTION
+    This module provides access to functions that read the raw Yelp
+        dumps in bounded memory.
+FUNCTIONS
+    byte_ranges(path, chunk_bytes)
+        Split a line-delimited file into ranges aligned to newlines.
+
+    iter_json_parallel(path, columns, n_workers, chunk_bytes)
+        Yield the chunks of a line-delimited json file parsed in parallel.
+
+    read_json_parallel(path, columns, dtypes, n_workers, chunk_bytes)
+        Return the content of a line-delimited json file parsed in parallel.
+
+    read_chunks(source, columns, chunksize, n_workers)
+        Yield the column-projected chunks of a csv or json file.
+
+    read_projected(source, columns, dtypes, chunksize, n_workers)
+        Return the column-projected and downcast content of a file.
+
+    stream_raw_join(review_source, user_source, business_source,
+        output_path, chunksize, n_workers, decode_ids)
+        Join the raw dumps chunk by chunk into a parquet file.
+
+    read_batches(path, batch_size, columns)
+        Yield the batches of a parquet file as dataframes.
+"""
+
+import io
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from yelpify.id_encoding import IdEncoder
+
+REVIEW_COLUMNS = ['user_id', 'business_id', 'stars', 'text']
+USER_COLUMNS = ['user_id', 'name', 'average_stars']
+BUSINESS_COLUMNS = [
+    'business_id', 'name', 'stars', 'categories', 'state', 'city']
+JOINED_COLUMNS = [
+    'user_id', 'business_id',
+    'stars', 'text',
+    'name', 'average_stars',
+    'name_business', 'stars_business',
+    'categories', 'state', 'city']
+
+REVIEW_DTYPES = {'stars': 'float32'}
+USER_DTYPES = {'average_stars': 'float32'}
+BUSINESS_DTYPES = {
+    'stars': 'float32', 'state': 'category', 'city': 'category'}
+
+DEFAULT_CHUNKSIZE = 100000
+DEFAULT_CHUNK_BYTES = 64 * 1024 ** 2
+
+
+def byte_ranges(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """ Split a line-delimited file into byte ranges of about chunk_bytes,
+    each ending right after a newline.
+    Args:
+        path: path of the file.
+        chunk_bytes: targeted size of the ranges.
+    Returns:
+        List of (start, end) byte offsets covering the whole file.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    start = 0
+    with open(path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _chunk_bytes(path, chunksize, n_lines=1000):
+    """ Return the size in bytes of about chunksize lines of a file,
+    from the average length of its first n_lines lines. """
+    with open(path, 'rb') as f:
+        lines = [len(line) for _, line in zip(range(n_lines), f)]
+    if not lines:
+        return DEFAULT_CHUNK_BYTES
+    return max(1, chunksize * sum(lines) // len(lines))
+
+
+def _parse_range(path, start, end, columns, dtypes):
+    """ Parse the lines of a json file between two byte offsets, raising
+    KeyError for missing columns, as the chunks of read_chunks do. """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode('utf-8')
+    if data.strip():
+        df = pd.read_json(io.StringIO(data), lines=True)
+        if columns is not None:
+            df = df[columns]
+    else:
+        df = pd.DataFrame(columns=columns)
+    return _downcast(df, dtypes)
+
+
+def iter_json_parallel(path, columns=None, dtypes=None, n_workers=None,
+                       chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """ Parse a line-delimited json file in a pool of processes.
+
+    The file is split into ranges aligned to newlines, which workers parse
+    and project independently. Chunks are yielded in file order, with at
+    most two chunks per worker in flight to keep memory bounded.
+
+    Args:
+        path: path of the json file.
+        columns: the columns to keep, None to keep them all.
+        dtypes: dictionary of column name to the dtype to cast it to,
+            categorical dtypes excluded.
+        n_workers: number of processes, None for one per cpu.
+        chunk_bytes: targeted size of the parsed ranges.
+    Returns:
+        Iterator of dataframes.
+    """
+    dtypes = dtypes or {}
+    ranges = byte_ranges(path, chunk_bytes)
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers == 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield _parse_range(path, start, end, columns, dtypes)
+        return
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        pending = deque()
+        for start, end in ranges:
+            if len(pending) >= 2 * n_workers:
+                yield pending.popleft().result()
+            pending.append(executor.submit(
+                _parse_range, path, start, end, columns, dtypes))
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_json_parallel(path, columns=None, dtypes=None, n_workers=None,
+                       chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """ Read a line-delimited json file parsed in a pool of processes.
+    Args:
+        path: path of the json file.
+        columns: the columns to keep, None to keep them all.
+        dtypes: dictionary of column name to the dtype to cast it to.
+        n_workers: number of processes, None for one per cpu.
+        chunk_bytes: targeted size of the parsed ranges.
+    Returns:
+        The dataframe.
+    """
+    dtypes = dtypes or {}
+    chunks = list(iter_json_parallel(
+        path, columns,
+        {c: t for c, t in dtypes.items() if t != 'category'},
+        n_workers, chunk_bytes))
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(chunks, ignore_index=True)
+    return _downcast(df, {c: t for c, t in dtypes.items()
+                          if t == 'category'})
+
+
+def read_chunks(source, columns, chunksize=DEFAULT_CHUNKSIZE, n_workers=1):
+    """ Yield the chunks of a file, keeping only the given columns.
+    Args:
+        source: url or path of a csv or line-delimited json file.
+        columns: the columns to keep.
+        chunksize: number of lines per chunk.
+        n_workers: number of processes parsing a local json file, None
+            for one per cpu; its chunks are then byte ranges of about
+            chunksize lines, from the average length of the first lines.
+    Returns:
+        Iterator of dataframes with at most, or in parallel about,
+        chunksize rows.
+    Raises:
+        KeyError: if a chunk misses one of the columns.
+    """
+    if '.json' in source and n_workers != 1 and os.path.exists(source):
+        for chunk in iter_json_parallel(
+                source, columns, n_workers=n_workers,
+                chunk_bytes=_chunk_bytes(source, chunksize)):
+            yield chunk
+    elif '.csv' in source:
+        # usecols drops the other columns while parsing
+        for chunk in pd.read_csv(source, usecols=columns,
+                                 chunksize=chunksize):
+            yield chunk[columns]
+    elif '.json' in source:
+        for chunk in pd.read_json(source, lines=True, chunksize=chunksize):
+            yield chunk[columns]
+    else:
+        raise NotImplementedError("File type not supported")
+
+
+def _schema(df):
+    """ Arrow schema of a chunk, with every text column typed as string
+    so that chunks made only of missing values still match it.
+    """
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    for i, name in enumerate(schema.names):
+        dtype = df[name].dtype
+        if not (isinstance(dtype, pd.CategoricalDtype)
+                or pd.api.types.is_numeric_dtype(dtype)):
+            schema = schema.set(i, pa.field(name, pa.string()))
+    return schema
+
+
+def _downcast(df, dtypes):
+    return df.astype({c: t for c, t in dtypes.items() if c in df.columns})
+
+
+def read_projected(source, columns, dtypes=None,
+                   chunksize=DEFAULT_CHUNKSIZE, n_workers=1):
+    """ Read a file chunk by chunk, projecting and downcasting each chunk.
+    Args:
+        source: url or path of a csv or line-delimited json file.
+        columns: the columns to keep.
+        dtypes: dictionary of column name to the dtype to cast it to.
+        chunksize: number of lines per chunk.
+        n_workers: number of processes parsing a local json file.
+    Returns:
+        The dataframe with only the given columns.
+    """
+    dtypes = dtypes or {}
+    chunks = [_downcast(chunk, {c: t for c, t in dtypes.items()
+                                if t != 'category'})
+              for chunk in read_chunks(source, columns, chunksize,
+                                       n_workers)]
+    df = pd.concat(chunks, ignore_index=True)
+    # categories are only known once every chunk is read
+    return _downcast(df, {c: t for c, t in dtypes.items()
+                          if t == 'category'})
+
+
+def stream_raw_join(review_source, user_source, business_source,
+                    output_path, chunksize=DEFAULT_CHUNKSIZE, n_workers=1,
+                    decode_ids=False):
+    """ Join the raw review, user and business dumps into a parquet file.
+
+    Users and businesses are loaded once, projected to the joined columns,
+    and their ids are replaced by int32 codes. Reviews are then read,
+    encoded, joined on the codes and appended to the output one chunk at a
+    time, so peak memory depends on chunksize and not on the size of the
+    review dump. The id columns of the output hold the codes, or the ids
+    with decode_ids.
+
+    Args:
+        review_source: url or path of the review dump.
+        user_source: url or path of the user dump.
+        business_source: url or path of the business dump.
+        output_path: path of the parquet file to be written.
+        chunksize: number of reviews per chunk.
+        n_workers: number of processes parsing local json dumps.
+        decode_ids: whether to write the ids rather than their codes, so
+            that the output can be read without the encoders.
+    Returns:
+        n_rows: the number of joined reviews.
+        user_encoder: the IdEncoder of the user_id codes.
+        business_encoder: the IdEncoder of the business_id codes.
+    """
+    user = read_projected(
+        user_source, USER_COLUMNS, USER_DTYPES, chunksize, n_workers)
+    business = read_projected(
+        business_source, BUSINESS_COLUMNS, BUSINESS_DTYPES, chunksize,
+        n_workers)
+    business = business.rename(
+        columns={'name': 'name_business', 'stars': 'stars_business'})
+    user_encoder = IdEncoder.fit(user['user_id'])
+    user['user_id'] = user_encoder.encode(user['user_id'])
+    business_encoder = IdEncoder.fit(business['business_id'])
+    business['business_id'] = business_encoder.encode(
+        business['business_id'])
+
+    n_rows = 0
+    writer = None
+    try:
+        for review in read_chunks(review_source, REVIEW_COLUMNS, chunksize,
+                                  n_workers):
+            review = _downcast(review, REVIEW_DTYPES)
+            # reviews of unknown users or businesses get new codes
+            review['user_id'] = user_encoder.encode(
+                review['user_id'], extend=True)
+            review['business_id'] = business_encoder.encode(
+                review['business_id'], extend=True)
+            chunk = review.merge(user, on='user_id', how='left').merge(
+                business, on='business_id', how='left')[JOINED_COLUMNS]
+            if decode_ids:
+                chunk['user_id'] = user_encoder.decode(chunk['user_id'])
+                chunk['business_id'] = business_encoder.decode(
+                    chunk['business_id'])
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, _schema(chunk))
+            writer.write_table(pa.Table.from_pandas(
+                chunk, schema=writer.schema, preserve_index=False))
+            n_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pd.DataFrame(columns=JOINED_COLUMNS).to_parquet(
+            output_path, index=False)
+    return n_rows, user_encoder, business_encoder
+
+
+def read_batches(path, batch_size=DEFAULT_CHUNKSIZE, columns=None):
+    """ Read a parquet file, such as the output of stream_raw_join, one
+    batch of rows at a time.
+    Args:
+        path: path of the parquet file.
+        batch_size: number of rows per batch.
+        columns: the columns read, every column when None.
+    Yields:
+        The dataframe of every batch.
+    """
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=batch_size,
+                                      columns=columns):
+        yield batch.to_pandas()
@@ -0,0 +1,256 @@
+"""
+NAME
+    interactions
+DESCRIPTION
+    This module provides access to functions that build the user-item
+        interaction matrices from id codes, and to the sparse store of
+        interaction weights used by the recommenders.
+CLASSES
+    InteractionStore(weights, users, items)
+        Sparse user-item weights labelled by user and item ids.
+FUNCTIONS
+    build_interactions(user_codes, item_codes, weights, shape, aggregate)
+        Return the interaction and weight matrices as lightfm expects them.
+
+    as_interaction_store(interactions)
+        Return interactions as an InteractionStore.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from yelpify.id_encoding import IdEncoder
+
+AGGREGATES = ('sum', 'mean', 'max', 'min', 'first', 'last', 'count')
+
+
+def _aggregate(keys, weights, aggregate):
+    """ Reduce the weights of repeated keys.
+    Returns:
+        The unique keys, sorted, and their aggregated weights.
+    """
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    weights = weights[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)]
+    if aggregate == 'sum':
+        values = np.add.reduceat(weights, starts)
+    elif aggregate == 'mean':
+        values = np.add.reduceat(weights, starts) / (ends - starts)
+    elif aggregate == 'max':
+        values = np.maximum.reduceat(weights, starts)
+    elif aggregate == 'min':
+        values = np.minimum.reduceat(weights, starts)
+    elif aggregate == 'first':
+        values = weights[starts]
+    elif aggregate == 'last':
+        values = weights[ends - 1]
+    else:
+        values = ends - starts
+    return keys[starts], values
+
+
+def build_interactions(user_codes, item_codes, weights=None, shape=None,
+                       aggregate=None):
+    """ Build the interaction matrices from arrays of codes, without the
+    per-interaction python loop of lightfm.data.Dataset.build_interactions.
+    Args:
+        user_codes: array of the user code of every interaction.
+        item_codes: array of the item code of every interaction.
+        weights: array of the weight of every interaction, 1 by default.
+        shape: (number of users, number of items), by default one more
+            than the largest codes.
+        aggregate: how to reduce repeated user-item pairs: None to keep
+            every pair, as lightfm does, or one of 'sum', 'mean', 'max',
+            'min', 'first', 'last' and 'count'.
+    Returns:
+        interactions: int32 COO matrix with 1 for every user-item pair.
+        weights: float32 COO matrix of the corresponding weights.
+    """
+    rows = np.asarray(user_codes, dtype=np.int32)
+    cols = np.asarray(item_codes, dtype=np.int32)
+    if weights is None:
+        weights = np.ones(len(rows), dtype=np.float32)
+    weights = np.asarray(weights, dtype=np.float32)
+    if shape is None:
+        shape = (int(rows.max()) + 1 if len(rows) else 0,
+                 int(cols.max()) + 1 if len(cols) else 0)
+    if aggregate is not None:
+        if aggregate not in AGGREGATES:
+            raise ValueError(
+                "aggregate must be None or one of {}".format(AGGREGATES))
+        keys = rows.astype(np.int64) * shape[1] + cols
+        keys, weights = _aggregate(keys, weights, aggregate)
+        rows = (keys // shape[1]).astype(np.int32)
+        cols = (keys % shape[1]).astype(np.int32)
+        weights = weights.astype(np.float32)
+    interactions = sparse.coo_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=shape)
+    weights = sparse.coo_matrix((weights, (rows, cols)), shape=shape)
+    return interactions, weights
+
+
+class InteractionStore:
+    """ Sparse users x items matrix of interaction weights.
+
+    It replaces the dense df_interactions dataframe: shape, index and
+    columns behave as on the dataframe, while rows and columns are read
+    from CSR and CSC copies of the weights in O(nnz) of the row or column.
+    Repeated user-item pairs are summed, as the dense matrix did.
+
+    Args:
+        weights: sparse matrix of the interaction weights.
+        users: IdEncoder of the user ids, by row.
+        items: IdEncoder of the item ids, by column.
+    """
+
+    def __init__(self, weights, users, items):
+        self.csr = sparse.csr_matrix(weights, dtype=np.float32)
+        self.csr.sum_duplicates()
+        self.csc = self.csr.tocsc()
+        self.users = users
+        self.items = items
+
+    @classmethod
+    def from_matrices(cls, csr, csc, users, items):
+        """ Build the store from its CSR and CSC copies as they are, such
+        as memory-mapped arrays, without converting them.
+        """
+        store = cls.__new__(cls)
+        store.csr = csr
+        store.csc = csc
+        store.users = users
+        store.items = items
+        return store
+
+    @classmethod
+    def from_frame(cls, df):
+        """ Build the store from a dense interaction dataframe. """
+        return cls(sparse.csr_matrix(df.values), IdEncoder(df.index),
+                   IdEncoder(df.columns))
+
+    @property
+    def shape(self):
+        return self.csr.shape
+
+    @property
+    def index(self):
+        """ The user ids, by row. """
+        return self.users.ids
+
+    @property
+    def columns(self):
+        """ The item ids, by column. """
+        return self.items.ids
+
+    @property
+    def nnz(self):
+        return self.csr.nnz
+
+    def user_row(self, user_x):
+        """ Return the item indexes and weights of a user's interactions.
+        Args:
+            user_x: row index of the user.
+        Returns:
+            items: the item indexes.
+            weights: the corresponding weights.
+        """
+        start, end = self.csr.indptr[user_x], self.csr.indptr[user_x + 1]
+        return self.csr.indices[start:end], self.csr.data[start:end]
+
+    def item_column(self, item_x):
+        """ Return the user indexes and weights of an item's interactions.
+        Args:
+            item_x: column index of the item.
+        Returns:
+            users: the user indexes.
+            weights: the corresponding weights.
+        """
+        start, end = self.csc.indptr[item_x], self.csc.indptr[item_x + 1]
+        return self.csc.indices[start:end], self.csc.data[start:end]
+
+    def dense_row(self, user_x):
+        """ Return the weights of a user against every item. """
+        return self.csr[user_x].toarray().ravel()
+
+    def dense_column(self, item_x):
+        """ Return the weights of an item against every user. """
+        return self.csc[:, item_x].toarray().ravel()
+
+    def exclusion_mask(self, user_x, threshold=None):
+        """ Return the items to exclude from a user's recommendations.
+        Args:
+            user_x: row index of the user.
+            threshold: exclude items rated above threshold, or every item
+                the user interacted with when None.
+        Returns:
+            Boolean array over the items.
+        """
+        if threshold is not None and threshold < 0:
+            return self.dense_row(user_x) > threshold
+        mask = np.zeros(self.shape[1], dtype=bool)
+        items, weights = self.user_row(user_x)
+        if threshold is not None:
+            items = items[weights > threshold]
+        mask[items] = True
+        return mask
+
+    def exclusion_matrix(self, user_xs, threshold=None):
+        """ Return the items to exclude from the recommendations of
+        several users, see exclusion_mask.
+        Args:
+            user_xs: row indexes of the users.
+            threshold: exclude items rated above threshold, or every item
+                the users interacted with when None.
+        Returns:
+            Sparse boolean (len(user_xs), n_items) matrix.
+        """
+        rows = self.csr[np.asarray(user_xs)]
+        if threshold is not None and threshold < 0:
+            return sparse.csr_matrix(rows.toarray() > threshold)
+        rows = rows.astype(bool) if threshold is None else rows > threshold
+        rows.eliminate_zeros()
+        return rows
+
+    def row(self, user_id):
+        """ Return the non zero weights of a user as a series indexed by
+        item id.
+        """
+        items, weights = self.user_row(self.users[user_id])
+        return pd.Series(weights, index=self.items.ids[items])
+
+    def known_items(self, user_id, threshold=3):
+        """ Return the ids of the items a user rated above threshold.
+        Args:
+            user_id: the user id.
+            threshold: value above which the rating is favorable.
+        Returns:
+            The item ids, in descending order.
+        """
+        user_x = self.users[user_id]
+        if threshold < 0:
+            weights = self.dense_row(user_x)
+            items = np.arange(len(weights))
+        else:
+            items, weights = self.user_row(user_x)
+        ids = self.items.ids[items[weights > threshold]]
+        return list(ids.sort_values(ascending=False))
+
+    def to_frame(self):
+        """ Return the dense interaction dataframe. """
+        return pd.DataFrame(self.csr.toarray(), index=self.users.ids,
+                            columns=self.items.ids)
+
+
+def as_interaction_store(interactions):
+    """ Return interactions as an InteractionStore.
+    Args:
+        interactions: an InteractionStore or a dense interaction dataframe.
+    Returns:
+        The InteractionStore.
+    """
+    if isinstance(interactions, pd.DataFrame):
+        return InteractionStore.from_frame(interactions)
+    return interactions
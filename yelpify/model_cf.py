@@ -7,76 +7,168 @@ DESCRIPTION
         evaluate models using collaborative filtering.
 
 FUNCTIONS
-    train_model(df, user_id_col, item_id_col, item_name_col, evaluate)
+    train_model(df, user_id_col, item_id_col, item_name_col, evaluate,
+        rating_col, aggregate, warm_start, epochs, patience, refit_epochs)
         Return the trained model, dataset with user-item
         interactions, user dictionary and item dictionary.
 
-    evaluate_model(df, user_id_col, item_id_col)
-        Return the auc-roc score of the training and testing sets.
+    update_model(model, interactions, item_dict, df, user_id_col,
+        item_id_col, item_name_col, rating_col, aggregate, replay, epochs,
+        random_state)
+        Return the model updated with new reviews, and its lookup tables.
+
+    evaluate_model(df, user_id_col, item_id_col, stratify, rating_col,
+        aggregate, epochs, k, n_users, n_jobs)
+        Return the auc-roc score of the training set and the ranking
+        metrics of the testing set.
 """
 
-import pandas as pd
+import numpy as np
 from lightfm import LightFM
-from lightfm.evaluation import auc_score
 from sklearn.model_selection import train_test_split
-from lightfm.data import Dataset
+
+from yelpify import evaluation
+from yelpify.id_encoding import IdEncoder, LabelMap
+from yelpify.incremental import grow_model, extend_interactions, \
+    extend_labels, fit_delta, previous_training, aligned_rows, \
+    warm_start_model
+from yelpify.training import fit_model, evaluate_and_fit, DEFAULT_EPOCHS, \
+    DEFAULT_REFIT_EPOCHS
+from yelpify.interactions import build_interactions, InteractionStore
 
 
 def train_model(df, user_id_col='user_id', item_id_col='business_id',
-                item_name_col='name_business', evaluate=True):
+                item_name_col='name_business', evaluate=True,
+                rating_col='stars', aggregate=None, warm_start=None,
+                epochs=DEFAULT_EPOCHS, patience=None,
+                refit_epochs=DEFAULT_REFIT_EPOCHS):
     """Train the model using collaborative filtering.
 
+    With evaluate, the model is trained for epochs on 80% of the reviews
+    and measured on the other 20%, then refit on every review for
+    refit_epochs, instead of training for epochs on every review, see
+    training.evaluate_and_fit; the interactions are built only once.
+
     Args:
         df: the input dataframe.
         user_id_col: user id column.
         item_id_col: item id column.
         item_name_col: item name column.
         evaluate: if evaluate the model performance.
+        rating_col: rating column, used as interaction weight.
+        aggregate: how to reduce repeated user-item ratings, see
+            interactions.build_interactions.
+        warm_start: the artifact.Artifact, or the tuple returned by
+            train_model, of a previous training to start from: the
+            parameters of the users and items it shares with this training
+            are copied, only the new ones are random.
+        epochs: maximum number of epochs, on the training set of the
+            evaluation with evaluate.
+        patience: number of epochs without validation AUC improvement
+            before stopping early, see training.fit_model.
+        refit_epochs: number of epochs on every review after the
+            evaluation, or after early stopping on held-out reviews.
 
     Returns:
         model_full: the trained model.
-        df_interactions: dataframe with user-item interactions.
-        user_dict: user dictionary containing user_id as
-            key and interaction_index as value.
-        item_dict: item dictionary containing item_id
-            as key and item_name as value.
+        df_interactions: InteractionStore of the user-item interactions.
+        user_dict: IdEncoder mapping user_id to interaction_index.
+        item_dict: LabelMap mapping item_id to item_name.
 
     """
-    if evaluate:
-        print('Evaluating model...')
-        evaluate_model(df, user_id_col='user_id', item_id_col='business_id')
-
     print('Training model...')
     # build recommendations for known users and known businesses
-    # with collaborative filtering method
-    ds_full = Dataset()
-    # we call fit to supply userid, item id and user/item features
-    ds_full.fit(
-            df[user_id_col].unique(),   # all the users
-            df[item_id_col].unique(),   # all the items
-    )
-    (interactions, weights) = ds_full.build_interactions([(x[0], x[1], x[2])
-                                                         for x in df.values]
-                                                         )
+    # with collaborative filtering method; interaction indexes are the codes
+    user_encoder, user_codes = IdEncoder.from_series(df[user_id_col])
+    item_encoder, item_codes = IdEncoder.from_series(df[item_id_col])
+    (interactions, weights) = build_interactions(
+        user_codes, item_codes, df[rating_col].values,
+        shape=(len(user_encoder), len(item_encoder)), aggregate=aggregate)
     # model
     model_full = LightFM(no_components=100, learning_rate=0.05,
                          loss='warp', max_sampled=50)
-    model_full.fit(interactions, sample_weight=weights,
-                   epochs=10, num_threads=10)
-    # mapping
-    user_id_map, _, business_id_map, _ = ds_full.mapping()
+    if warm_start is not None:
+        previous, previous_interactions, _ = previous_training(warm_start)
+        warm_start_model(
+            model_full, previous,
+            aligned_rows(previous_interactions.users, (), user_encoder, ()),
+            aligned_rows(previous_interactions.items, (), item_encoder, ()))
+    if evaluate:
+        print('Evaluating model...')
+        evaluate_and_fit(model_full, user_codes, item_codes,
+                         df[rating_col].values, interactions.shape,
+                         aggregate=aggregate, epochs=epochs,
+                         patience=patience, refit_epochs=refit_epochs,
+                         interactions=interactions, weights=weights)
+    else:
+        fit_model(model_full, interactions, weights, epochs=epochs,
+                  patience=patience, refit_epochs=refit_epochs)
 
     # data preparation
-    df_interactions = pd.DataFrame(weights.todense())
-    df_interactions.index = list(user_id_map.keys())
-    df_interactions.columns = list(business_id_map.keys())
-    user_dict = user_id_map
-    item_dict = df.set_index(item_id_col)[item_name_col].to_dict()
+    df_interactions = InteractionStore(weights, user_encoder, item_encoder)
+    user_dict = user_encoder
+    item_dict = LabelMap.from_codes(
+        item_encoder, item_codes, df[item_name_col].values)
     return model_full, df_interactions, user_dict, item_dict
 
 
+def update_model(model, interactions, item_dict, df, user_id_col='user_id',
+                 item_id_col='business_id', item_name_col='name_business',
+                 rating_col='stars', aggregate=None, replay=0, epochs=1,
+                 random_state=None):
+    """Update a trained model with new reviews, with fit_partial on the new
+        reviews only instead of training again on the whole history.
+
+    Unseen users and businesses get new codes after the known ones and
+    freshly initialized parameters, while the parameters of the known ones
+    are kept and refined.
+
+    Args:
+        model: the trained model, updated in place.
+        interactions: InteractionStore the model was trained with.
+        item_dict: LabelMap of the item names.
+        df: the dataframe of the new reviews.
+        user_id_col: user id column.
+        item_id_col: item id column.
+        item_name_col: item name column.
+        rating_col: rating column, used as interaction weight.
+        aggregate: how to reduce repeated user-item ratings, see
+            interactions.build_interactions.
+        replay: number of older interactions sampled and trained on with
+            the new ones.
+        epochs: number of passes over the new interactions.
+        random_state: seed of the replay sample.
+
+    Returns:
+        model_full: the updated model.
+        df_interactions: InteractionStore of every user-item interaction.
+        user_dict: IdEncoder mapping user_id to interaction_index.
+        item_dict: LabelMap mapping item_id to item_name.
+
+    """
+    print('Updating model with {} reviews...'.format(len(df)))
+    ratings = df[rating_col].values
+    df_interactions, user_codes, item_codes = extend_interactions(
+        interactions, np.asarray(df[user_id_col]),
+        np.asarray(df[item_id_col]), ratings)
+    n_users, n_items = interactions.shape
+    grow_model(model, len(df_interactions.users) - n_users,
+               len(df_interactions.items) - n_items)
+    fit_delta(model, df_interactions, user_codes, item_codes, ratings,
+              replay_from=interactions, replay=replay, epochs=epochs,
+              num_threads=10, aggregate=aggregate,
+              random_state=random_state)
+    user_dict = df_interactions.users
+    item_dict = extend_labels(item_dict, df_interactions.items, item_codes,
+                              df[item_name_col].values)
+    return model, df_interactions, user_dict, item_dict
+
+
 def evaluate_model(df, user_id_col='user_id',
-                   item_id_col='business_id', stratify=None):
+                   item_id_col='business_id', stratify=None,
+                   rating_col='stars', aggregate=None,
+                   epochs=DEFAULT_EPOCHS, k=evaluation.DEFAULT_K, n_users=None,
+                   n_jobs=None):
     """ Model evaluation.
 
     Args:
@@ -84,39 +176,50 @@ def evaluate_model(df, user_id_col='user_id',
         user_id_col: user id column.
         item_id_col: item id column.
         stratify: if use stratification.
+        rating_col: rating column, used as interaction weight.
+        aggregate: how to reduce repeated user-item ratings.
+        epochs: number of epochs.
+        k: cutoff of the testing precision, recall and NDCG.
+        n_users: number of users sampled to measure the model, every user
+            when None.
+        n_jobs: number of evaluation threads, see evaluation.user_metrics.
 
     Returns:
         train_auc: training set auc score.
-        test_auc: testing set auc score.
+        test_metrics: summary DataFrame of the testing set precision@k,
+            recall@k, NDCG@k, MAP and AUC, see evaluation.summarize.
 
     """
     # model evaluation
     # create test and train datasets
     print('model evaluation')
-    train, test = train_test_split(df, test_size=0.2, stratify=stratify)
-    ds = Dataset()
-
-    # we call fit to supply userid, item id and user/item features
-    ds.fit(
-            df[user_id_col].unique(),   # all the users
-            df[item_id_col].unique(),   # all the items
-    )
+    train, test = train_test_split(
+        np.arange(len(df)), test_size=0.2, stratify=stratify)
+    user_encoder, user_codes = IdEncoder.from_series(df[user_id_col])
+    item_encoder, item_codes = IdEncoder.from_series(df[item_id_col])
+    ratings = df[rating_col].values
+    shape = (len(user_encoder), len(item_encoder))
 
     # plugging in the interactions
-    (train_interactions, train_weights) = ds.build_interactions(
-        [(x[0], x[1], x[2]) for x in train.values]
-        )
-    (test_interactions, _) = ds.build_interactions(
-        [(x[0], x[1], x[2]) for x in test.values]
-        )
+    (train_interactions, train_weights) = build_interactions(
+        user_codes[train], item_codes[train], ratings[train], shape,
+        aggregate)
+    (test_interactions, _) = build_interactions(
+        user_codes[test], item_codes[test], ratings[test], shape, aggregate)
     # model
     model = LightFM(no_components=100, learning_rate=0.05,
                     loss='warp', max_sampled=50)
     model.fit(train_interactions, sample_weight=train_weights,
-              epochs=10, num_threads=10)
+              epochs=epochs, num_threads=10)
 
-    # auc-roc
-    train_auc = auc_score(model, train_interactions, num_threads=20).mean()
+    # auc-roc of the training set, ranking metrics of the testing set
+    train_auc = evaluation.evaluate(
+        model, train_interactions, k=k, n_users=n_users,
+        n_jobs=n_jobs).loc['auc', 'mean']
     print('Training set AUC: %s' % train_auc)
-    test_auc = auc_score(model, test_interactions, num_threads=20).mean()
-    print('Testing set AUC: %s' % test_auc)
+    test_metrics = evaluation.evaluate(
+        model, test_interactions, train_interactions, k=k, n_users=n_users,
+        n_jobs=n_jobs)
+    print('Testing set AUC: %s' % test_metrics.loc['auc', 'mean'])
+    print(test_metrics)
+    return train_auc, test_metrics
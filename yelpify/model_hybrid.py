@@ -5,211 +5,318 @@ DESCRIPTION
     This module provides access to functions that train and evaluate
         models using hybrid filtering.
 FUNCTIONS
-    get_users_features_tuple(user)
-    get_items_features_tuple(item, categories)
-    train_model(df, user_id_col, item_id_col, item_name_col, evaluate)
+    train_model(df, user_id_col, item_id_col, item_name_col, evaluate,
+        rating_col, aggregate, category_matrix, category_names, warm_start,
+        epochs, patience, refit_epochs)
         Return the trained model, dataset with user-item interactions,
-            user dictionary and item dictionary.
-    evaluate_model(df, user_id_col, item_id_col)
-        Return the auc-roc score of the training and testing sets.
+            user dictionary, item dictionary, feature maps and the
+            FeatureStore of the model.
+    update_model(model, interactions, item_dict, feature_store, df,
+        user_id_col, item_id_col, item_name_col, rating_col, aggregate,
+        category_matrix, replay, epochs, random_state)
+        Return the model updated with new reviews, and its lookup tables.
+    evaluate_model(df, user_id_col, item_id_col, stratify, rating_col,
+        aggregate, category_matrix, epochs, k, n_users, n_jobs)
+        Return the auc-roc score of the training set and the ranking
+            metrics of the testing set.
 """
 
+import numpy as np
 import pandas as pd
 from lightfm import LightFM
-from lightfm.evaluation import auc_score
+from scipy import sparse
 from sklearn.model_selection import train_test_split
-from lightfm.data import Dataset
 
+from yelpify import evaluation
+from yelpify.features import FeatureStore, build_user_features, \
+    build_item_features, build_category_features
+from yelpify.id_encoding import IdEncoder, LabelMap
+from yelpify.incremental import grow_model, extend_interactions, \
+    extend_labels, fit_delta, previous_training, aligned_rows, \
+    warm_start_model
+from yelpify.training import fit_model, evaluate_and_fit, DEFAULT_EPOCHS, \
+    DEFAULT_REFIT_EPOCHS
+from yelpify.interactions import build_interactions, InteractionStore
 
-def get_users_features_tuple(user):
-    """ Get user's feature and return a tuple
-    Arg:
-        user: the user line in the dataframe
-    Returns:
-        Tuple(user id string, dict{user feature: feature value})
-    """
-
-    return (user[0], {'average_stars': float(user[5])})
 
-
-def get_items_features_tuple(item, categories):
-    """ Get the item's feature and return a tuple
-    Arg:
-        item: one item line in the dataframe
-        categories: item features list
+def _category_rows(category_matrix, series, ids):
+    """ Return the rows of a category matrix by business code for ids.
+    Args:
+        category_matrix: sparse item feature matrix by item code, the
+            position of the items in the categories of series.
+        series: the item id column the matrix was built from, or a
+            filtered part of it.
+        ids: array of item ids.
     Returns:
-        Tuple(item id string, dict{item feature: feature value})
+        The CSR matrix of the rows of ids.
     """
-
-    item.tolist()
-    item_id = item[1]
-    features_ind = item[10:]
-    features = {}
-    for i in range(len(features_ind)):
-        features[categories[i]] = float(features_ind[i])
-    return (item_id, features)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        items = IdEncoder(series.cat.categories)
+    else:
+        items, _ = IdEncoder.from_series(series)
+    return sparse.csr_matrix(category_matrix)[items.lookup(ids)]
 
 
 def train_model(
                df, user_id_col='user_id', item_id_col='business_id',
-               item_name_col='name_business', evaluate=True):
+               item_name_col='name_business', evaluate=True,
+               rating_col='stars', aggregate=None, category_matrix=None,
+               category_names=None, warm_start=None, epochs=DEFAULT_EPOCHS,
+               patience=None, refit_epochs=DEFAULT_REFIT_EPOCHS):
     """ Train the model using collaborative filtering.
+        With evaluate, the features and interactions built for training
+        are split into training and testing sets, the model is trained
+        for epochs on the training set then refit on every review for
+        refit_epochs, see training.evaluate_and_fit.
     Args:
         df: the input dataframe.
         user_id_col: user id column.
         item_id_col: item id column.
         item_name_col: item name column.
         evaluate: if evaluate the model performance.
+        rating_col: rating column, used as interaction weight.
+        aggregate: how to reduce repeated user-item ratings, see
+            interactions.build_interactions.
+        category_matrix: sparse item feature matrix by item code, as
+            returned by prepare_data_features(sparse_categories=True),
+            used instead of the category columns of df.
+        category_names: the names of the columns of category_matrix.
+        warm_start: the artifact.Artifact, or the tuple returned by
+            train_model, of a previous training to start from: the
+            parameters of the users, items and features it shares with
+            this training are copied, only the new ones are random.
+        epochs: maximum number of epochs, on the training set of the
+            evaluation with evaluate.
+        patience: number of epochs without validation AUC improvement
+            before stopping early, see training.fit_model.
+        refit_epochs: number of epochs on every review after the
+            evaluation, or after early stopping on held-out reviews.
     Returns:
         model_full: the trained model.
-        df_interactions: dataframe with user-item interactions.
-        user_dict: user dictionary containing user_id as key and
-            interaction_index as value.
-        item_dict: item dictionary containing item_id as key and
-            item_name as value.
+        df_interactions: InteractionStore of the user-item interactions.
+        user_dict: IdEncoder mapping user_id to interaction_index.
+        item_dict: LabelMap mapping item_id to item_name.
         user_feature_map: the feature map of users
         business_feature_map: the feature map of items
+        feature_store: FeatureStore of the user and item features the
+            model was trained with, to be passed to the recommenders in
+            place of df.
     """
-    if evaluate:
-        print('Evaluating model...')
-        evaluate_model(df, user_id_col='user_id', item_id_col='business_id')
     print('Training model...')
+    user_encoder, user_codes = IdEncoder.from_series(df[user_id_col])
+    item_encoder, item_codes = IdEncoder.from_series(df[item_id_col])
 
     # build recommendations for known users and known businesses
     # with collaborative filtering method
-    ds_full = Dataset()
-    # we call fit to supply userid, item id and user/item features
-    user_cols = ['user_id', 'average_stars']
-    categories = [c for c in df.columns if c[0].isupper()]
-    item_cols = ['business_id', 'state']
-
-    for i in df.columns[10:]:
-        item_cols.append(str(i))
+    # the user feature is the average rating and the item features are
+    # the category columns; rows are the codes, as in the interactions
+    user_features = ['average_stars']
+    users_features = build_user_features(
+        df, user_encoder, user_features, user_id_col)
+    if category_matrix is not None:
+        item_features = list(category_names or range(
+            category_matrix.shape[1]))
+        items_features = build_category_features(
+            item_encoder, _category_rows(
+                category_matrix, df[item_id_col], item_encoder.ids))
+    else:
+        item_features = [str(c) for c in df.columns[10:]]
+        items_features = build_item_features(
+            df, item_encoder, df.columns[10:], item_id_col)
 
-    user_features = user_cols[1:]
-    item_features = item_cols[2:]
-
-    ds_full.fit(
-        df[user_id_col].unique(),  # all the users
-        df[item_id_col].unique(),  # all the items
-        user_features=user_features,  # additional user features
-        item_features=item_features
-         )
-
-    df_users = df.drop_duplicates(user_id_col)
-    # df_users = df[df.duplicated(user_id_col) == False]
-    users_features = []
-    for i in range(len(df_users)):
-        users_features.append(get_users_features_tuple(df_users.values[i]))
-    users_features = ds_full.build_user_features(
-        users_features, normalize=False)
-
-    items = df.drop_duplicates(item_id_col)
-    # items = df[df.duplicated(item_id_col) == False]
-    items_features = []
-    for i in range(len(items)):
-        items_features.append(get_items_features_tuple(
-            items.values[i], categories))
-    items_features = ds_full.build_item_features(
-        items_features, normalize=False)
-
-    (interactions, weights) = ds_full.build_interactions(
-        [(x[0], x[1], x[2]) for x in df.values])
+    (interactions, weights) = build_interactions(
+        user_codes, item_codes, df[rating_col].values,
+        shape=(len(user_encoder), len(item_encoder)), aggregate=aggregate)
     # model
     model_full = LightFM(
         no_components=100, learning_rate=0.05, loss='warp', max_sampled=50)
-    model_full.fit(
-        interactions, user_features=users_features,
-        item_features=items_features, sample_weight=weights,
-        epochs=10, num_threads=10)
-    # mapping
-    user_id_map, user_feature_map, business_id_map, business_feature_map = \
-        ds_full.mapping()
-
+    if warm_start is not None:
+        previous, previous_interactions, previous_store = \
+            previous_training(warm_start)
+        previous_user_features = previous_item_features = ()
+        if previous_store is not None:
+            previous_user_features = previous_store.user_feature_names
+            previous_item_features = previous_store.item_feature_names
+        warm_start_model(
+            model_full, previous,
+            aligned_rows(previous_interactions.users, previous_user_features,
+                         user_encoder, user_features),
+            aligned_rows(previous_interactions.items, previous_item_features,
+                         item_encoder, item_features))
+    if evaluate:
+        print('Evaluating model...')
+        evaluate_and_fit(
+            model_full, user_codes, item_codes, df[rating_col].values,
+            interactions.shape, aggregate=aggregate, epochs=epochs,
+            patience=patience, refit_epochs=refit_epochs,
+            user_features=users_features, item_features=items_features,
+            interactions=interactions, weights=weights)
+    else:
+        fit_model(
+            model_full, interactions, weights, epochs=epochs,
+            patience=patience, refit_epochs=refit_epochs,
+            user_features=users_features, item_features=items_features)
     # data preparation
-    df_interactions = pd.DataFrame(weights.todense())
-    df_interactions.index = list(user_id_map.keys())
-    df_interactions.columns = list(business_id_map.keys())
-    user_dict = user_id_map
-    item_dict = df.set_index(item_id_col)[item_name_col].to_dict()
+    df_interactions = InteractionStore(weights, user_encoder, item_encoder)
+    feature_store = FeatureStore(
+        users_features, items_features, user_encoder, item_encoder,
+        user_features, item_features)
+    # mapping
+    user_feature_map = feature_store.user_feature_map
+    business_feature_map = feature_store.item_feature_map
+    user_dict = user_encoder
+    item_dict = LabelMap.from_codes(
+        item_encoder, item_codes, df[item_name_col].values)
     return model_full, df_interactions, user_dict, \
-        item_dict, user_feature_map, business_feature_map
+        item_dict, user_feature_map, business_feature_map, feature_store
+
+
+def update_model(
+                model, interactions, item_dict, feature_store, df,
+                user_id_col='user_id', item_id_col='business_id',
+                item_name_col='name_business', rating_col='stars',
+                aggregate=None, category_matrix=None, replay=0, epochs=1,
+                random_state=None):
+    """ Update a trained model with new reviews, with fit_partial on the
+        new reviews only instead of training again on the whole history.
+        Hybrid version of model_cf.update_model
+    Args:
+        model: the trained model, updated in place.
+        interactions: InteractionStore the model was trained with.
+        item_dict: LabelMap of the item names.
+        feature_store: FeatureStore the model was trained with.
+        df: the dataframe of the new reviews, with the feature columns of
+            the training dataframe.
+        user_id_col: user id column.
+        item_id_col: item id column.
+        item_name_col: item name column.
+        rating_col: rating column, used as interaction weight.
+        aggregate: how to reduce repeated user-item ratings, see
+            interactions.build_interactions.
+        category_matrix: sparse item feature matrix of the new reviews by
+            item code, as returned by
+            prepare_data_features(sparse_categories=True), used instead of
+            the category columns of df.
+        replay: number of older interactions sampled and trained on with
+            the new ones.
+        epochs: number of passes over the new interactions.
+        random_state: seed of the replay sample.
+    Returns:
+        model_full: the updated model.
+        df_interactions: InteractionStore of every user-item interaction.
+        user_dict: IdEncoder mapping user_id to interaction_index.
+        item_dict: LabelMap mapping item_id to item_name.
+        user_feature_map: the feature map of users
+        business_feature_map: the feature map of items
+        feature_store: FeatureStore of every user and item.
+    """
+    print('Updating model with {} reviews...'.format(len(df)))
+    ratings = df[rating_col].values
+    df_interactions, user_codes, item_codes = extend_interactions(
+        interactions, np.asarray(df[user_id_col]),
+        np.asarray(df[item_id_col]), ratings)
+    n_users, n_items = interactions.shape
+    new_users = df_interactions.users.ids[n_users:]
+    new_items = df_interactions.items.ids[n_items:]
+    # the features of new users and items are read from their first
+    # review, as train_model does
+    first_users = df.drop_duplicates(user_id_col)
+    first_users = first_users[np.isin(
+        np.asarray(first_users[user_id_col]), new_users)]
+    if category_matrix is not None:
+        item_ids = new_items
+        item_values = _category_rows(category_matrix, df[item_id_col],
+                                     new_items)
+    else:
+        first_items = df.drop_duplicates(item_id_col)
+        first_items = first_items[np.isin(
+            np.asarray(first_items[item_id_col]), new_items)]
+        item_ids = np.asarray(first_items[item_id_col])
+        item_values = first_items[df.columns[10:]].values.astype(np.float32)
+    feature_store = feature_store.extend(
+        df_interactions.users, df_interactions.items,
+        np.asarray(first_users[user_id_col]),
+        first_users[['average_stars']].values.astype(np.float32),
+        item_ids, item_values)
+    # the identity features of new users and items follow the known ones,
+    # before the named features
+    grow_model(model, len(new_users), len(new_items), user_offset=n_users,
+               item_offset=n_items)
+    fit_delta(model, df_interactions, user_codes, item_codes, ratings,
+              replay_from=interactions, replay=replay, epochs=epochs,
+              num_threads=10, aggregate=aggregate,
+              random_state=random_state,
+              user_features=feature_store.user_features,
+              item_features=feature_store.item_features)
+    user_dict = df_interactions.users
+    item_dict = extend_labels(item_dict, df_interactions.items, item_codes,
+                              df[item_name_col].values)
+    return model, df_interactions, user_dict, item_dict, \
+        feature_store.user_feature_map, feature_store.item_feature_map, \
+        feature_store
 
 
 def evaluate_model(
                   df, user_id_col='user_id',
-                  item_id_col='business_id', stratify=None):
+                  item_id_col='business_id', stratify=None,
+                  rating_col='stars', aggregate=None, category_matrix=None,
+                  epochs=DEFAULT_EPOCHS, k=evaluation.DEFAULT_K, n_users=None,
+                  n_jobs=None):
     """ Model evaluation.
     Args:
         df: the input dataframe.
         user_id_col: user id column.
         item_id_col: item id column.
         stratify: if use stratification.
-    No return value
+        rating_col: rating column, used as interaction weight.
+        aggregate: how to reduce repeated user-item ratings.
+        category_matrix: sparse item feature matrix by item code, used
+            instead of the category columns of df.
+        epochs: number of epochs.
+        k: cutoff of the testing precision, recall and NDCG.
+        n_users: number of users sampled to measure the model, every user
+            when None.
+        n_jobs: number of evaluation threads, see evaluation.user_metrics.
+    Returns:
+        train_auc: training set auc score.
+        test_metrics: summary DataFrame of the testing set precision@k,
+            recall@k, NDCG@k, MAP and AUC, see evaluation.summarize.
     """
     # create test and train datasets
     print('model evaluation')
-    train, test = train_test_split(df, test_size=0.2, stratify=stratify)
-    ds = Dataset()
-    # we call fit to supply userid, item id and user/item features
-    user_cols = ['user_id', 'average_stars']
-    categories = [c for c in df.columns if c[0].isupper()]
-    item_cols = ['business_id', 'state']
-
-    for i in df.columns[10:]:
-        item_cols.append(str(i))
-
-    user_features = user_cols[1:]
-    item_features = item_cols[2:]
-
-    ds.fit(
-        df[user_id_col].unique(),  # all the users
-        df[item_id_col].unique(),  # all the items
-        user_features=user_features,  # additional user features
-        item_features=item_features
-         )
-
-    train_users = train.drop_duplicates('user_id')
-    # train_users = train[train.duplicated('user_id') == False]
-    train_user_features = []
-    for i in range(len(train_users)):
-        train_user_features.append(get_users_features_tuple(
-            train_users.values[i]))
-    train_user_features = ds.build_user_features(
-        train_user_features, normalize=False)
-
-    test_users = test.drop_duplicates('user_id')
-    # test_users = test[test.duplicated('user_id') == False]
-    test_user1_features = []
-    for i in range(len(test_users)):
-        test_user1_features.append(get_users_features_tuple(
-            test_users.values[i]))
-    test_user_features = ds.build_user_features(
-        test_user1_features, normalize=False)
-
-    train_items = train.drop_duplicates('business_id')
-    # train_items = train[train.duplicated('business_id') == False]
-    train_item1_features = []
-    for i in range(len(train_items)):
-        train_item1_features.append(get_items_features_tuple(
-            train_items.values[i], categories))
-    train_item_features = ds.build_item_features(
-        train_item1_features, normalize=False)
-
-    test_items = test.drop_duplicates('business_id')
-    # test_items = test[test.duplicated('business_id') == False]
-    test_item_features = []
-    for i in range(len(test_items)):
-        test_item_features.append(get_items_features_tuple(
-            test_items.values[i], categories))
-    test_item_features = ds.build_item_features(
-        test_item_features, normalize=False)
+    train_x, test_x = train_test_split(
+        np.arange(len(df)), test_size=0.2, stratify=stratify)
+    train, test = df.iloc[train_x], df.iloc[test_x]
+    user_encoder, user_codes = IdEncoder.from_series(df[user_id_col])
+    item_encoder, item_codes = IdEncoder.from_series(df[item_id_col])
+    ratings = df[rating_col].values
+    shape = (len(user_encoder), len(item_encoder))
+    # users and items of the other set only get their identity feature
+    item_features = df.columns[10:]
+    train_user_features = build_user_features(
+        train, user_encoder, user_id_col=user_id_col)
+    test_user_features = build_user_features(
+        test, user_encoder, user_id_col=user_id_col)
+    if category_matrix is not None:
+        category_matrix = _category_rows(category_matrix, df[item_id_col],
+                                         item_encoder.ids)
+        train_item_features = build_category_features(
+            item_encoder, category_matrix, item_codes[train_x])
+        test_item_features = build_category_features(
+            item_encoder, category_matrix, item_codes[test_x])
+    else:
+        train_item_features = build_item_features(
+            train, item_encoder, item_features, item_id_col)
+        test_item_features = build_item_features(
+            test, item_encoder, item_features, item_id_col)
 
     # plugging in the interactions and their weights
-    (train_interactions, train_weights) = ds.build_interactions(
-        [(x[0], x[1], x[2]) for x in train.values])
-    (test_interactions, test_weights) = ds.build_interactions(
-        [(x[0], x[1], x[2]) for x in test.values])
+    (train_interactions, train_weights) = build_interactions(
+        user_codes[train_x], item_codes[train_x], ratings[train_x], shape,
+        aggregate)
+    (test_interactions, test_weights) = build_interactions(
+        user_codes[test_x], item_codes[test_x], ratings[test_x], shape,
+        aggregate)
 
     # model
     model = LightFM(
@@ -217,14 +324,18 @@ def evaluate_model(
     model.fit(
         train_interactions, user_features=train_user_features,
         item_features=train_item_features, sample_weight=train_weights,
-        epochs=10, num_threads=10)
+        epochs=epochs, num_threads=10)
 
-    # auc-roc
-    train_auc = auc_score(
-        model, train_interactions, user_features=train_user_features,
-        item_features=train_item_features, num_threads=20).mean()
+    # auc-roc of the training set, ranking metrics of the testing set
+    train_auc = evaluation.evaluate(
+        model, train_interactions, k=k, n_users=n_users,
+        user_features=train_user_features,
+        item_features=train_item_features, n_jobs=n_jobs).loc['auc', 'mean']
     print('Training set AUC: %s' % train_auc)
-    test_auc = auc_score(
-        model, test_interactions, user_features=test_user_features,
-        item_features=test_item_features, num_threads=20).mean()
-    print('Testing set AUC: %s' % test_auc)
+    test_metrics = evaluation.evaluate(
+        model, test_interactions, train_interactions, k=k, n_users=n_users,
+        user_features=test_user_features, item_features=test_item_features,
+        n_jobs=n_jobs)
+    print('Testing set AUC: %s' % test_metrics.loc['auc', 'mean'])
+    print(test_metrics)
+    return train_auc, test_metrics
@@ -0,0 +1,193 @@
+"""
+NAME
+    ranking
+DESCRIPTION
+    This module provides access to functions that select the best scored
+        items or users of a recommendation.
+FUNCTIONS
+    top_k(scores, k, exclude)
+        Return the indexes of the k largest scores in descending order.
+
+    rows_top_k(scores, k)
+        Return the indexes and values of the k largest scores of each row.
+
+    merge_top_k(indexes, values, other_indexes, other_values, k)
+        Return the k best entries of each row of two rankings.
+
+    batch_top_k(query_biases, query_embeddings, target_biases,
+        target_embeddings, k, exclude, block_size, target_block_size)
+        Return the k best targets of every query, scored block by block.
+"""
+
+import numpy as np
+from scipy import sparse
+
+DEFAULT_BLOCK_SIZE = 256
+
+
+def top_k(scores, k, exclude=None):
+    """ Select the k largest scores with a partial selection, in
+    O(n + k log k) instead of sorting every score.
+    Args:
+        scores: 1-d array of scores.
+        k: number of indexes to return.
+        exclude: boolean mask of the indexes that must not be returned.
+    Returns:
+        The int indexes of the k largest scores, by descending score and
+        ascending index among equal scores; fewer than k if there are not
+        enough scores left.
+    """
+    scores = np.asarray(scores)
+    n = len(scores)
+    if exclude is not None:
+        exclude = np.asarray(exclude, dtype=bool)
+        scores = np.where(exclude, -np.inf, scores)
+        n -= int(exclude.sum())
+    k = max(min(k, n), 0)
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        kth = scores[candidates].min()
+        if (scores == kth).sum() > (scores[candidates] == kth).sum():
+            # the partition cuts through equal scores, keep the first ones
+            above = np.flatnonzero(scores > kth)
+            candidates = np.concatenate([
+                above, np.flatnonzero(scores == kth)[:k - len(above)]])
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+
+def rows_top_k(scores, k):
+    """ Select the k largest scores of every row of a matrix.
+    Args:
+        scores: 2-d array of scores, -inf for excluded entries.
+        k: number of indexes to return per row.
+    Returns:
+        indexes: (n_rows, k) int32 column indexes by descending score and
+            ascending index among equal scores, -1 past the last
+            non excluded entry.
+        values: (n_rows, k) float32 corresponding scores.
+    """
+    n_rows, n_cols = scores.shape
+    k = max(min(k, n_cols), 0)
+    if k == 0:
+        return (np.empty((n_rows, 0), dtype=np.int32),
+                np.empty((n_rows, 0), dtype=np.float32))
+    if k < n_cols:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        kth = np.take_along_axis(scores, candidates, axis=1).min(
+            axis=1)[:, np.newaxis]
+        tied = np.flatnonzero(
+            (scores == kth).sum(axis=1)
+            > (np.take_along_axis(scores, candidates, axis=1)
+               == kth).sum(axis=1))
+        if len(tied):
+            # rows whose partition cuts through equal scores keep the first
+            # ones, as top_k does
+            block, kth = scores[tied], kth[tied]
+            above = block > kth
+            equal = block == kth
+            n_equal = k - above.sum(axis=1, keepdims=True)
+            kept = above | (equal & (np.cumsum(equal, axis=1) <= n_equal))
+            candidates[tied] = np.argsort(~kept, axis=1, kind='stable')[:, :k]
+    else:
+        candidates = np.tile(np.arange(n_cols), (n_rows, 1))
+    values = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates.ravel(), -values.ravel(),
+                        np.repeat(np.arange(n_rows), k)))
+    indexes = candidates.ravel()[order].reshape(n_rows, k).astype(np.int32)
+    values = values.ravel()[order].reshape(n_rows, k).astype(np.float32)
+    indexes[np.isneginf(values)] = -1
+    return indexes, values
+
+
+def merge_top_k(indexes, values, other_indexes, other_values, k):
+    """ Merge two rankings of the same rows, as returned by rows_top_k.
+    Args:
+        indexes, values: (n_rows, k1) first ranking.
+        other_indexes, other_values: (n_rows, k2) second ranking, of other
+            columns.
+        k: number of entries to keep per row.
+    Returns:
+        indexes: (n_rows, k) int32 indexes by descending value and
+            ascending index among equal values, -1 past the last entry.
+        values: (n_rows, k) float32 corresponding values.
+    """
+    indexes = np.hstack([indexes, other_indexes])
+    values = np.hstack([values, other_values]).astype(np.float32)
+    n_rows, n_cols = values.shape
+    k = max(min(k, n_cols), 0)
+    rows = np.repeat(np.arange(n_rows), n_cols)
+    order = np.lexsort((indexes.ravel(), -values.ravel(), rows))
+    order = order.reshape(n_rows, n_cols)[:, :k]
+    indexes = indexes.ravel()[order].astype(np.int32)
+    values = values.ravel()[order]
+    indexes[np.isneginf(values)] = -1
+    return indexes, values
+
+
+def batch_top_k(query_biases, query_embeddings, target_biases,
+                target_embeddings, k, exclude=None,
+                block_size=DEFAULT_BLOCK_SIZE, target_block_size=None):
+    """ Score every query against every target and keep the k best.
+
+    Scores are the dot products of the embeddings plus both biases, as
+    lightfm predicts them, computed as one matrix product per block of
+    block_size queries, so that memory is bound by block_size times the
+    number of targets and the products use every BLAS thread. With
+    target_block_size, targets are also scored by blocks whose best k are
+    merged into a running ranking of every query, bounding memory by
+    block_size times target_block_size however many targets there are.
+
+    Args:
+        query_biases: (n_queries,) biases of the queries.
+        query_embeddings: (n_queries, dim) embeddings of the queries.
+        target_biases: (n_targets,) biases of the targets.
+        target_embeddings: (n_targets, dim) embeddings of the targets.
+        k: number of targets to return per query.
+        exclude: sparse (n_queries, n_targets) matrix whose non zero
+            entries must not be returned.
+        block_size: number of queries scored at once.
+        target_block_size: number of targets scored at once, all of them
+            when None.
+    Returns:
+        indexes: (n_queries, k) int32 indexes of the best targets, -1
+            when fewer than k targets are left.
+        scores: (n_queries, k) float32 corresponding scores.
+    """
+    n_queries = len(query_embeddings)
+    n_targets = len(target_embeddings)
+    k = max(min(k, n_targets), 0)
+    target_block_size = target_block_size or max(n_targets, 1)
+    indexes = np.empty((n_queries, k), dtype=np.int32)
+    scores = np.empty((n_queries, k), dtype=np.float32)
+    if exclude is not None:
+        exclude = sparse.csr_matrix(exclude)
+    target_embeddings_t = np.ascontiguousarray(target_embeddings.T)
+    for start in range(0, n_queries, block_size):
+        end = min(start + block_size, n_queries)
+        best = rows_top_k(np.empty((end - start, 0)), k)
+        excluded = None
+        if exclude is not None:
+            excluded = exclude[start:end].tocoo()
+        for target_start in range(0, n_targets, target_block_size):
+            target_end = min(target_start + target_block_size, n_targets)
+            block = (query_embeddings[start:end]
+                     @ target_embeddings_t[:, target_start:target_end])
+            block += query_biases[start:end, np.newaxis]
+            block += target_biases[np.newaxis, target_start:target_end]
+            if excluded is not None:
+                inside = ((excluded.col >= target_start)
+                          & (excluded.col < target_end))
+                block[excluded.row[inside],
+                      excluded.col[inside] - target_start] = -np.inf
+            block_indexes, block_scores = rows_top_k(block, k)
+            block_indexes[block_indexes >= 0] += target_start
+            if target_start == 0:
+                best = block_indexes, block_scores
+            else:
+                best = merge_top_k(*best, block_indexes, block_scores, k)
+        indexes[start:end], scores[start:end] = best
+    return indexes, scores
@@ -20,14 +20,56 @@ FUNCTIONS
         df, model, interactions, new_user_features,
         user_dict, item_dict, topn, show)
         Return the recommended items to a new user.
+    recommend_hybrid_users_batch(
+        df, model, interactions, user_ids, topn, new_only,
+        threshold, exclude_seen, block_size)
+        Return the recommended items to many existing users at once.
+    recommend_hybrid_items_batch(
+        df, model, interactions, item_ids, topn, block_size)
+        Return the recommended users to many existing items at once.
+    recommend_hybrid_new_items_batch(
+        df, model, interactions, new_item_features, topn, block_size)
+        Return the recommended users to many new items at once.
+    recommend_hybrid_new_users_batch(
+        df, model, interactions, new_user_features, topn, block_size)
+        Return the recommended items to many new users at once.
 """
 
 import pandas as pd
 import numpy as np
-from yelpify.data_preparation import feature_matrix
+from yelpify.features import FeatureStore, build_user_features, \
+    build_item_features
+from yelpify.interactions import as_interaction_store
+from yelpify.ranking import top_k, batch_top_k, DEFAULT_BLOCK_SIZE
+from yelpify.scoring import ScoringEngine, score_items, score_users
 from scipy import sparse
 
 
+def _as_feature_store(df, interactions):
+    """ Return the FeatureStore of a review dataframe, built as
+    model_hybrid.train_model builds it, with the rows of the interactions;
+    a FeatureStore is returned as is. The model then scores the same
+    features whether it is given the dataframe or the store.
+    """
+    if isinstance(df, FeatureStore):
+        return df
+    item_columns = df.columns[10:]
+    return FeatureStore(
+        build_user_features(df, interactions.users),
+        build_item_features(df, interactions.items, item_columns),
+        interactions.users, interactions.items, ['average_stars'],
+        [str(c) for c in item_columns])
+
+
+def _store_features(df):
+    """ Return the user and item feature matrices of a FeatureStore, or
+    None for a dataframe.
+    """
+    if isinstance(df, FeatureStore):
+        return df.user_features, df.item_features
+    return None, None
+
+
 # function to make prediction for known items
 def recommend_hybrid_item(
                          df, model, interactions, item_id,
@@ -35,9 +77,12 @@ def recommend_hybrid_item(
     """Funnction to produce a list of top N interested users for a given item.
        Hybrid version of recommend_known_item
     Args:
-        df: The orginal data frame
-        model: Trained matrix factorization model
-        interactions: dataset used for training the model
+        df: The orginal data frame, whose features are built as
+            model_hybrid.train_model builds them, or the FeatureStore it
+            returned
+        model: Trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
         item_id: item ID for which we need to generate recommended users
         user_dict: Dictionary type input containing user_id as key
             and interaction_index as value
@@ -49,15 +94,14 @@ def recommend_hybrid_item(
         user_list: List of recommended users
     """
     print('Recommending users for item {}...'.format(item_id))
+    interactions = as_interaction_store(interactions)
     n_users, n_items = interactions.shape
-    user_features, item_features, _, item_x = feature_matrix(
-        df, item_id=item_id)
-    scores = pd.Series(model.predict(
-        item_x, interactions.values[:, item_x], user_features=item_features,
-        item_features=user_features))
-
-    user_list = list(interactions.index[scores.sort_values(
-        ascending=False).head(topn).index])
+    if not isinstance(model, ScoringEngine):
+        df = _as_feature_store(df, interactions)
+    scores = score_users(model, interactions.items[item_id], n_users,
+                         *_store_features(df))
+
+    user_list = list(interactions.index[top_k(scores, topn)])
     if show is True:
         print("Recommended Users:")
         counter = 1
@@ -70,12 +114,16 @@ def recommend_hybrid_item(
 def recommend_hybrid_user(
                          df, model, interactions, user_id, user_dict,
                          item_dict, topn, new_only=True, threshold=3,
-                         show=True):
+                         show=True, exclude_seen=False):
     """Function to produce user recommendations. Hybrid version of
         recommend_known_user
     Args:
-        model: trained matrix factorization model
-        interactions: dataset used for training the model
+        df: The orginal data frame, whose features are built as
+            model_hybrid.train_model builds them, or the FeatureStore it
+            returned
+        model: trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
         user_id: user ID for which we need to generate recommendation
         user_dict: Dictionary type input containing user_id as key and
             interaction_index as value
@@ -86,28 +134,27 @@ def recommend_hybrid_user(
         topn: Number of output recommendation needed
         new_only: whether to only recommend items that users have not visited
         show: whether to show the result of function
+        exclude_seen: whether to exclude every item the user interacted
+            with, whatever the rating
     Returns:
         Prints list of items the given user has already visited
         Prints list of N recommended items  which user hopefully will be
             interested in
     """
     print('Recommending items for user {}...'.format(user_id))
+    interactions = as_interaction_store(interactions)
     n_users, n_items = interactions.shape
-    user_features, item_features, user_x, _ = feature_matrix(
-        df, user_id=user_id)
-
-    scores = pd.Series(model.predict(
-        user_x, interactions.values[user_x, :], user_features=user_features,
-        item_features=item_features))
-    scores.index = interactions.columns
-    scores = list(pd.Series(scores.sort_values(ascending=False).index))
-    known_items = list(pd.Series(
-        interactions.loc[user_id, :]
-        [interactions.loc[user_id, :] > threshold].index).sort_values(
-            ascending=False))
-    if new_only:
-        scores = [x for x in scores if x not in known_items]
-    item_list = scores[:topn]
+    row_x = interactions.users[user_id]
+    if not isinstance(model, ScoringEngine):
+        df = _as_feature_store(df, interactions)
+    scores = score_items(model, row_x, n_items, *_store_features(df))
+    known_items = interactions.known_items(user_id, threshold)
+    exclude = None
+    if exclude_seen:
+        exclude = interactions.exclusion_mask(row_x)
+    elif new_only:
+        exclude = interactions.exclusion_mask(row_x, threshold)
+    item_list = list(interactions.columns[top_k(scores, topn, exclude)])
     known_items = list(pd.Series(known_items).apply(lambda x: item_dict[x]))
     recommended_items = list(pd.Series(item_list).apply(
         lambda x: item_dict[x]))
@@ -131,10 +178,14 @@ def recommend_hybrid_new_item(
                              user_dict, item_dict, topn, show=True):
     """Funnction to produce a list of top N interested users for a new item.
     Args:
-        df: The orginal data frame
-        model: Trained matrix factorization model
-        interactions: dataset used for training the model
-        item_id: item ID for which we need to generate recommended users
+        df: The orginal data frame, whose features are built as
+            model_hybrid.train_model builds them, or the FeatureStore it
+            returned; anything else raises TypeError
+        model: Trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        new_item_features: (1, n_item_features) array or sparse matrix of
+            the feature values of the new item
         user_dict: Dictionary type input containing user_id as key and
             interaction_index as value
         item_dict: Dictionary type input containing item_id as key and
@@ -145,16 +196,17 @@ def recommend_hybrid_new_item(
         user_list: List of recommended users
     """
     print('Recommending users for new items')
-    n_users, n_items = interactions.shape
-    user_features, item_features, _, _ = feature_matrix(df)
+    interactions = as_interaction_store(interactions)
+    if isinstance(df, pd.DataFrame):
+        df = _as_feature_store(df, interactions)
+    user_biases, user_embeddings, _, _ = _hybrid_representations(
+        df, model, interactions)
+    item_biases, item_embeddings = _new_representations(
+        df, model, new_item_features, 'item')
+    scores = (user_embeddings @ item_embeddings[0] + user_biases
+              + item_biases[0])
 
-    csr_new_item_features = sparse.csr_matrix(new_item_features)
-    scores = pd.Series(model.predict(
-        0, np.zeros(n_users), user_features=csr_new_item_features,
-        item_features=user_features))
-
-    user_list = list(interactions.index[
-        scores.sort_values(ascending=False).head(topn).index])
+    user_list = list(interactions.index[top_k(scores, topn)])
     if show is True:
         print("Recommended Users:")
         counter = 1
@@ -166,38 +218,39 @@ def recommend_hybrid_new_item(
 
 def recommend_hybrid_new_user(
                              df, model, interactions, new_user_features,
-                             user_dict, item_dict, topn, new_only=False,
-                             threshold=3, show=True):
+                             user_dict, item_dict, topn, show=True):
     """Function to produce user recommendations.
     Args:
-        model: trained matrix factorization model
-        interactions: dataset used for training the model
-        user_id: user ID for which we need to generate recommendation
+        df: The orginal data frame, whose features are built as
+            model_hybrid.train_model builds them, or the FeatureStore it
+            returned; anything else raises TypeError
+        model: trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        new_user_features: (1, n_user_features) array or sparse matrix of
+            the feature values of the new user
         user_dict: Dictionary type input containing user_id as key and
             interaction_index as value
         item_dict: Dictionary type input containing item_id as key and
             item_name as value
-        threshold: value above which the rating is favorable in interaction
-            matrix
         topn: Number of output recommendation needed
-        new_only: whether to only recommend items that users have not visited
         show: whether to show the result of function
     Returns:
         Prints list of N recommended items which user hopefully will
             be interested in
     """
     print('Recommending items for new users')
-    n_users, n_items = interactions.shape
-    csr_new_user_features = sparse.csr_matrix(new_user_features)
-
-    user_features, item_features, _, _ = feature_matrix(df)
-    scores = pd.Series(model.predict(
-        0, np.zeros(n_items), user_features=csr_new_user_features,
-        item_features=item_features))
-    scores.index = interactions.columns
-    scores = list(pd.Series(scores.sort_values(ascending=False).index))
+    interactions = as_interaction_store(interactions)
+    if isinstance(df, pd.DataFrame):
+        df = _as_feature_store(df, interactions)
+    _, _, item_biases, item_embeddings = _hybrid_representations(
+        df, model, interactions)
+    user_biases, user_embeddings = _new_representations(
+        df, model, new_user_features, 'user')
+    scores = (item_embeddings @ user_embeddings[0] + item_biases
+              + user_biases[0])
 
-    item_list = scores[:topn]
+    item_list = list(interactions.columns[top_k(scores, topn)])
     recommended_items = list(pd.Series(item_list).apply(
         lambda x: item_dict[x]))
     if show is True:
@@ -207,3 +260,181 @@ def recommend_hybrid_new_user(
             print(str(counter) + '- ' + i)
             counter += 1
     return item_list
+
+
+def _hybrid_representations(df, model, interactions):
+    """ Return the user and item representations of the model from the
+    features of the FeatureStore, by row and column of the interactions;
+    an engine has them already, and needs no store.
+    """
+    engine = isinstance(model, ScoringEngine)
+    if not isinstance(df, FeatureStore) and not (engine and df is None):
+        raise TypeError('Expected the FeatureStore returned by '
+                        'model_hybrid.train_model, got {}'.format(
+                            type(df).__name__))
+    if engine:
+        return (model.get_user_representations()
+                + model.get_item_representations())
+    return (model.get_user_representations(df.user_features)
+            + model.get_item_representations(df.item_features))
+
+
+def _new_representations(df, model, features, side):
+    """ Return the representations of new users or items from their
+    feature values, placed after the identity block by the FeatureStore
+    df, with one sparse by dense product of the feature embeddings of the
+    model.
+    """
+    if not isinstance(df, FeatureStore):
+        raise TypeError('New {}s are placed after the identity features '
+                        'by a FeatureStore, got {}'.format(
+                            side, type(df).__name__))
+    if side == 'user':
+        features = df.new_user_features(features)
+    else:
+        features = df.new_item_features(features)
+    if isinstance(model, ScoringEngine):
+        if side == 'user':
+            return model.new_user_representations(features)
+        return model.new_item_representations(features)
+    features = sparse.csr_matrix(features, dtype=np.float32)
+    if side == 'user':
+        features.resize(features.shape[0], len(model.user_embeddings))
+        return model.get_user_representations(features)
+    features.resize(features.shape[0], len(model.item_embeddings))
+    return model.get_item_representations(features)
+
+
+def recommend_hybrid_users_batch(
+                                df, model, interactions, user_ids, topn,
+                                new_only=True, threshold=3,
+                                exclude_seen=False,
+                                block_size=DEFAULT_BLOCK_SIZE):
+    """Function to produce the recommendations of many users in one call.
+        Batch version of recommend_hybrid_user
+    Args:
+        df: The FeatureStore returned by model_hybrid.train_model, None
+            with a ScoringEngine; a review dataframe raises TypeError
+        model: trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        user_ids: array of the user IDs to generate recommendations for
+        topn: Number of output recommendation needed per user
+        new_only: whether to only recommend items that users have not visited
+        threshold: value above which the rating is favorable in interaction
+            matrix
+        exclude_seen: whether to exclude every item the users interacted
+            with, whatever the rating
+        block_size: number of users scored at once
+    Returns:
+        item_xs: (n_users, topn) int32 array of the recommended item
+            indexes, in interactions.columns, -1 when there are fewer
+        scores: (n_users, topn) float32 array of their scores
+    """
+    print('Recommending items for {} users...'.format(len(user_ids)))
+    interactions = as_interaction_store(interactions)
+    user_xs = interactions.users.lookup(user_ids)
+    user_biases, user_embeddings, item_biases, item_embeddings = \
+        _hybrid_representations(df, model, interactions)
+    exclude = None
+    if exclude_seen:
+        exclude = interactions.exclusion_matrix(user_xs)
+    elif new_only:
+        exclude = interactions.exclusion_matrix(user_xs, threshold)
+    return batch_top_k(user_biases[user_xs], user_embeddings[user_xs],
+                       item_biases, item_embeddings, topn, exclude,
+                       block_size)
+
+
+def recommend_hybrid_items_batch(
+                                df, model, interactions, item_ids, topn,
+                                block_size=DEFAULT_BLOCK_SIZE):
+    """Function to produce the top N interested users of many items in one
+        call. Batch version of recommend_hybrid_item
+    Args:
+        df: The FeatureStore returned by model_hybrid.train_model, None
+            with a ScoringEngine; a review dataframe raises TypeError
+        model: Trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        item_ids: array of the item IDs to generate recommended users for
+        topn: Number of users needed per item
+        block_size: number of items scored at once
+    Returns:
+        user_xs: (n_items, topn) int32 array of the recommended user
+            indexes, in interactions.index
+        scores: (n_items, topn) float32 array of their scores
+    """
+    print('Recommending users for {} items...'.format(len(item_ids)))
+    interactions = as_interaction_store(interactions)
+    item_xs = interactions.items.lookup(item_ids)
+    user_biases, user_embeddings, item_biases, item_embeddings = \
+        _hybrid_representations(df, model, interactions)
+    return batch_top_k(item_biases[item_xs], item_embeddings[item_xs],
+                       user_biases, user_embeddings, topn,
+                       block_size=block_size)
+
+
+def recommend_hybrid_new_items_batch(
+                                    df, model, interactions,
+                                    new_item_features, topn,
+                                    block_size=DEFAULT_BLOCK_SIZE):
+    """Function to produce the top N interested users of many new items in
+        one call, such as the businesses of an onboarding feed. Batch
+        version of recommend_hybrid_new_item
+    Args:
+        df: The FeatureStore returned by model_hybrid.train_model, None
+            with a ScoringEngine; a review dataframe raises TypeError
+        model: Trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        new_item_features: (n_new_items, n_item_features) array or sparse
+            matrix of the feature values of the new items
+        topn: Number of users needed per item
+        block_size: number of items scored at once
+    Returns:
+        user_xs: (n_new_items, topn) int32 array of the recommended user
+            indexes, in interactions.index
+        scores: (n_new_items, topn) float32 array of their scores
+    """
+    print('Recommending users for {} new items...'.format(
+        new_item_features.shape[0]))
+    interactions = as_interaction_store(interactions)
+    user_biases, user_embeddings, _, _ = _hybrid_representations(
+        df, model, interactions)
+    item_biases, item_embeddings = _new_representations(
+        df, model, new_item_features, 'item')
+    return batch_top_k(item_biases, item_embeddings, user_biases,
+                       user_embeddings, topn, block_size=block_size)
+
+
+def recommend_hybrid_new_users_batch(
+                                    df, model, interactions,
+                                    new_user_features, topn,
+                                    block_size=DEFAULT_BLOCK_SIZE):
+    """Function to produce the recommendations of many new users in one
+        call. Batch version of recommend_hybrid_new_user
+    Args:
+        df: The FeatureStore returned by model_hybrid.train_model, None
+            with a ScoringEngine; a review dataframe raises TypeError
+        model: Trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        new_user_features: (n_new_users, n_user_features) array or sparse
+            matrix of the feature values of the new users
+        topn: Number of output recommendation needed per user
+        block_size: number of users scored at once
+    Returns:
+        item_xs: (n_new_users, topn) int32 array of the recommended item
+            indexes, in interactions.columns
+        scores: (n_new_users, topn) float32 array of their scores
+    """
+    print('Recommending items for {} new users...'.format(
+        new_user_features.shape[0]))
+    interactions = as_interaction_store(interactions)
+    _, _, item_biases, item_embeddings = _hybrid_representations(
+        df, model, interactions)
+    user_biases, user_embeddings = _new_representations(
+        df, model, new_user_features, 'user')
+    return batch_top_k(user_biases, user_embeddings, item_biases,
+                       item_embeddings, topn, block_size=block_size)
@@ -12,12 +12,23 @@ FUNCTIONS
         Return the recommended users to an existing item.
 
     recommend_known_user(model, interactions, user_id, user_dict,
-        item_dict, topn, new_only, threshold, show)
+        item_dict, topn, new_only, threshold, show, exclude_seen, index)
         Return the recommended items to an existing user.
+
+    recommend_known_users_batch(model, interactions, user_ids, topn,
+        new_only, threshold, exclude_seen, block_size)
+        Return the recommended items to many existing users at once.
+
+    recommend_known_items_batch(model, interactions, item_ids, topn,
+        block_size)
+        Return the recommended users to many existing items at once.
 """
 
 import pandas as pd
-import numpy as np
+
+from yelpify.interactions import as_interaction_store
+from yelpify.ranking import top_k, batch_top_k, DEFAULT_BLOCK_SIZE
+from yelpify.scoring import score_items, score_users
 
 
 # function to make prediction for known items
@@ -26,8 +37,9 @@ def recommend_known_item(model, interactions, item_id,
     """Funnction to produce a list of top N interested users for a given item
 
     Args:
-        model: Trained matrix factorization model
-        interactions: dataset used for training the model
+        model: Trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
         item_id: item ID for which we need to generate recommended users
         user_dict: Dictionary type input containing user_id as
             key and interaction_index as value
@@ -41,13 +53,11 @@ def recommend_known_item(model, interactions, item_id,
 
     """
     print('Recommending users for item {}...'.format(item_id))
+    interactions = as_interaction_store(interactions)
     n_users, _ = interactions.shape
-    x = np.array(interactions.columns)
-    scores = pd.Series(model.predict(np.arange(n_users),
-                                     np.repeat(x.searchsorted(item_id),
-                                     n_users)))
-    user_list = list(interactions.index
-                     [scores.sort_values(ascending=False).head(topn).index])
+    item_x = interactions.columns.get_loc(item_id)
+    scores = score_users(model, item_x, n_users)
+    user_list = list(interactions.index[top_k(scores, topn)])
     if show is True:
         print("Recommended Users:")
         counter = 1
@@ -60,12 +70,14 @@ def recommend_known_item(model, interactions, item_id,
 # function to make prediction for known users
 def recommend_known_user(model, interactions, user_id,
                          user_dict, item_dict, topn, new_only=False,
-                         threshold=3, show=True):
+                         threshold=3, show=True, exclude_seen=False,
+                         index=None):
     """Function to produce user recommendations
 
     Args:
-        model: trained matrix factorization model
-        interactions: dataset used for training the model
+        model: trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
         user_id: user ID for which we need to generate
             recommendation
         user_dict: Dictionary type input containing user_id
@@ -77,6 +89,10 @@ def recommend_known_user(model, interactions, user_id,
         topn: Number of output recommendation needed
         new_only: whether to only recommend items that users have not visited
         show: whether to show the result of function
+        exclude_seen: whether to exclude every item the user interacted
+            with, whatever the rating
+        index: IVFIndex of the model items, to only score the items of
+            its closest lists instead of every item
 
     Returns:
         Prints list of items the given user has already visited
@@ -85,18 +101,23 @@ def recommend_known_user(model, interactions, user_id,
 
     """
     print('Recommending items for user {}...'.format(user_id))
+    interactions = as_interaction_store(interactions)
     _,  n_items = interactions.shape
     user_x = user_dict[user_id]
-    scores = pd.Series(model.predict(user_x, np.arange(n_items)))
-    scores.index = interactions.columns
-    scores = list(pd.Series(scores.sort_values(ascending=False).index))
-    known_items = list(pd.Series(interactions.loc[user_id, :]
-                                 [interactions.loc[user_id, :] >
-                                 threshold].index).sort_values(ascending=False)
-                       )
-    if new_only:
-        scores = [x for x in scores if x not in known_items]
-    item_list = scores[:topn]
+    known_items = interactions.known_items(user_id, threshold)
+    exclude = None
+    if exclude_seen:
+        exclude = interactions.exclusion_mask(user_x)
+    elif new_only:
+        exclude = interactions.exclusion_mask(user_x, threshold)
+    if index is not None:
+        item_xs, _ = index.search(model.user_biases[user_x],
+                                  model.user_embeddings[user_x], topn,
+                                  exclude)
+    else:
+        scores = score_items(model, user_x, n_items)
+        item_xs = top_k(scores, topn, exclude)
+    item_list = list(interactions.columns[item_xs])
     known_items = list(pd.Series(known_items).apply(lambda x: item_dict[x]))
     recommended_items = list(pd.Series(item_list).apply(
                                                         lambda x: item_dict[x])
@@ -114,3 +135,74 @@ def recommend_known_user(model, interactions, user_id,
             print(str(counter) + '- ' + i)
             counter += 1
     return item_list
+
+
+def recommend_known_users_batch(model, interactions, user_ids, topn,
+                                new_only=False, threshold=3,
+                                exclude_seen=False,
+                                block_size=DEFAULT_BLOCK_SIZE):
+    """Function to produce the recommendations of many users in one call,
+        scoring blocks of users with matrix products of the model
+        representations instead of one predict call per user.
+
+    Args:
+        model: trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        user_ids: array of the user IDs to generate recommendations for
+        topn: Number of output recommendation needed per user
+        new_only: whether to only recommend items that users have not visited
+        threshold: value above which the rating is
+            favorable in interaction matrix
+        exclude_seen: whether to exclude every item the users interacted
+            with, whatever the rating
+        block_size: number of users scored at once
+
+    Returns:
+        item_xs: (n_users, topn) int32 array of the recommended item
+            indexes, in interactions.columns, -1 when there are fewer
+        scores: (n_users, topn) float32 array of their scores
+
+    """
+    print('Recommending items for {} users...'.format(len(user_ids)))
+    interactions = as_interaction_store(interactions)
+    user_xs = interactions.users.lookup(user_ids)
+    user_biases, user_embeddings = model.get_user_representations()
+    item_biases, item_embeddings = model.get_item_representations()
+    exclude = None
+    if exclude_seen:
+        exclude = interactions.exclusion_matrix(user_xs)
+    elif new_only:
+        exclude = interactions.exclusion_matrix(user_xs, threshold)
+    return batch_top_k(user_biases[user_xs], user_embeddings[user_xs],
+                       item_biases, item_embeddings, topn, exclude,
+                       block_size)
+
+
+def recommend_known_items_batch(model, interactions, item_ids, topn,
+                                block_size=DEFAULT_BLOCK_SIZE):
+    """Function to produce the top N interested users of many items in
+        one call.
+
+    Args:
+        model: trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        item_ids: array of the item IDs to generate recommended users for
+        topn: Number of users needed per item
+        block_size: number of items scored at once
+
+    Returns:
+        user_xs: (n_items, topn) int32 array of the recommended user
+            indexes, in interactions.index
+        scores: (n_items, topn) float32 array of their scores
+
+    """
+    print('Recommending users for {} items...'.format(len(item_ids)))
+    interactions = as_interaction_store(interactions)
+    item_xs = interactions.items.lookup(item_ids)
+    user_biases, user_embeddings = model.get_user_representations()
+    item_biases, item_embeddings = model.get_item_representations()
+    return batch_top_k(item_biases[item_xs], item_embeddings[item_xs],
+                       user_biases, user_embeddings, topn,
+                       block_size=block_size)
@@ -0,0 +1,320 @@
+"""
+NAME
+    recommendation_table
+DESCRIPTION
+    This module provides access to functions that precompute the top N
+        recommendations of every user, or the top N users of every
+        business, into memory-mapped files, and serve them without any
+        model computation.
+CLASSES
+    RecommendationTable(path, mmap_mode)
+        Precomputed recommendations read from a table directory.
+FUNCTIONS
+    build_recommendation_table(model, interactions, path, topn, new_only,
+        threshold, exclude_seen, block_size, n_jobs)
+        Write the recommendations of every user and return the table.
+
+    build_item_user_table(model, interactions, path, topn, block_size,
+        user_block_size, n_jobs)
+        Write the top users of every item and return the table.
+
+    recommend_precomputed_user(table, user_id, item_dict, topn, show)
+        Return the precomputed recommendations of a user.
+
+    recommend_precomputed_item(table, model, interactions, item_id,
+        user_dict, item_dict, topn, show)
+        Return the precomputed top users of an item, scored live for items
+        missing from the table.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from yelpify.id_encoding import IdEncoder
+from yelpify.interactions import as_interaction_store
+from yelpify.ranking import batch_top_k, DEFAULT_BLOCK_SIZE
+from yelpify.recommend_known import recommend_known_item
+
+_MANIFEST_FILE = 'manifest.json'
+DEFAULT_USER_BLOCK_SIZE = 65536
+
+
+def _write_table(path, rank_block, n_rows, topn, row_ids, column_ids,
+                 manifest, block_size, n_jobs):
+    """ Write a table of the topn columns of every row.
+
+    Blocks of block_size rows are ranked by rank_block(start, end) in
+    n_jobs threads and written into memory-mapped files as soon as they
+    are ranked, so memory is bound by n_jobs blocks whatever the number of
+    rows. The files are written under temporary names and renamed once
+    complete, the manifest last.
+    """
+    os.makedirs(path, exist_ok=True)
+    tmp = '.%d.tmp' % os.getpid()
+    indexes = np.lib.format.open_memmap(
+        os.path.join(path, 'indexes.npy' + tmp), mode='w+', dtype=np.int32,
+        shape=(n_rows, topn))
+    scores = np.lib.format.open_memmap(
+        os.path.join(path, 'scores.npy' + tmp), mode='w+',
+        dtype=np.float32, shape=(n_rows, topn))
+
+    def run(start):
+        end = min(start + block_size, n_rows)
+        indexes[start:end], scores[start:end] = rank_block(start, end)
+
+    try:
+        with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count()) as pool:
+            list(pool.map(run, range(0, n_rows, block_size)))
+        indexes.flush()
+        scores.flush()
+        pd.DataFrame({'id': row_ids}).to_parquet(
+            os.path.join(path, 'rows.parquet' + tmp), index=False)
+        pd.DataFrame({'id': column_ids}).to_parquet(
+            os.path.join(path, 'columns.parquet' + tmp), index=False)
+        with open(os.path.join(path, _MANIFEST_FILE + tmp), 'w') as f:
+            json.dump(dict(manifest, topn=topn), f)
+        for name in ['indexes.npy', 'scores.npy', 'rows.parquet',
+                     'columns.parquet', _MANIFEST_FILE]:
+            os.replace(os.path.join(path, name + tmp),
+                       os.path.join(path, name))
+    except BaseException:
+        for name in os.listdir(path):
+            if name.endswith(tmp):
+                os.remove(os.path.join(path, name))
+        raise
+    print('Saved recommendation table {}'.format(path))
+    return RecommendationTable(path)
+
+
+def build_recommendation_table(model, interactions, path, topn,
+                               new_only=False, threshold=3,
+                               exclude_seen=False,
+                               block_size=DEFAULT_BLOCK_SIZE, n_jobs=None):
+    """ Precompute the top N items of every user into a table directory.
+
+    Users are scored block by block, as recommend_known_users_batch does,
+    by n_jobs threads, and each block is streamed to disk once ranked.
+
+    Args:
+        model: trained collaborative model, or the ScoringEngine of a
+            collaborative or hybrid model
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        path: the table directory
+        topn: Number of recommendations kept per user
+        new_only: whether to only recommend items that users have not visited
+        threshold: value above which the rating is
+            favorable in interaction matrix
+        exclude_seen: whether to exclude every item the users interacted
+            with, whatever the rating
+        block_size: number of users scored at once
+        n_jobs: number of threads, one per cpu when None
+
+    Returns:
+        The RecommendationTable.
+    """
+    interactions = as_interaction_store(interactions)
+    n_users, n_items = interactions.shape
+    topn = min(topn, n_items)
+    print('Precomputing {} recommendations for {} users...'.format(
+        topn, n_users))
+    user_biases, user_embeddings = model.get_user_representations()
+    item_biases, item_embeddings = model.get_item_representations()
+    item_embeddings = np.ascontiguousarray(item_embeddings)
+
+    def rank_block(start, end):
+        user_xs = np.arange(start, end)
+        exclude = None
+        if exclude_seen:
+            exclude = interactions.exclusion_matrix(user_xs)
+        elif new_only:
+            exclude = interactions.exclusion_matrix(user_xs, threshold)
+        return batch_top_k(user_biases[start:end], user_embeddings[start:end],
+                           item_biases, item_embeddings, topn, exclude,
+                           block_size)
+
+    manifest = {'rows': 'users', 'new_only': new_only,
+                'threshold': threshold, 'exclude_seen': exclude_seen}
+    return _write_table(path, rank_block, n_users, topn,
+                        interactions.users.ids, interactions.items.ids,
+                        manifest, block_size, n_jobs)
+
+
+def build_item_user_table(model, interactions, path, topn,
+                          block_size=DEFAULT_BLOCK_SIZE,
+                          user_block_size=DEFAULT_USER_BLOCK_SIZE,
+                          n_jobs=None):
+    """ Precompute the top N users of every item into a table directory.
+
+    Blocks of items are scored against blocks of user_block_size users,
+    and the best users of each user block are merged into the running
+    ranking of every item, so memory is bound by block_size times
+    user_block_size even with millions of users.
+
+    Args:
+        model: trained collaborative model, or the ScoringEngine of a
+            collaborative or hybrid model
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        path: the table directory
+        topn: Number of users kept per item
+        block_size: number of items scored at once
+        user_block_size: number of users scored at once
+        n_jobs: number of threads, one per cpu when None
+
+    Returns:
+        The RecommendationTable, whose rows are items.
+    """
+    interactions = as_interaction_store(interactions)
+    n_users, n_items = interactions.shape
+    topn = min(topn, n_users)
+    print('Precomputing {} users for {} items...'.format(topn, n_items))
+    user_biases, user_embeddings = model.get_user_representations()
+    item_biases, item_embeddings = model.get_item_representations()
+    user_embeddings = np.ascontiguousarray(user_embeddings)
+
+    def rank_block(start, end):
+        return batch_top_k(item_biases[start:end], item_embeddings[start:end],
+                           user_biases, user_embeddings, topn,
+                           block_size=block_size,
+                           target_block_size=user_block_size)
+
+    return _write_table(path, rank_block, n_items, topn,
+                        interactions.items.ids, interactions.users.ids,
+                        {'rows': 'items'}, block_size, n_jobs)
+
+
+class RecommendationTable:
+    """ Top N columns of every row, the items of users or the users of
+    items, read from a table directory.
+
+    The (n_rows, topn) arrays of column indexes and scores are
+    memory-mapped, so loading only reads the id tables, and a lookup is a
+    hash of the row id followed by one row read.
+
+    Args:
+        path: the table directory.
+        mmap_mode: mode of numpy.load for the arrays.
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+        with open(os.path.join(path, _MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.path = path
+        self.topn = self.manifest['topn']
+        self.indexes = np.load(os.path.join(path, 'indexes.npy'),
+                               mmap_mode=mmap_mode)
+        self.scores = np.load(os.path.join(path, 'scores.npy'),
+                              mmap_mode=mmap_mode)
+        self.row_dict = IdEncoder(pd.read_parquet(
+            os.path.join(path, 'rows.parquet'))['id'])
+        self.column_ids = pd.read_parquet(
+            os.path.join(path, 'columns.parquet'))['id'].values
+
+    def __contains__(self, row_id):
+        return row_id in self.row_dict
+
+    def lookup(self, row_id, topn=None):
+        """ Return the precomputed columns of a row.
+        Args:
+            row_id: the user id, or the item id of an item table.
+            topn: number of columns, all of them when None.
+        Returns:
+            ids: the column ids, best first.
+            scores: their scores.
+        Raises:
+            KeyError: if the row is not in the table.
+        """
+        row_x = self.row_dict[row_id]
+        indexes = self.indexes[row_x, :topn]
+        kept = indexes >= 0
+        return (self.column_ids[indexes[kept]],
+                np.asarray(self.scores[row_x, :topn][kept]))
+
+
+def _check_rows(table, rows):
+    """ Raise ValueError unless the rows of the table are of kind rows,
+    'users' or 'items'.
+    """
+    if table.manifest['rows'] != rows:
+        raise ValueError(
+            'Recommendation table {} has {} as rows, expected {}'.format(
+                table.path, table.manifest['rows'], rows))
+
+
+def recommend_precomputed_user(table, user_id, item_dict, topn=None,
+                               show=True):
+    """Function to serve the recommendations of a user from a
+        RecommendationTable
+
+    Args:
+        table: RecommendationTable built by build_recommendation_table
+        user_id: user ID for which we need to generate recommendation
+        item_dict: Dictionary type input containing item_id as key and
+            item_name as value
+        topn: Number of output recommendation needed, at most the topn of
+            the table
+        show: whether to show the result of function
+
+    Returns:
+        item_list: List of recommended items
+
+    Raises:
+        ValueError: if the table holds the users of items
+
+    """
+    _check_rows(table, 'users')
+    item_ids, _ = table.lookup(user_id, topn)
+    item_list = list(item_ids)
+    if show is True:
+        print("Recommended Items:")
+        counter = 1
+        for i in item_list:
+            print(str(counter) + '- ' + str(item_dict[i]))
+            counter += 1
+    return item_list
+
+
+def recommend_precomputed_item(table, model, interactions, item_id,
+                               user_dict, item_dict, topn, show=True):
+    """Function to serve the top N interested users of an item from a
+        table built by build_item_user_table, scoring every user as
+        recommend_known_item does for items added after the build
+
+    Args:
+        table: RecommendationTable of items
+        model: trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        item_id: item ID for which we need to generate recommended users
+        user_dict: Dictionary type input containing user_id as
+            key and interaction_index as value
+        item_dict: Dictionary type input containing item_id as
+            key and item_name as value
+        topn: Number of users needed as an output
+        show: whether to show the result of function
+
+    Returns:
+        user_list: List of recommended users
+
+    Raises:
+        ValueError: if the table holds the items of users
+
+    """
+    _check_rows(table, 'items')
+    if item_id not in table or topn > table.topn:
+        return recommend_known_item(model, interactions, item_id,
+                                    user_dict, item_dict, topn, show)
+    user_ids, _ = table.lookup(item_id, topn)
+    user_list = list(user_ids)
+    if show is True:
+        print("Recommended Users:")
+        counter = 1
+        for i in user_list:
+            print(str(counter) + '- ' + str(i))
+            counter += 1
+    return user_list
@@ -0,0 +1,211 @@
+"""
+NAME
+    result_cache
+DESCRIPTION
+    This module provides an in-process cache of the results of the
+        recommend_* functions, for the repeated requests of a serving
+        process.
+CLASSES
+    RecommendationCache(max_entries, max_bytes, ttl, clock)
+        LRU and TTL cache of recommendation lists of one model.
+FUNCTIONS
+    model_version(model)
+        Return the version a model is cached under.
+
+    mark_updated(model)
+        Record that a model was updated in place.
+"""
+
+import functools
+import inspect
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 3600
+
+# arguments that are the model and its lookup tables, or only change
+# what is printed, rather than which recommendations are returned; the
+# key records whether an index was given, as its results are approximate
+_CONTEXT_ARGS = frozenset(['model', 'df', 'interactions', 'user_dict',
+                           'item_dict', 'show', 'index'])
+_UPDATES = 'n_updates'
+
+
+def model_version(model):
+    """ Return the version of a model: the directory of the artifact
+    version of the models and engines of an Artifact, the identity of the
+    object otherwise, with the number of in-place updates of the model.
+    """
+    version = getattr(model, 'version', None)
+    if version is None:
+        version = ('id', id(model))
+    return version, getattr(model, _UPDATES, 0)
+
+
+def mark_updated(model):
+    """ Count an in-place update of a model, such as the epochs of
+    training.fit_model or the new users and items of
+    incremental.grow_model, so that its cached results are dropped.
+    Args:
+        model: the updated model.
+    """
+    setattr(model, _UPDATES, getattr(model, _UPDATES, 0) + 1)
+
+
+def _freeze(value):
+    """ Return a hashable equivalent of an argument. """
+    if isinstance(value, np.ndarray):
+        return (value.dtype.str, value.shape, value.tobytes())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    hash(value)
+    return value
+
+
+def _size(key, value):
+    """ Return an estimate of the bytes held by an entry. """
+    return (sys.getsizeof(key) + sum(sys.getsizeof(k) for k in key)
+            + sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value))
+
+
+class RecommendationCache:
+    """ Cache of the lists returned by the recommend_* functions.
+
+    Entries are keyed on the function and its arguments, such as the id,
+    topn, new_only and threshold, and evicted least recently used first
+    once there are more than max_entries of them or they hold more than
+    max_bytes, or when they are older than ttl seconds. A cache serves one
+    model at a time: calling it with another model version, such as the
+    engine of a newly loaded artifact, drops every entry.
+
+    Args:
+        max_entries: maximum number of cached results.
+        max_bytes: maximum estimated size of the cached results.
+        ttl: seconds a result is served for, forever when None.
+        clock: function returning the current time in seconds.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES,
+                 max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.n_bytes = 0
+        self.version = None
+        self._model = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """ Return the counters of the cache as a dictionary. """
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.n_bytes,
+                    'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'invalidations': self.invalidations}
+
+    def clear(self):
+        """ Drop every entry, keeping the counters. """
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def _set_model(self, model):
+        """ Drop every entry if model is not the version being cached. """
+        version = model_version(model)
+        if version != self.version:
+            if self.version is not None:
+                self.invalidations += 1
+            self._entries.clear()
+            self.n_bytes = 0
+            self.version = version
+        # a reference keeps the identity of an unversioned model unique
+        self._model = model
+
+    def get(self, model, key):
+        """ Return the cached result of a key, None when missing. """
+        with self._lock:
+            self._set_model(model)
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None
+                                      or entry[0] > self.clock()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return None
+
+    def put(self, model, key, value):
+        """ Cache the result of a key. """
+        with self._lock:
+            self._set_model(model)
+            if key in self._entries:
+                self._pop(key)
+            expires = None if self.ttl is None else self.clock() + self.ttl
+            size = _size(key, value)
+            self._entries[key] = (expires, list(value), size)
+            self.n_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self.n_bytes > self.max_bytes):
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _pop(self, key):
+        self.n_bytes -= self._entries.pop(key)[2]
+
+    def wrap(self, func):
+        """ Return a cached version of a recommend_* function.
+
+        The cached function has the signature of func; results are
+        computed with show=False and returned without being printed.
+        Calls whose arguments cannot be hashed are not cached.
+
+        Args:
+            func: recommend_known_user, recommend_known_item or one of
+                the recommend_hybrid functions.
+        Returns:
+            The cached function.
+        """
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def cached(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.arguments['show'] = False
+            bound.apply_defaults()
+            try:
+                key = (func.__name__,) + tuple(
+                    _freeze(value) for name, value in bound.arguments.items()
+                    if name not in _CONTEXT_ARGS)
+                if 'index' in bound.arguments:
+                    key += (bound.arguments['index'] is not None,)
+            except TypeError:
+                return func(*bound.args, **bound.kwargs)
+            model = bound.arguments['model']
+            result = self.get(model, key)
+            if result is None:
+                result = func(*bound.args, **bound.kwargs)
+                self.put(model, key, result)
+            return list(result)
+
+        cached.cache = self
+        return cached
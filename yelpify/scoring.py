@@ -0,0 +1,258 @@
+"""
+NAME
+    scoring
+DESCRIPTION
+    This module provides the scoring of users and items from precomputed
+        model representations, without calling LightFM.predict.
+CLASSES
+    ScoringEngine(user_biases, user_embeddings, item_biases,
+        item_embeddings)
+        Float32 user and item representations of a trained model.
+FUNCTIONS
+    score_items(model, user_x, n_items, user_features, item_features)
+        Return the scores of every item for a user.
+
+    score_users(model, item_x, n_users, user_features, item_features)
+        Return the scores of every user for an item.
+"""
+
+import numpy as np
+from scipy import sparse
+
+
+def _representations(biases, embeddings, features):
+    """ Combine feature biases and embeddings as lightfm does in
+    get_user_representations and get_item_representations.
+    """
+    if features is None:
+        return biases, embeddings
+    features = sparse.csr_matrix(features, dtype=np.float32)
+    return features @ biases, features @ embeddings
+
+
+def _new_representations(biases, embeddings, features):
+    """ Return the representations of rows of features, zero padded to
+    the number of feature embeddings.
+    """
+    if embeddings is None:
+        raise ValueError('The engine has no feature embeddings, build it '
+                         'with from_arrays or from_model')
+    features = sparse.csr_matrix(features, dtype=np.float32)
+    if features.shape[1] > len(embeddings):
+        raise ValueError('Expected at most {} features, got {}'.format(
+            len(embeddings), features.shape[1]))
+    features.resize(features.shape[0], len(embeddings))
+    return _representations(biases, embeddings, features)
+
+
+class ScoringEngine:
+    """ User and item representations of a trained model.
+
+    The representations are extracted once, as contiguous float32 arrays,
+    so that scoring a user against every item is one matrix-vector product
+    plus the biases instead of a predict call that derives every
+    representation again. Only NumPy is needed to score, so a serving
+    process can use an engine without importing lightfm.
+
+    Scores are those of predict up to float32 rounding: lightfm is built
+    with -ffast-math, which leaves the order of its sums to the compiler,
+    so rankings can only differ between items whose scores are within
+    rounding of each other.
+
+    Engines built from the parameters of a model also keep the feature
+    embeddings, to represent users and items that are unknown to the model
+    from their features only.
+
+    Args:
+        user_biases: (n_users,) user biases.
+        user_embeddings: (n_users, no_components) user embeddings.
+        item_biases: (n_items,) item biases.
+        item_embeddings: (n_items, no_components) item embeddings.
+    """
+
+    def __init__(self, user_biases, user_embeddings, item_biases,
+                 item_embeddings):
+        self.user_biases = np.ascontiguousarray(user_biases,
+                                                dtype=np.float32)
+        self.user_embeddings = np.ascontiguousarray(user_embeddings,
+                                                    dtype=np.float32)
+        self.item_biases = np.ascontiguousarray(item_biases,
+                                                dtype=np.float32)
+        self.item_embeddings = np.ascontiguousarray(item_embeddings,
+                                                    dtype=np.float32)
+        # the directory of its artifact version, see artifact.Artifact
+        self.version = None
+        # parameters of the features, to represent users and items unknown
+        # to the model; set by from_arrays
+        self.user_feature_biases = self.user_feature_embeddings = None
+        self.item_feature_biases = self.item_feature_embeddings = None
+
+    @classmethod
+    def from_arrays(cls, user_biases, user_embeddings, item_biases,
+                    item_embeddings, user_features=None, item_features=None):
+        """ Build the engine from the parameters of a model.
+        Args:
+            user_biases: biases of the user features.
+            user_embeddings: embeddings of the user features.
+            item_biases: biases of the item features.
+            item_embeddings: embeddings of the item features.
+            user_features: user feature matrix, identity when None.
+            item_features: item feature matrix, identity when None.
+        Returns:
+            The ScoringEngine.
+        """
+        engine = cls(*(_representations(user_biases, user_embeddings,
+                                        user_features)
+                       + _representations(item_biases, item_embeddings,
+                                          item_features)))
+        engine.user_feature_biases = user_biases
+        engine.user_feature_embeddings = user_embeddings
+        engine.item_feature_biases = item_biases
+        engine.item_feature_embeddings = item_embeddings
+        return engine
+
+    @classmethod
+    def from_model(cls, model, feature_store=None):
+        """ Build the engine of a trained LightFM model.
+        Args:
+            model: the trained model.
+            feature_store: FeatureStore of a hybrid model.
+        Returns:
+            The ScoringEngine.
+        """
+        user_features = item_features = None
+        if feature_store is not None:
+            user_features = feature_store.user_features
+            item_features = feature_store.item_features
+        return cls.from_arrays(
+            model.user_biases, model.user_embeddings, model.item_biases,
+            model.item_embeddings, user_features, item_features)
+
+    @property
+    def n_users(self):
+        return len(self.user_biases)
+
+    @property
+    def n_items(self):
+        return len(self.item_biases)
+
+    def get_user_representations(self):
+        """ Return the user biases and embeddings, as the LightFM method of
+        the same name does without features.
+        """
+        return self.user_biases, self.user_embeddings
+
+    def get_item_representations(self):
+        """ Return the item biases and embeddings, as the LightFM method of
+        the same name does without features.
+        """
+        return self.item_biases, self.item_embeddings
+
+    def new_user_representations(self, user_features):
+        """ Return the representations of users unknown to the model, as
+        get_user_representations does for known ones: one sparse by dense
+        product of their features and the feature embeddings.
+        Args:
+            user_features: (n, n_user_features) feature matrix, such as
+                FeatureStore.new_user_features returns; narrower matrices
+                are zero padded.
+        Returns:
+            biases: (n,) float32 biases.
+            embeddings: (n, no_components) float32 embeddings.
+        Raises:
+            ValueError: if the engine was not built from model parameters.
+        """
+        return _new_representations(self.user_feature_biases,
+                                    self.user_feature_embeddings,
+                                    user_features)
+
+    def new_item_representations(self, item_features):
+        """ Return the representations of items unknown to the model, see
+        new_user_representations.
+        """
+        return _new_representations(self.item_feature_biases,
+                                    self.item_feature_embeddings,
+                                    item_features)
+
+    def user_scores(self, user_x):
+        """ Return the scores of every item for a user.
+        Args:
+            user_x: row index of the user.
+        Returns:
+            The float32 scores, by item index.
+        """
+        scores = self.item_embeddings @ self.user_embeddings[user_x]
+        scores += self.item_biases
+        scores += self.user_biases[user_x]
+        return scores
+
+    def item_scores(self, item_x):
+        """ Return the scores of every user for an item.
+        Args:
+            item_x: column index of the item.
+        Returns:
+            The float32 scores, by user index.
+        """
+        scores = self.user_embeddings @ self.item_embeddings[item_x]
+        scores += self.user_biases
+        scores += self.item_biases[item_x]
+        return scores
+
+    def predict(self, user_ids, item_ids):
+        """ Return the scores of user-item pairs, as LightFM.predict does.
+        Args:
+            user_ids: user index, or array of user indexes.
+            item_ids: array of item indexes.
+        Returns:
+            The float32 scores of the pairs.
+        """
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        user_ids = np.broadcast_to(np.asarray(user_ids, dtype=np.int64),
+                                   item_ids.shape)
+        scores = np.einsum('ij,ij->i', self.user_embeddings[user_ids],
+                           self.item_embeddings[item_ids])
+        return (scores + self.user_biases[user_ids]
+                + self.item_biases[item_ids]).astype(np.float32)
+
+
+def score_items(model, user_x, n_items, user_features=None,
+                item_features=None):
+    """ Score every item for a user with an engine, or with predict.
+    Args:
+        model: ScoringEngine or trained LightFM model.
+        user_x: row index of the user.
+        n_items: number of items.
+        user_features: user feature matrix of a LightFM model.
+        item_features: item feature matrix of a LightFM model.
+    Returns:
+        The scores, by item index.
+    """
+    if isinstance(model, ScoringEngine):
+        return model.user_scores(user_x)
+    if user_features is None and item_features is None:
+        return model.predict(user_x, np.arange(n_items))
+    return model.predict(user_x, np.arange(n_items),
+                         user_features=user_features,
+                         item_features=item_features)
+
+
+def score_users(model, item_x, n_users, user_features=None,
+                item_features=None):
+    """ Score every user for an item with an engine, or with predict.
+    Args:
+        model: ScoringEngine or trained LightFM model.
+        item_x: column index of the item.
+        n_users: number of users.
+        user_features: user feature matrix of a LightFM model.
+        item_features: item feature matrix of a LightFM model.
+    Returns:
+        The scores, by user index.
+    """
+    if isinstance(model, ScoringEngine):
+        return model.item_scores(item_x)
+    user_ids = np.arange(n_users)
+    item_ids = np.repeat(item_x, n_users)
+    if user_features is None and item_features is None:
+        return model.predict(user_ids, item_ids)
+    return model.predict(user_ids, item_ids, user_features=user_features,
+                         item_features=item_features)
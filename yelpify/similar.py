@@ -0,0 +1,189 @@
+"""
+NAME
+    similar
+DESCRIPTION
+    This module provides access to functions that find the businesses
+        most similar to a business, from the item embeddings of a trained
+        model.
+CLASSES
+    NeighbourTable(items, scores, metric)
+        Precomputed nearest neighbours of every item.
+FUNCTIONS
+    item_vectors(model, metric)
+        Return the item vectors compared by a similarity metric.
+
+    build_neighbour_table(model, n_neighbours, metric, block_size, n_jobs)
+        Return the NeighbourTable of every item of a model.
+
+    recommend_similar_items(model, interactions, item_id, item_dict, topn,
+        metric, table, show)
+        Return the items most similar to an existing item.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from yelpify.interactions import as_interaction_store
+from yelpify.ranking import top_k, rows_top_k
+
+METRICS = ('cosine', 'dot')
+DEFAULT_N_NEIGHBOURS = 20
+DEFAULT_BLOCK_SIZE = 1024
+
+
+def item_vectors(model, metric='cosine'):
+    """ Return the item embeddings compared by a metric, without biases.
+    Args:
+        model: ScoringEngine, or LightFM model without item features.
+        metric: 'cosine' to compare normalized embeddings, 'dot' to
+            compare them as they are.
+    Returns:
+        The (n_items, no_components) float32 vectors.
+    """
+    if metric not in METRICS:
+        raise ValueError("metric must be one of {}".format(METRICS))
+    _, embeddings = model.get_item_representations()
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if metric == 'cosine':
+        norms = np.linalg.norm(vectors, axis=1)
+        vectors = vectors / np.maximum(norms, 1e-12)[:, np.newaxis]
+    return np.ascontiguousarray(vectors)
+
+
+class NeighbourTable:
+    """ The n_neighbours most similar items of every item, as a compact
+    (n_items, n_neighbours) int32 table of item indexes, -1 past the last
+    neighbour, and a float16 table of similarities.
+
+    Args:
+        items: the int32 neighbour indexes, by item.
+        scores: the corresponding similarities.
+        metric: the similarity metric.
+    """
+
+    def __init__(self, items, scores, metric='cosine'):
+        self.items = items
+        self.scores = scores
+        self.metric = metric
+
+    @property
+    def n_neighbours(self):
+        return self.items.shape[1]
+
+    def lookup(self, item_x, topn=None):
+        """ Return the neighbours of an item and their similarities.
+        Args:
+            item_x: column index of the item.
+            topn: number of neighbours, all of them when None.
+        Returns:
+            items: the neighbour indexes, by descending similarity.
+            scores: their similarities.
+        """
+        items = self.items[item_x, :topn]
+        kept = items >= 0
+        return items[kept], self.scores[item_x, :topn][kept]
+
+    def save(self, path):
+        """ Write the table into a directory. """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'neighbour_items.npy'), self.items)
+        np.save(os.path.join(path, 'neighbour_scores.npy'), self.scores)
+        with open(os.path.join(path, 'neighbour_metric'), 'w') as f:
+            f.write(self.metric)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """ Read a table written by save, memory-mapped by default. """
+        with open(os.path.join(path, 'neighbour_metric')) as f:
+            metric = f.read().strip()
+        return cls(np.load(os.path.join(path, 'neighbour_items.npy'),
+                           mmap_mode=mmap_mode),
+                   np.load(os.path.join(path, 'neighbour_scores.npy'),
+                           mmap_mode=mmap_mode),
+                   metric)
+
+
+def build_neighbour_table(model, n_neighbours=DEFAULT_N_NEIGHBOURS,
+                          metric='cosine', block_size=DEFAULT_BLOCK_SIZE,
+                          n_jobs=None):
+    """ Precompute the nearest neighbours of every item.
+
+    Items are compared block by block with one matrix product per block,
+    so memory is bound by block_size times the number of items; blocks are
+    processed by n_jobs threads, as NumPy releases the GIL while
+    multiplying and selecting.
+
+    Args:
+        model: ScoringEngine, or LightFM model without item features.
+        n_neighbours: number of neighbours kept per item.
+        metric: 'cosine' or 'dot'.
+        block_size: number of items compared at once.
+        n_jobs: number of threads, one per cpu when None.
+    Returns:
+        The NeighbourTable.
+    """
+    print('Building the {} nearest items of every item...'.format(
+        n_neighbours))
+    vectors = item_vectors(model, metric)
+    n_items = len(vectors)
+    k = min(n_neighbours, n_items - 1)
+    items = np.full((n_items, n_neighbours), -1, dtype=np.int32)
+    scores = np.zeros((n_items, n_neighbours), dtype=np.float16)
+    vectors_t = np.ascontiguousarray(vectors.T)
+
+    def run(start):
+        end = min(start + block_size, n_items)
+        block = vectors[start:end] @ vectors_t
+        # an item is not its own neighbour
+        block[np.arange(end - start), np.arange(start, end)] = -np.inf
+        items[start:end, :k], values = rows_top_k(block, k)
+        scores[start:end, :k] = values
+
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count()) as pool:
+        list(pool.map(run, range(0, n_items, block_size)))
+    return NeighbourTable(items, scores, metric)
+
+
+def recommend_similar_items(model, interactions, item_id, item_dict, topn,
+                            metric='cosine', table=None, show=True):
+    """Function to produce a list of the top N items most similar to a
+        given item, such as the businesses like a business
+
+    Args:
+        model: trained matrix factorization model, or its ScoringEngine
+        interactions: InteractionStore (or dense dataframe) of the
+            interactions used for training the model
+        item_id: item ID for which we need to find similar items
+        item_dict: Dictionary type input containing item_id as key and
+            item_name as value
+        topn: Number of similar items needed as an output
+        metric: 'cosine' or 'dot' similarity of the item embeddings
+        table: NeighbourTable of the model, to look the neighbours up
+            instead of comparing the item to every item
+        show: whether to show the result of function
+
+    Returns:
+        item_list: List of similar items
+
+    """
+    print('Finding items similar to item {}...'.format(item_id))
+    interactions = as_interaction_store(interactions)
+    item_x = interactions.items[item_id]
+    if table is not None and topn <= table.n_neighbours:
+        item_xs, _ = table.lookup(item_x, topn)
+    else:
+        vectors = item_vectors(model, metric)
+        scores = vectors @ vectors[item_x]
+        exclude = np.zeros(len(scores), dtype=bool)
+        exclude[item_x] = True
+        item_xs = top_k(scores, topn, exclude)
+    item_list = list(interactions.columns[item_xs])
+    if show is True:
+        print("Similar Items:")
+        counter = 1
+        for i in item_list:
+            print(str(counter) + '- ' + str(item_dict[i]))
+            counter += 1
+    return item_list
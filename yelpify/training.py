@@ -0,0 +1,336 @@
+"""
+NAME
+    training
+DESCRIPTION
+    This module provides access to functions that run the training epochs
+        of a model, from scratch or from the parameters it already has.
+FUNCTIONS
+    split_interactions(interactions, weights, validation_size, random_state)
+        Return the training and validation parts of interaction matrices.
+
+    sample_users(interactions, n_users, random_state)
+        Return the interactions of a sample of their users.
+
+    fit_model(model, interactions, weights, epochs, patience,
+        validation_size, validation, user_features, item_features,
+        num_threads, random_state, validation_users, metric, k,
+        restore_best, refit_epochs)
+        Train a model, stopping early when the validation metric stalls.
+
+    split_reviews(user_codes, item_codes, shape, test_size, stratify,
+        random_state)
+        Return the training and testing reviews of a split by user-item
+        pair.
+
+    evaluate_and_fit(model, user_codes, item_codes, ratings, shape,
+        aggregate, epochs, patience, refit_epochs, test_size, stratify,
+        user_features, item_features, num_threads, random_state, k,
+        evaluation_users, validation_size, interactions, weights)
+        Train and evaluate a model on a split of the reviews, then refit it
+        on every review.
+"""
+
+import numpy as np
+from scipy import sparse
+from sklearn.model_selection import train_test_split
+
+from yelpify.evaluation import METRICS, DEFAULT_K, evaluate, user_metrics
+from yelpify.interactions import build_interactions
+from yelpify.result_cache import mark_updated
+
+DEFAULT_EPOCHS = 10
+DEFAULT_REFIT_EPOCHS = 2
+DEFAULT_TEST_SIZE = 0.2
+DEFAULT_VALIDATION_SIZE = 0.1
+DEFAULT_VALIDATION_USERS = 1000
+_PARAMETERS = ['%s_%s' % (side, name) for side in ('user', 'item')
+               for name in ('embeddings', 'embedding_gradients',
+                            'embedding_momentum', 'biases', 'bias_gradients',
+                            'bias_momentum')]
+
+
+def split_interactions(interactions, weights, validation_size,
+                       random_state=None):
+    """ Split the entries of interaction matrices at random.
+    Args:
+        interactions: COO matrix of the interactions.
+        weights: COO matrix of their weights, with the same entries.
+        validation_size: fraction of the entries held out.
+        random_state: seed of the split.
+    Returns:
+        train_interactions, train_weights, validation_interactions as COO
+        matrices of the same shape.
+    """
+    interactions = sparse.coo_matrix(interactions)
+    weights = sparse.coo_matrix(weights)
+    rng = np.random.RandomState(random_state)
+    held_out = rng.rand(interactions.nnz) < validation_size
+
+    def part(matrix, mask):
+        return sparse.coo_matrix(
+            (matrix.data[mask], (matrix.row[mask], matrix.col[mask])),
+            shape=matrix.shape)
+
+    return (part(interactions, ~held_out), part(weights, ~held_out),
+            part(interactions, held_out))
+
+
+def sample_users(interactions, n_users, random_state=None):
+    """ Keep the interactions of a uniform sample of their users.
+    Args:
+        interactions: COO matrix of the interactions.
+        n_users: number of users kept, every user when None or when there
+            are fewer users with interactions.
+        random_state: seed of the sample.
+    Returns:
+        The COO matrix of the interactions of the sampled users, of the
+        same shape.
+    """
+    interactions = sparse.coo_matrix(interactions)
+    users = np.unique(interactions.row)
+    if n_users is None or len(users) <= n_users:
+        return interactions
+    rng = np.random.RandomState(random_state)
+    kept = np.isin(interactions.row,
+                   rng.choice(users, n_users, replace=False))
+    return sparse.coo_matrix(
+        (interactions.data[kept],
+         (interactions.row[kept], interactions.col[kept])),
+        shape=interactions.shape)
+
+
+def _parameters(model):
+    """ Return a copy of the parameters of a LightFM model. """
+    return {name: getattr(model, name).copy() for name in _PARAMETERS}
+
+
+def fit_model(model, interactions, weights, epochs=DEFAULT_EPOCHS,
+              patience=None, validation_size=DEFAULT_VALIDATION_SIZE,
+              validation=None, user_features=None, item_features=None,
+              num_threads=10, random_state=None,
+              validation_users=DEFAULT_VALIDATION_USERS, metric='auc',
+              k=DEFAULT_K, restore_best=True,
+              refit_epochs=DEFAULT_REFIT_EPOCHS):
+    """ Train a model epoch by epoch with fit_partial, so that a model whose
+    parameters were set beforehand, such as by
+    incremental.warm_start_model, starts from them; a new model is trained
+    as fit would train it.
+
+    With a validation set, its metric is reported after every epoch. With
+    patience, training stops once that metric has not improved for
+    patience epochs; without a validation set, validation_size of the
+    interactions are then held out as one, and the model is refit on every
+    interaction for refit_epochs once stopped, so that the held-out part is
+    trained on too. The metric is computed on a sample of validation_users
+    users only, so that it stays cheap next to an epoch, and the parameters
+    of the best epoch are restored at the end, before that refit.
+
+    Args:
+        model: the LightFM model.
+        interactions: COO matrix of the interactions.
+        weights: COO matrix of their weights.
+        epochs: maximum number of epochs.
+        patience: number of epochs without improvement before stopping,
+            None to run every epoch.
+        validation_size: fraction of the interactions held out to measure
+            the improvement when there is no validation set.
+        validation: COO matrix of validation interactions, disjoint from
+            interactions.
+        user_features: user feature matrix of a hybrid model.
+        item_features: item feature matrix of a hybrid model.
+        num_threads: number of lightfm threads.
+        random_state: seed of the validation split and user sample.
+        validation_users: number of validation users the metric is
+            computed on, None for every user.
+        metric: one of evaluation.METRICS.
+        k: cutoff of the precision, recall and NDCG.
+        restore_best: if the parameters of the best epoch are restored.
+        refit_epochs: number of epochs on every interaction after stopping,
+            when the validation set was held out from them.
+    Returns:
+        The validation metric of every epoch run, empty without validation
+        set nor patience.
+    Raises:
+        ValueError: if the metric is unknown.
+    """
+    if metric not in METRICS:
+        raise ValueError('Unknown metric {!r}, expected one of {}'.format(
+            metric, METRICS))
+    if patience is None and validation is None:
+        model.fit_partial(interactions, user_features=user_features,
+                          item_features=item_features, sample_weight=weights,
+                          epochs=epochs, num_threads=num_threads)
+        mark_updated(model)
+        return []
+    held_out = validation is None
+    if held_out:
+        train, train_weights, validation = split_interactions(
+            interactions, weights, validation_size, random_state)
+    else:
+        train, train_weights = interactions, weights
+    validation = sample_users(validation, validation_users, random_state)
+    seen = sparse.csr_matrix(train)
+    label = metric.upper() if metric in ('auc', 'map') else \
+        '{}@{}'.format(metric, k)
+    history = []
+    best = -np.inf
+    best_parameters = None
+    stalled = 0
+    for epoch in range(epochs):
+        model.fit_partial(train, user_features=user_features,
+                          item_features=item_features,
+                          sample_weight=train_weights, epochs=1,
+                          num_threads=num_threads)
+        score = user_metrics(
+            model, validation, seen, k, user_features=user_features,
+            item_features=item_features)[metric].mean()
+        history.append(score)
+        print('Epoch {}: validation {} {:.4f}'.format(
+            epoch + 1, label, score))
+        if score > best:
+            best = score
+            stalled = 0
+            if restore_best and epoch + 1 < epochs:
+                best_parameters = _parameters(model)
+            else:
+                best_parameters = None
+        else:
+            stalled += 1
+            if patience is not None and stalled >= patience:
+                print('Stopping after {} epochs'.format(epoch + 1))
+                break
+    if best_parameters is not None:
+        print('Restoring the parameters of epoch {}'.format(
+            int(np.argmax(history)) + 1))
+        for name, values in best_parameters.items():
+            setattr(model, name, values)
+    if held_out and refit_epochs:
+        print('Refitting model on the held-out interactions too...')
+        model.fit_partial(interactions, user_features=user_features,
+                          item_features=item_features, sample_weight=weights,
+                          epochs=refit_epochs, num_threads=num_threads)
+    mark_updated(model)
+    return history
+
+
+def split_reviews(user_codes, item_codes, shape,
+                  test_size=DEFAULT_TEST_SIZE, stratify=None,
+                  random_state=None):
+    """ Split reviews into a training and a testing set, keeping every
+    review of a user-item pair in the same set, so that no interaction is
+    both trained on and tested.
+    Args:
+        user_codes: the user code of every review.
+        item_codes: the item code of every review.
+        shape: (number of users, number of items).
+        test_size: fraction of the user-item pairs in the testing set.
+        stratify: array of every review the split is stratified by, the
+            value of the first review of a pair is used.
+        random_state: seed of the split.
+    Returns:
+        The indexes of the training and testing reviews.
+    """
+    pairs, first, pair_x = np.unique(
+        np.asarray(user_codes, dtype=np.int64) * shape[1]
+        + np.asarray(item_codes, dtype=np.int64),
+        return_index=True, return_inverse=True)
+    if stratify is not None:
+        stratify = np.asarray(stratify)[first]
+    train_pairs, _ = train_test_split(
+        np.arange(len(pairs)), test_size=test_size, stratify=stratify,
+        random_state=random_state)
+    in_train = np.zeros(len(pairs), dtype=bool)
+    in_train[train_pairs] = True
+    in_train = in_train[pair_x.ravel()]
+    return np.flatnonzero(in_train), np.flatnonzero(~in_train)
+
+
+def evaluate_and_fit(model, user_codes, item_codes, ratings, shape,
+                     aggregate=None, epochs=DEFAULT_EPOCHS, patience=None,
+                     refit_epochs=DEFAULT_REFIT_EPOCHS,
+                     test_size=DEFAULT_TEST_SIZE, stratify=None,
+                     user_features=None, item_features=None, num_threads=10,
+                     random_state=None, k=DEFAULT_K, evaluation_users=None,
+                     validation_size=DEFAULT_VALIDATION_SIZE,
+                     interactions=None, weights=None):
+    """ Evaluate and train a model in a single pass.
+
+    The reviews are split into a training and a testing set over the codes
+    and features of the whole dataframe, see split_reviews, the model is
+    trained on the training set, and the same model is then refit on every
+    review for refit_epochs, instead of training a second model from
+    scratch. With patience, early stopping and the restored epoch are
+    decided on validation_size of the training set, see fit_model, so the
+    testing set is only used to report the metrics of the trained model.
+    The model so ends with epochs on the training set then refit_epochs
+    on every review, not epochs on every review.
+
+    Args:
+        model: the LightFM model.
+        user_codes: the user code of every review.
+        item_codes: the item code of every review.
+        ratings: the weight of every review.
+        shape: (number of users, number of items).
+        aggregate: how to reduce repeated user-item ratings, see
+            interactions.build_interactions.
+        epochs: maximum number of epochs on the training set.
+        patience: number of epochs without validation AUC improvement
+            before stopping early.
+        refit_epochs: number of epochs on every review after the
+            evaluation, 0 to keep the model of the training set.
+        test_size: fraction of the reviews in the testing set.
+        stratify: array the split is stratified by.
+        user_features: user feature matrix of a hybrid model.
+        item_features: item feature matrix of a hybrid model.
+        num_threads: number of lightfm threads.
+        random_state: seed of the split and user samples.
+        k: cutoff of the testing precision, recall and NDCG.
+        evaluation_users: number of users sampled to measure the trained
+            model, every user when None.
+        validation_size: fraction of the training interactions held out
+            for early stopping.
+        interactions: COO matrix of the interactions of every review, as
+            already built by the caller, built from the codes when None.
+        weights: COO matrix of their weights.
+    Returns:
+        train_auc: training set auc score.
+        test_metrics: summary DataFrame of the testing set metrics, see
+            evaluation.summarize.
+        history: validation metric of every epoch, empty without
+            patience.
+    """
+    print('model evaluation')
+    train_x, test_x = split_reviews(user_codes, item_codes, shape,
+                                    test_size, stratify, random_state)
+    train, train_weights = build_interactions(
+        user_codes[train_x], item_codes[train_x], ratings[train_x], shape,
+        aggregate)
+    test, _ = build_interactions(
+        user_codes[test_x], item_codes[test_x], ratings[test_x], shape,
+        aggregate)
+    history = fit_model(model, train, train_weights, epochs=epochs,
+                        patience=patience, validation_size=validation_size,
+                        user_features=user_features,
+                        item_features=item_features,
+                        num_threads=num_threads, random_state=random_state)
+    train_auc = evaluate(
+        model, train, k=k, n_users=evaluation_users,
+        random_state=random_state, user_features=user_features,
+        item_features=item_features).loc['auc', 'mean']
+    print('Training set AUC: %s' % train_auc)
+    test_metrics = evaluate(
+        model, test, train, k=k, n_users=evaluation_users,
+        random_state=random_state, user_features=user_features,
+        item_features=item_features)
+    print('Testing set AUC: %s' % test_metrics.loc['auc', 'mean'])
+    print(test_metrics)
+    if refit_epochs:
+        print('Refitting model on every review...')
+        if interactions is None:
+            interactions, weights = build_interactions(
+                user_codes, item_codes, ratings, shape, aggregate)
+        model.fit_partial(interactions, user_features=user_features,
+                          item_features=item_features, sample_weight=weights,
+                          epochs=refit_epochs, num_threads=num_threads)
+        mark_updated(model)
+    return train_auc, test_metrics, history